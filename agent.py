@@ -1,11 +1,30 @@
+import os
+import math
+import time
 import random
+import multiprocessing
+import multiprocessing.pool
 
 from collections import Counter
 from abc import ABCMeta, abstractmethod
 
-from bugshot import BugShotAction, BugShotStateDispatcher
-from explorer import BugShotStateExplorer
-from decoder import BugShotStateDecoder, RandomBugShotStateDecoder
+from bugshot import (
+    BugShotAction,
+    BugShotPlayer,
+    BugShotState,
+    BugShotStateDispatcher,
+    DEFAULT_RNG,
+    reseed_rngs,
+    get_canonical_key,
+    get_canonical_observation_key,
+)
+from explorer import BugShotStateExplorer, CachedBugShotStateExplorer
+from decoder import BugShotStateDecoder, RandomBugShotStateDecoder, BeliefBugShotStateDecoder, BugShotChamberBelief
+from solver import BugShotGameSolver
+from table import BugShotPolicyTable
+from policy import MLPBugShotPolicy, BatchingBugShotPolicyServer
+from stats import get_wilson_interval
+from cache import BugShotRolloutCache, ACTIONS, get_observation_key
 
 class BugShotGameAgent(metaclass=ABCMeta):
     
@@ -13,6 +32,11 @@ class BugShotGameAgent(metaclass=ABCMeta):
     def act(self, observation: list[int]) -> BugShotAction:
         raise NotImplementedError()
 
+    def reset(self):
+        '''
+        Forgets what the agent kept from the current game, before a new one.
+        '''
+
 class LoopDetectingBugShotGameAgent(BugShotGameAgent):
     '''
     An agent that detects loops in its actions and avoids them.
@@ -27,6 +51,11 @@ class LoopDetectingBugShotGameAgent(BugShotGameAgent):
         self.__last_action = None
         self.__loop_actions = set()
 
+    def reset(self):
+        self.__last_observation_hash = None
+        self.__last_action = None
+        self.__loop_actions = set()
+
     def act(self, observation: list[int]) -> BugShotAction:
         observation_hash = self.__hash_observation(observation)
         if observation_hash == self.__last_observation_hash:
@@ -50,37 +79,99 @@ class RandomBugShotGameAgent(BugShotGameAgent):
     
     dispatcher: BugShotStateDispatcher
     decoder: BugShotStateDecoder
+    rng: random.Random
 
-    def __init__(self, dispatcher: BugShotStateDispatcher):
+    def __init__(self, dispatcher: BugShotStateDispatcher, rng: random.Random = None):
         self.dispatcher = dispatcher
-        self.decoder = RandomBugShotStateDecoder()
+        self.rng = DEFAULT_RNG if rng is None else rng
+        self.decoder = RandomBugShotStateDecoder(rng=self.rng)
 
     def act(self, observation: list[int]) -> BugShotAction:
         state = self.decoder.decode(observation)[0]
-        return random.choice(self.dispatcher.get_available_actions(state))
+        return self.rng.choice(self.dispatcher.get_available_actions(state))
 
 class MonteCarloBugShotGameAgent(BugShotGameAgent):
+    '''
+    Picks the action whose random rollouts from the decoded states win most often.
+
+    With a cache, the counts of every act() are added to the cache under the
+    observation, and later act() calls on the same observation, by this
+    agent or any other sharing the cache, start from them. If the explorer
+    is a CachedBugShotStateExplorer on the same cache, it already records
+    every rollout under that key, so the agent does not add them again.
+    '''
     
     num_trials: int
     dispatcher: BugShotStateDispatcher
     decoder: BugShotStateDecoder
     explorer: BugShotStateExplorer
+    rng: random.Random
+    cache: BugShotRolloutCache
 
-    def __init__(self, num_trials: int, dispatcher: BugShotStateDispatcher, decoder: BugShotStateDecoder, explorer: BugShotStateExplorer):
+    def __init__(
+            self,
+            num_trials: int,
+            dispatcher: BugShotStateDispatcher,
+            decoder: BugShotStateDecoder,
+            explorer: BugShotStateExplorer,
+            rng: random.Random = None,
+            cache: BugShotRolloutCache = None,
+        ):
         super().__init__()
         self.num_trials = num_trials
         self.dispatcher = dispatcher
         self.decoder = decoder
         self.explorer = explorer
+        self.rng = DEFAULT_RNG if rng is None else rng
+        self.cache = cache
+        self.__visit_counts = dict()
 
     def act(self, observation: list[int]) -> BugShotAction:
+        cached_win, cached_lose = self._load_cached_counts(observation)
+        count_win, count_lose = self._count_trials(observation, self.num_trials)
+        self._store_cached_counts(observation, count_win, count_lose)
+        return self._select_action(count_win + cached_win, count_lose + cached_lose)
+
+    def get_visit_counts(self) -> dict[BugShotAction, int]:
+        '''
+        Number of trials that started with every action in the last act(),
+        cached ones included.
+        '''
+
+        return dict(self.__visit_counts)
+
+    def _load_cached_counts(self, observation: list[int]) -> tuple[Counter, Counter]:
+        count_win = Counter()
+        count_lose = Counter()
+        stats = None if self.cache is None else self.cache.get(get_observation_key(observation))
+        if stats is None:
+            return count_win, count_lose
+
+        wins, visits = stats
+        for action, num_wins, num_visits in zip(ACTIONS, wins, visits):
+            if num_visits > 0:
+                count_win[action] = num_wins
+                count_lose[action] = num_visits - num_wins
+        return count_win, count_lose
+
+    def _store_cached_counts(self, observation: list[int], count_win: Counter, count_lose: Counter):
+        if self.cache is None:
+            return
+        if isinstance(self.explorer, CachedBugShotStateExplorer) and self.explorer.cache is self.cache:
+            return
+
+        wins = [count_win[action] for action in ACTIONS]
+        visits = [count_win[action] + count_lose[action] for action in ACTIONS]
+        self.cache.update(get_observation_key(observation), wins, visits)
+
+    def _count_trials(self, observation: list[int], num_trials: int) -> tuple[Counter, Counter]:
         root_states = self.decoder.decode(observation)
 
         count_win = Counter()
         count_lose = Counter()
 
-        for _ in range(self.num_trials):
-            root_state = random.choice(root_states)
+        for _ in range(num_trials):
+            root_state = self.rng.choice(root_states)
             is_win, actions = self.explorer.explore(root_state)
         
             if len(actions) == 0:
@@ -92,11 +183,515 @@ class MonteCarloBugShotGameAgent(BugShotGameAgent):
             else:
                 count_lose[action] += 1
 
+        return count_win, count_lose
+
+    def _select_action(self, count_win: Counter, count_lose: Counter, actions: list[BugShotAction] = None) -> BugShotAction:
+        '''
+        Best win ratio among actions, or among every action if not given.
+        '''
+
+        self.__visit_counts = count_win + count_lose
         win_ratios = dict()
         
-        for action in BugShotAction:
+        for action in BugShotAction if actions is None else actions:
             count_total = count_win[action] + count_lose[action]
             if count_total != 0:
                 win_ratios[action] = count_win[action] / count_total
         
         return max(win_ratios, key=win_ratios.get)
+
+class ParallelMonteCarloBugShotGameAgent(MonteCarloBugShotGameAgent):
+    '''
+    MonteCarloBugShotGameAgent that splits its trials across a process pool.
+
+    The pool is started on the first act() and kept alive until close(). Every
+    chunk of trials reseeds its worker from (seed, act count, chunk index), so
+    a sequence of act() calls is reproducible for a fixed num_workers. Every
+    random.Random held by the agent's components is reseeded as well.
+    '''
+
+    num_workers: int
+    seed: int
+
+    def __init__(
+            self,
+            num_trials: int,
+            dispatcher: BugShotStateDispatcher,
+            decoder: BugShotStateDecoder,
+            explorer: BugShotStateExplorer,
+            num_workers: int = None,
+            seed: int = 0,
+            rng: random.Random = None,
+            cache: BugShotRolloutCache = None,
+        ):
+        super().__init__(num_trials, dispatcher, decoder, explorer, rng, cache)
+        self.num_workers = num_workers or os.cpu_count()
+        self.seed = seed
+        self.__pool = None
+        self.__num_acts = 0
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        pool = self.__get_pool()
+
+        chunk_size, num_larger_chunks = divmod(self.num_trials, self.num_workers)
+        tasks = [
+            (observation, chunk_size + (i < num_larger_chunks), f'{self.seed}:{self.__num_acts}:{i}')
+            for i in range(self.num_workers)
+        ]
+        self.__num_acts += 1
+
+        cached_win, cached_lose = self._load_cached_counts(observation)
+        count_win = Counter()
+        count_lose = Counter()
+        for chunk_win, chunk_lose in pool.starmap(_count_worker_trials, tasks):
+            count_win.update(chunk_win)
+            count_lose.update(chunk_lose)
+        self._store_cached_counts(observation, count_win, count_lose)
+
+        return self._select_action(count_win + cached_win, count_lose + cached_lose)
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def __enter__(self) -> 'ParallelMonteCarloBugShotGameAgent':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __get_pool(self) -> multiprocessing.pool.Pool:
+        if self.__pool is None:
+            worker_agent = MonteCarloBugShotGameAgent(
+                num_trials=0,
+                dispatcher=self.dispatcher,
+                decoder=self.decoder,
+                explorer=self.explorer,
+                rng=self.rng,
+            )
+            self.__pool = multiprocessing.Pool(
+                processes=self.num_workers,
+                initializer=_init_worker,
+                initargs=(worker_agent,),
+            )
+        return self.__pool
+
+class BeliefMonteCarloBugShotGameAgent(MonteCarloBugShotGameAgent):
+    '''
+    MonteCarloBugShotGameAgent that tracks its chamber belief across moves
+    with a BeliefBugShotStateDecoder of its own, instead of decoding every
+    observation from scratch.
+    '''
+
+    def __init__(
+            self,
+            num_trials: int,
+            dispatcher: BugShotStateDispatcher,
+            explorer: BugShotStateExplorer,
+            max_table_size: int = 4096,
+            rng: random.Random = None,
+            cache: BugShotRolloutCache = None,
+        ):
+        super().__init__(num_trials, dispatcher, BeliefBugShotStateDecoder(max_table_size), explorer, rng, cache)
+
+    @property
+    def belief(self) -> BugShotChamberBelief:
+        return self.decoder.belief
+
+class BanditMonteCarloBugShotGameAgent(MonteCarloBugShotGameAgent):
+    '''
+    Anytime Monte Carlo agent that treats the available actions as bandit arms.
+
+    A trial plays its arm from a sampled root state and rolls out the rest,
+    so every trial counts for its arm, including the ones where the arm
+    itself ends the game. Arms are picked by UCB1 (strategy 'ucb') or by
+    successive halving over num_trials (strategy 'halving').
+
+    act() stops after num_trials trials, after time_limit seconds if given,
+    or as soon as every arm has min_trials trials and the Wilson interval of
+    the best arm's win rate lies above the intervals of all the others, at
+    confidence split across the comparisons.
+    '''
+
+    time_limit: float
+    strategy: str
+    confidence: float
+    min_trials: int
+    exploration: float
+    check_interval: int
+
+    def __init__(
+            self,
+            num_trials: int,
+            dispatcher: BugShotStateDispatcher,
+            decoder: BugShotStateDecoder,
+            explorer: BugShotStateExplorer,
+            time_limit: float = None,
+            strategy: str = 'ucb',
+            confidence: float = 0.95,
+            min_trials: int = 20,
+            exploration: float = math.sqrt(2),
+            check_interval: int = 20,
+            rng: random.Random = None,
+            cache: BugShotRolloutCache = None,
+        ):
+        super().__init__(num_trials, dispatcher, decoder, explorer, rng, cache)
+        if strategy not in ('ucb', 'halving'):
+            raise ValueError(f'Unknown strategy: {strategy}')
+        self.time_limit = time_limit
+        self.strategy = strategy
+        self.confidence = confidence
+        self.min_trials = min_trials
+        self.exploration = exploration
+        self.check_interval = check_interval
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        root_states = self.decoder.decode(observation)
+        actions = self.dispatcher.get_available_actions(root_states[0])
+        if len(actions) == 1:
+            return self._select_action(Counter({actions[0]: 1}), Counter())
+
+        # Cached trials count as if this act() had run them.
+        cached_win, cached_lose = self._load_cached_counts(observation)
+        count_win = cached_win.copy()
+        count_lose = cached_lose.copy()
+
+        deadline = None if self.time_limit is None else time.monotonic() + self.time_limit
+        if self.strategy == 'ucb':
+            self.__run_ucb(root_states, actions, count_win, count_lose, deadline)
+            arms = actions
+        else:
+            arms = self.__run_halving(root_states, actions, count_win, count_lose, deadline)
+
+        self._store_cached_counts(observation, count_win - cached_win, count_lose - cached_lose)
+        # Arms eliminated by halving stay out, however lucky their few trials were.
+        return self._select_action(count_win, count_lose, arms)
+
+    def __run_ucb(self, root_states: list[BugShotState], actions: list[BugShotAction], count_win: Counter, count_lose: Counter, deadline: float):
+        num_cached = sum(count_win[action] + count_lose[action] for action in actions)
+        for num_trials in range(self.num_trials):
+            if num_trials % self.check_interval == 0 and self.__should_stop(actions, count_win, count_lose, deadline):
+                return
+
+            untried = [action for action in actions if count_win[action] + count_lose[action] == 0]
+            if len(untried) > 0:
+                action = untried[0]
+            else:
+                log_trials = math.log(num_cached + num_trials)
+                action = max(actions, key=lambda action: self.__get_ucb(count_win[action], count_win[action] + count_lose[action], log_trials))
+            self.__run_trial(root_states, action, count_win, count_lose)
+
+    def __run_halving(self, root_states: list[BugShotState], actions: list[BugShotAction], count_win: Counter, count_lose: Counter, deadline: float) -> list[BugShotAction]:
+        '''
+        Returns the arms still in the race.
+        '''
+
+        arms = list(actions)
+        num_rounds = math.ceil(math.log2(len(arms)))
+        num_trials = 0
+        while len(arms) > 1:
+            trials_per_arm = max(1, self.num_trials // (num_rounds * len(arms)))
+            for _ in range(trials_per_arm):
+                for action in arms:
+                    if num_trials >= self.num_trials:
+                        return arms
+                    self.__run_trial(root_states, action, count_win, count_lose)
+                    num_trials += 1
+                if self.__should_stop(arms, count_win, count_lose, deadline):
+                    return arms
+
+            arms.sort(key=lambda action: -count_win[action] / (count_win[action] + count_lose[action]))
+            arms = arms[:(len(arms) + 1) // 2]
+        return arms
+
+    def __run_trial(self, root_states: list[BugShotState], action: BugShotAction, count_win: Counter, count_lose: Counter):
+        state = self.dispatcher.dispatch(self.rng.choice(root_states), action)
+        is_win, _ = self.explorer.explore(state)
+        if is_win:
+            count_win[action] += 1
+        else:
+            count_lose[action] += 1
+
+    def __get_ucb(self, wins: int, visits: int, log_trials: float) -> float:
+        return wins / visits + self.exploration * math.sqrt(log_trials / visits)
+
+    def __should_stop(self, actions: list[BugShotAction], count_win: Counter, count_lose: Counter, deadline: float) -> bool:
+        visits = {action: count_win[action] + count_lose[action] for action in actions}
+        # Every arm gets a trial, however short the time limit.
+        if min(visits.values()) == 0:
+            return False
+        if deadline is not None and time.monotonic() >= deadline:
+            return True
+        if min(visits.values()) < self.min_trials:
+            return False
+
+        confidence = 1 - (1 - self.confidence) / (len(actions) - 1)
+        intervals = {
+            action: get_wilson_interval(count_win[action], visits[action], confidence)
+            for action in actions
+        }
+        best = max(actions, key=lambda action: count_win[action] / visits[action])
+        return all(intervals[action][1] < intervals[best][0] for action in actions if action != best)
+
+class MonteCarloTreeEdge:
+
+    __slots__ = [
+        'visits',
+        'wins',
+        'availability',
+        'children',
+    ]
+
+    visits: int
+    wins: int
+    availability: int
+    children: dict[tuple, 'MonteCarloTreeNode']
+
+    def __init__(self):
+        self.visits = 0
+        self.wins = 0
+        self.availability = 1
+        self.children = dict()
+
+class MonteCarloTreeNode:
+
+    __slots__ = ['edges']
+
+    edges: dict[BugShotAction, MonteCarloTreeEdge]
+
+    def __init__(self):
+        self.edges = dict()
+
+class MonteCarloTreeSearchBugShotGameAgent(BugShotGameAgent):
+    '''
+    Information set Monte Carlo tree search with UCT.
+
+    Every iteration samples a chamber from the decoded observation, descends
+    with UCT over the actions available in that sample, expands one edge and
+    finishes with a rollout of the explorer. Children are keyed by the turn
+    and canonical key of the state they lead to, so reloads, refills and
+    magnified shells land in separate nodes. The subtree matching the next
+    observation is kept for the next act().
+
+    act() runs until time_limit seconds have passed or max_iterations
+    iterations are done, whichever comes first.
+    '''
+
+    dispatcher: BugShotStateDispatcher
+    decoder: BugShotStateDecoder
+    explorer: BugShotStateExplorer
+    time_limit: float
+    max_iterations: int
+    exploration: float
+    rng: random.Random
+
+    def __init__(
+            self,
+            dispatcher: BugShotStateDispatcher,
+            decoder: BugShotStateDecoder,
+            explorer: BugShotStateExplorer,
+            time_limit: float = 1.0,
+            max_iterations: int = None,
+            exploration: float = math.sqrt(2),
+            rng: random.Random = None,
+        ):
+        self.dispatcher = dispatcher
+        self.decoder = decoder
+        self.explorer = explorer
+        self.time_limit = time_limit
+        self.max_iterations = max_iterations
+        self.exploration = exploration
+        self.rng = DEFAULT_RNG if rng is None else rng
+
+        self.__root = None
+        self.__last_action = None
+
+    def reset(self):
+        self.__root = None
+        self.__last_action = None
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        root_states = self.decoder.decode(observation)
+        root = self.__find_root(observation)
+
+        deadline = time.monotonic() + self.time_limit
+        num_iterations = 0
+        while time.monotonic() < deadline:
+            if self.max_iterations is not None and num_iterations >= self.max_iterations:
+                break
+            self.__iterate(root, self.rng.choice(root_states))
+            num_iterations += 1
+
+        actions = self.dispatcher.get_available_actions(root_states[0])
+        action = max(actions, key=lambda action: self.__get_visits(root, action))
+
+        self.__root = root
+        self.__last_action = action
+        return action
+
+    def __iterate(self, root: MonteCarloTreeNode, state: BugShotState):
+        path: list[tuple[MonteCarloTreeEdge, BugShotPlayer]] = list()
+        node = root
+        winner = self.dispatcher.get_winner(state)
+
+        while winner is None:
+            actions = self.dispatcher.get_available_actions(state)
+            untried = list()
+            for action in actions:
+                edge = node.edges.get(action)
+                if edge is None:
+                    untried.append(action)
+                else:
+                    edge.availability += 1
+
+            is_expanding = len(untried) > 0
+            if is_expanding:
+                action = self.rng.choice(untried)
+                edge = node.edges[action] = MonteCarloTreeEdge()
+            else:
+                action = max(actions, key=lambda action: self.__get_uct(node.edges[action]))
+                edge = node.edges[action]
+
+            path.append((edge, state.turn))
+            state = self.dispatcher.dispatch(state, action)
+            winner = self.dispatcher.get_winner(state)
+
+            key = self.__get_key(state)
+            node = edge.children.get(key)
+            if node is None:
+                node = edge.children[key] = MonteCarloTreeNode()
+
+            if is_expanding:
+                break
+
+        if winner is None:
+            is_win, _ = self.explorer.explore(state)
+            winner = BugShotPlayer.PLAYER1 if is_win else BugShotPlayer.PLAYER2
+
+        for edge, player in path:
+            edge.visits += 1
+            if player == winner:
+                edge.wins += 1
+
+    def get_visit_counts(self) -> dict[BugShotAction, int]:
+        '''
+        Visits of every root action in the last act().
+        '''
+
+        if self.__root is None:
+            return dict()
+        return {action: edge.visits for action, edge in self.__root.edges.items()}
+
+    def __get_uct(self, edge: MonteCarloTreeEdge) -> float:
+        return edge.wins / edge.visits + self.exploration * math.sqrt(math.log(edge.availability) / edge.visits)
+
+    def __get_visits(self, node: MonteCarloTreeNode, action: BugShotAction) -> int:
+        edge = node.edges.get(action)
+        return 0 if edge is None else edge.visits
+
+    def __get_key(self, state: BugShotState) -> tuple:
+        return state.turn, get_canonical_key(state)
+
+    def __find_root(self, observation: list[int]) -> MonteCarloTreeNode:
+        '''
+        Looks for the node of observation below the last action, skipping
+        over the opponent's moves in between.
+        '''
+
+        if self.__root is None or self.__last_action not in self.__root.edges:
+            return MonteCarloTreeNode()
+
+        key = (BugShotPlayer.PLAYER1, get_canonical_observation_key(observation))
+        frontier = list(self.__root.edges[self.__last_action].children.items())
+        while len(frontier) > 0:
+            next_frontier = list()
+            for child_key, child in frontier:
+                if child_key == key:
+                    return child
+                if child_key[0] == BugShotPlayer.PLAYER2:
+                    for edge in child.edges.values():
+                        next_frontier.extend(edge.children.items())
+            frontier = next_frontier
+
+        return MonteCarloTreeNode()
+
+class SolverBugShotGameAgent(BugShotGameAgent):
+    '''
+    Plays the action with the highest exact win probability.
+    '''
+
+    solver: BugShotGameSolver
+
+    def __init__(self, solver: BugShotGameSolver):
+        self.solver = solver
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        action_values = self.solver.solve(observation)
+        return max(action_values, key=action_values.get)
+
+class TableBugShotGameAgent(BugShotGameAgent):
+    '''
+    Answers from a precomputed BugShotPolicyTable, falling back to
+    fallback_agent (if given) for observations missing from the table.
+    '''
+
+    table: BugShotPolicyTable
+    fallback_agent: BugShotGameAgent
+
+    def __init__(self, table: BugShotPolicyTable, fallback_agent: BugShotGameAgent = None):
+        self.table = table
+        self.fallback_agent = fallback_agent
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        action = self.table.lookup(observation)
+        if action is not None:
+            return action
+        if self.fallback_agent is None:
+            raise KeyError(f'Observation is not in the policy table: {observation}')
+        return self.fallback_agent.act(observation)
+
+    def reset(self):
+        if self.fallback_agent is not None:
+            self.fallback_agent.reset()
+
+class PolicyBugShotGameAgent(BugShotGameAgent):
+    '''
+    Plays the actions of an MLPBugShotPolicy, one observation at a time.
+    '''
+
+    policy: MLPBugShotPolicy
+    temperature: float
+    rng: random.Random
+
+    def __init__(self, policy: MLPBugShotPolicy, temperature: float = 0.0, rng: random.Random = None):
+        self.policy = policy
+        self.temperature = temperature
+        self.rng = DEFAULT_RNG if rng is None else rng
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        return self.policy.select_actions([observation], self.temperature, self.rng)[0]
+
+class BatchedPolicyBugShotGameAgent(BugShotGameAgent):
+    '''
+    Asks a BatchingBugShotPolicyServer shared with other games for its actions.
+    '''
+
+    server: BatchingBugShotPolicyServer
+
+    def __init__(self, server: BatchingBugShotPolicyServer):
+        self.server = server
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        return self.server.act(observation)
+
+_worker_agent: MonteCarloBugShotGameAgent = None
+
+def _init_worker(agent: MonteCarloBugShotGameAgent):
+    global _worker_agent
+    _worker_agent = agent
+
+def _count_worker_trials(observation: list[int], num_trials: int, seed: str) -> tuple[Counter, Counter]:
+    reseed_rngs(_worker_agent, seed, reseed_default=True)
+    return _worker_agent._count_trials(observation, num_trials)
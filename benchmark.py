@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+
+from collections.abc import Callable
+
+from bugshot import (
+    BugShotGameBuilder,
+    BugShotGameConfig,
+    BugShotGame,
+    BugShotAction,
+    BugShotItem,
+    BugShotItemBoard,
+    BugShotPlayer,
+    BugShotShell,
+    DefaultBugShotChamberInitializer,
+    DefaultBugShotItemBoardInitializer,
+    DefaultBugShotStateSelector,
+    PackedBugShotState,
+    PackedBugShotStateDispatcher,
+    DEFAULT_RNG,
+    get_compiled_modules,
+)
+from agent import RandomBugShotGameAgent, MonteCarloBugShotGameAgent
+from decoder import CombinationBugShotStateDecoder, RandomBugShotStateDecoder
+from explorer import RandomBugShotStateExplorer, PackedRandomBugShotStateExplorer
+
+# Same config as test.py and game.py.
+CONFIG = BugShotGameConfig(
+    min_items_per_init=2,
+    max_items_per_init=4,
+    max_items_per_board=8,
+    min_shell=3,
+    max_shell=8,
+    min_initial_life=2,
+    max_initial_life=3,
+)
+SHELL_COUNTS = [2, 3, 4, 5, 6, 7, 8, 12, 16]
+
+class BugShotBenchmark:
+    '''
+    Runs every benchmark and collects operations per second by name.
+
+    A benchmark calls its function in growing batches until min_time
+    seconds have passed, and the best of repeat rounds is kept, which is
+    the least disturbed by other load on the machine.
+    '''
+
+    min_time: float
+    repeat: int
+    seed: int
+    results: dict[str, dict]
+
+    def __init__(self, min_time: float = 0.2, repeat: int = 3, seed: int = 0):
+        self.min_time = min_time
+        self.repeat = repeat
+        self.seed = seed
+        self.results = dict()
+
+    def run(self, pattern: str = None) -> dict[str, dict]:
+        random.seed(self.seed)
+        DEFAULT_RNG.seed(self.seed)
+        for name, unit, fn in self.__get_benchmarks():
+            if pattern is not None and pattern not in name:
+                continue
+            self.results[name] = {'ops_per_second': self.measure(fn), 'unit': unit}
+        return self.results
+
+    def measure(self, fn: Callable[[], object]) -> float:
+        best = 0.0
+        for _ in range(self.repeat):
+            num_calls = 1
+            while True:
+                started = time.perf_counter()
+                for _ in range(num_calls):
+                    fn()
+                elapsed = time.perf_counter() - started
+                if elapsed >= self.min_time:
+                    break
+                num_calls *= 2
+            best = max(best, num_calls / elapsed)
+        return best
+
+    def __get_benchmarks(self) -> list[tuple[str, str, Callable[[], object]]]:
+        benchmarks = list()
+        game = BugShotGameBuilder().build(config=CONFIG, seed=self.seed)
+        state = game.state.set_item_boards({
+            player: BugShotItemBoard(remains={item: 1 for item in BugShotItem})
+            for player in BugShotPlayer
+        })
+
+        # BugShotState transitions
+        transitions = {
+            'pass_turn': lambda: state.pass_turn(),
+            'pop_chamber': lambda: state.pop_chamber(),
+            'set_chamber': lambda: state.set_chamber(state.chamber),
+            'decrease_item_remains': lambda: state.decrease_item_remains(BugShotItem.BEER),
+            'set_item_boards': lambda: state.set_item_boards(state.item_boards),
+            'add_life': lambda: state.add_life(BugShotPlayer.PLAYER1, -1),
+            'handcuff_opponent': lambda: state.handcuff_opponent(),
+            'magnify_shell': lambda: state.magnify_shell(),
+            'saw_shotgun': lambda: state.saw_shotgun(),
+        }
+        for name, fn in transitions.items():
+            benchmarks.append((f'state.{name}', 'transitions', fn))
+
+        # Dispatch steps, restarting finished games
+        benchmarks.append(('dispatch.default', 'steps', self.__build_dispatch_step(game)))
+        benchmarks.append(('dispatch.packed', 'steps', self.__build_packed_dispatch_step(game)))
+
+        # Decoding latency by shell count
+        for num_shells in SHELL_COUNTS:
+            observation = self.__build_observation(game, num_shells)
+            combination_decoder = CombinationBugShotStateDecoder(max_chambers=100)
+            random_decoder = RandomBugShotStateDecoder()
+            benchmarks.append((f'decode.combination.{num_shells}', 'decodes', lambda observation=observation: combination_decoder.decode(observation)))
+            benchmarks.append((f'decode.random.{num_shells}', 'decodes', lambda observation=observation: random_decoder.decode(observation)))
+
+        # Rollouts from the initial state
+        explorer = RandomBugShotStateExplorer(dispatcher=game.dispatcher)
+        packed_explorer = PackedRandomBugShotStateExplorer(dispatcher=PackedBugShotStateDispatcher(
+            chamber_initializer=DefaultBugShotChamberInitializer(min_shell=CONFIG.min_shell, max_shell=CONFIG.max_shell),
+            item_board_initializer=DefaultBugShotItemBoardInitializer(min_items=CONFIG.min_items_per_init, max_items=CONFIG.max_items_per_init),
+            max_num_items_per_board=CONFIG.max_items_per_board,
+        ))
+        benchmarks.append(('explore.random', 'rollouts', lambda: explorer.explore(state)))
+        benchmarks.append(('explore.packed', 'rollouts', lambda: packed_explorer.explore(state)))
+
+        # Full games with the agents of test.py
+        dispatcher = game.dispatcher
+        random_agent = RandomBugShotGameAgent(dispatcher=dispatcher)
+        monte_agent = MonteCarloBugShotGameAgent(
+            num_trials=100,
+            dispatcher=dispatcher,
+            decoder=CombinationBugShotStateDecoder(max_chambers=100),
+            explorer=RandomBugShotStateExplorer(dispatcher=dispatcher),
+        )
+        benchmarks.append(('game.random_vs_random', 'games', self.__build_game(random_agent, random_agent)))
+        benchmarks.append(('game.monte_carlo_vs_random', 'games', self.__build_game(monte_agent, random_agent)))
+
+        return benchmarks
+
+    def __build_dispatch_step(self, game: BugShotGame) -> Callable[[], object]:
+        dispatcher = game.dispatcher
+        actions = list(BugShotAction)
+        current = [game.state]
+
+        def step():
+            state = dispatcher.dispatch(current[0], random.choice(actions))
+            current[0] = game.state if dispatcher.get_winner(state) is not None else state
+
+        return step
+
+    def __build_packed_dispatch_step(self, game: BugShotGame) -> Callable[[], object]:
+        dispatcher = PackedBugShotStateDispatcher(
+            chamber_initializer=DefaultBugShotChamberInitializer(min_shell=CONFIG.min_shell, max_shell=CONFIG.max_shell),
+            item_board_initializer=DefaultBugShotItemBoardInitializer(min_items=CONFIG.min_items_per_init, max_items=CONFIG.max_items_per_init),
+            max_num_items_per_board=CONFIG.max_items_per_board,
+        )
+        actions = list(BugShotAction)
+        initial = PackedBugShotState.pack(game.state)
+        current = [initial]
+
+        def step():
+            state = dispatcher.dispatch(current[0], random.choice(actions))
+            current[0] = initial if dispatcher.is_terminal(state) else state
+
+        return step
+
+    def __build_observation(self, game: BugShotGame, num_shells: int) -> list[int]:
+        num_live = num_shells // 2
+        chamber = [BugShotShell.LIVE] * num_live + [BugShotShell.BLANK] * (num_shells - num_live)
+        state = game.state.set_chamber(chamber)
+        return DefaultBugShotStateSelector(BugShotPlayer.PLAYER1).select(state)
+
+    def __build_game(self, agent1, agent2) -> Callable[[], object]:
+        builder = BugShotGameBuilder()
+        agents = {BugShotPlayer.PLAYER1: agent1, BugShotPlayer.PLAYER2: agent2}
+
+        def play():
+            game = builder.build(config=CONFIG)
+            while game.get_winner() is None:
+                game.do_action(agents[game.get_turn()].act(game.observe()))
+
+        return play
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    '''
+    Names of the benchmarks that got slower than baseline by more than threshold (a fraction).
+    '''
+
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['ops_per_second'] / baseline[name]['ops_per_second']
+        if ratio < 1 - threshold:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the game core, decoders, explorers and agents.')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    parser.add_argument('--compare', help='baseline JSON written by --output to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown that counts as a regression (default 0.1)')
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per measurement (default 0.2)')
+    parser.add_argument('--repeat', type=int, default=3, help='measurements per benchmark (default 3)')
+    args = parser.parse_args()
+
+    benchmark = BugShotBenchmark(min_time=args.min_time, repeat=args.repeat)
+    results = benchmark.run(args.filter)
+
+    baseline = dict()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    for name, result in results.items():
+        line = f'{name:<32} {result["ops_per_second"]:>14.1f} {result["unit"]}/s'
+        if name in baseline:
+            line += f'  ({result["ops_per_second"] / baseline[name]["ops_per_second"]:.2f}x baseline)'
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'compiled': get_compiled_modules(),
+                'results': results,
+            }, f, indent=2)
+
+    regressions = compare(results, baseline, args.threshold)
+    if len(regressions) > 0:
+        print(f'Slower than baseline by more than {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
+from .compiled import *
 from .dispatcher import *
 from .enums import *
 from .game import *
 from .initializer import *
+from .log import *
+from .packed import *
+from .rng import *
 from .selector import *
 from .state import *
+from .symmetry import *
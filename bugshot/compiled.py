@@ -0,0 +1,45 @@
+import os
+import sys
+import importlib.abc
+import importlib.util
+import importlib.machinery
+
+# Modules of the rules engine that build.py compiles. A compiled module sits
+# next to its source, and Python imports extension modules before sources,
+# so the compiled build is used whenever it is there.
+COMPILED_MODULES = ('state', 'initializer', 'dispatcher', 'selector', 'packed')
+
+# Set to a non-empty value to import the sources even if a compiled build is there.
+PURE_PYTHON_ENV = 'BUGSHOT_PURE_PYTHON'
+
+class _PurePythonFinder(importlib.abc.MetaPathFinder):
+
+    def find_spec(self, fullname: str, path, target=None) -> importlib.machinery.ModuleSpec:
+        package, _, name = fullname.rpartition('.')
+        if package != __package__ or name not in COMPILED_MODULES:
+            return None
+        return importlib.util.spec_from_file_location(fullname, os.path.join(os.path.dirname(__file__), f'{name}.py'))
+
+def use_pure_python():
+    '''
+    Makes the modules of COMPILED_MODULES import from their sources. Only
+    modules that are not imported yet are affected.
+    '''
+
+    if not any(isinstance(finder, _PurePythonFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _PurePythonFinder())
+
+def get_compiled_modules() -> list[str]:
+    '''
+    Names of the modules of COMPILED_MODULES that were imported from a compiled build.
+    '''
+
+    compiled = list()
+    for name in COMPILED_MODULES:
+        module = sys.modules.get(f'{__package__}.{name}')
+        if module is not None and getattr(module, '__file__', '').endswith(tuple(importlib.machinery.EXTENSION_SUFFIXES)):
+            compiled.append(name)
+    return compiled
+
+if os.environ.get(PURE_PYTHON_ENV):
+    use_pure_python()
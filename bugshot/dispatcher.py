@@ -5,6 +5,17 @@ from abc import ABCMeta, abstractmethod
 from .state import BugShotState, BugShotItemBoard
 from .enums import BugShotAction, BugShotShell, BugShotItem, BugShotPlayer
 from .initializer import BugShotChamberInitializer, BugShotItemBoardInitializer
+from .rng import DEFAULT_RNG
+
+ACTION_BITS = {
+    action: 1 << i
+    for i, action in enumerate(BugShotAction)
+}
+# Actions of every action mask, in BugShotAction order.
+AVAILABLE_ACTIONS_BY_MASK = tuple(
+    tuple(action for action, bit in ACTION_BITS.items() if mask & bit)
+    for mask in range(1 << len(BugShotAction))
+)
 
 class BugShotStateDispatcher(metaclass=ABCMeta):
     
@@ -24,22 +35,35 @@ class BugShotStateDispatcher(metaclass=ABCMeta):
     def get_available_actions(self, state: BugShotState) -> list[BugShotAction]:
         raise NotImplementedError()
 
+    def get_action_mask(self, state: BugShotState) -> int:
+        '''
+        Available actions as a bitmask of ACTION_BITS.
+        '''
+
+        mask = 0
+        for action in self.get_available_actions(state):
+            mask |= ACTION_BITS[action]
+        return mask
+
 class DefaultBugShotStateDispatcher(BugShotStateDispatcher):
     
     chamber_initializer: BugShotChamberInitializer
     item_board_initializer: BugShotItemBoardInitializer
     max_num_items_per_board: int
+    rng: random.Random
 
     def __init__(
             self,
             chamber_initializer: BugShotChamberInitializer,
             item_board_initializer: BugShotItemBoardInitializer,
             max_num_items_per_board: int = 8,
+            rng: random.Random = None,
         ):
 
         self.chamber_initializer = chamber_initializer
         self.item_board_initializer = item_board_initializer
         self.max_num_items_per_board = max_num_items_per_board
+        self.rng = DEFAULT_RNG if rng is None else rng
 
     def dispatch(
         self,
@@ -51,26 +75,39 @@ class DefaultBugShotStateDispatcher(BugShotStateDispatcher):
         if winner is not None:
             return state
 
-        return self.__dispatch_common(self.__dispatch_action(state, action))
+        next_state = self.__dispatch_common(self.__dispatch_action(state, action))
+        if next_state.cached_action_mask is None:
+            self.__cache(next_state)
+        return next_state
         
     def get_available_actions(self, state: BugShotState) -> list[BugShotAction]:
-        actions = list()
-        item_board = state.item_boards[state.turn]
-        if item_board.remains[BugShotItem.HANDCUFFS] > 0 and not state.is_opponent_handcuffed:
-            actions.append(BugShotAction.USE_HANDCUFFS)
-        if item_board.remains[BugShotItem.BEER] > 0:
-            actions.append(BugShotAction.USE_BEER)
-        if item_board.remains[BugShotItem.MAGNIFYING_GLASS] > 0 and not state.is_magnified_shell:
-            actions.append(BugShotAction.USE_MAGNIYING_GLASS)
-        if item_board.remains[BugShotItem.CIGARATTES] > 0:
-            actions.append(BugShotAction.USE_CIGARATTES)
-        if item_board.remains[BugShotItem.HAND_SAW] > 0 and not state.is_shotgun_sawed:
-            actions.append(BugShotAction.USE_HAND_SAW)
-
-        return [
-            BugShotAction.USE_SHOTGUN_SELF,
-            BugShotAction.USE_SHOTGUN_OPPONENT,
-        ] + actions
+        return list(AVAILABLE_ACTIONS_BY_MASK[self.get_action_mask(state)])
+
+    def get_action_mask(self, state: BugShotState) -> int:
+        mask = state.cached_action_mask
+        if mask is None:
+            self.__cache(state)
+            mask = state.cached_action_mask
+        return mask
+
+    def __cache(self, state: BugShotState):
+        state.cached_winner = self.__compute_winner(state)
+        state.cached_action_mask = self.__compute_action_mask(state)
+
+    def __compute_action_mask(self, state: BugShotState) -> int:
+        mask = ACTION_BITS[BugShotAction.USE_SHOTGUN_SELF] | ACTION_BITS[BugShotAction.USE_SHOTGUN_OPPONENT]
+        remains = state.item_boards[state.turn].remains
+        if remains[BugShotItem.HANDCUFFS] > 0 and not state.is_opponent_handcuffed:
+            mask |= ACTION_BITS[BugShotAction.USE_HANDCUFFS]
+        if remains[BugShotItem.BEER] > 0:
+            mask |= ACTION_BITS[BugShotAction.USE_BEER]
+        if remains[BugShotItem.MAGNIFYING_GLASS] > 0 and not state.is_magnified_shell:
+            mask |= ACTION_BITS[BugShotAction.USE_MAGNIYING_GLASS]
+        if remains[BugShotItem.CIGARATTES] > 0:
+            mask |= ACTION_BITS[BugShotAction.USE_CIGARATTES]
+        if remains[BugShotItem.HAND_SAW] > 0 and not state.is_shotgun_sawed:
+            mask |= ACTION_BITS[BugShotAction.USE_HAND_SAW]
+        return mask
     
     def __dispatch_action(
             self,
@@ -108,6 +145,11 @@ class DefaultBugShotStateDispatcher(BugShotStateDispatcher):
         return state
 
     def get_winner(self, state: BugShotState) -> BugShotPlayer:
+        if state.cached_action_mask is None:
+            self.__cache(state)
+        return state.cached_winner
+
+    def __compute_winner(self, state: BugShotState) -> BugShotPlayer:
         if state.life_dict[BugShotPlayer.PLAYER1] <= 0:
             return BugShotPlayer.PLAYER2
         if state.life_dict[BugShotPlayer.PLAYER2] <= 0:
@@ -180,27 +222,24 @@ class DefaultBugShotStateDispatcher(BugShotStateDispatcher):
         return damage
 
     def __add_items(self, item_boards: dict[BugShotPlayer, BugShotItemBoard]) -> dict[BugShotPlayer, BugShotItemBoard]:
-        item_boards2 = self.item_board_initializer.initialize()
+        added_boards = self.item_board_initializer.initialize_refill(
+            max_new_items={
+                player: self.max_num_items_per_board - item_boards[player].get_num_items()
+                for player in BugShotPlayer
+            },
+            rng=self.rng,
+        )
         return {
-            player: self.__add_items_to_board(item_boards[player], item_boards2[player])
+            player: self.__add_items_to_board(item_boards[player], added_boards[player])
             for player in BugShotPlayer
         }
 
-    def __add_items_to_board(self, board: BugShotItemBoard, board2: BugShotItemBoard) -> BugShotItemBoard:
-        max_new_items = self.max_num_items_per_board - board.get_num_items()
-        if max_new_items <= 0:
+    def __add_items_to_board(self, board: BugShotItemBoard, added_board: BugShotItemBoard) -> BugShotItemBoard:
+        if added_board.get_num_items() == 0:
             return board
-
-        new_items = self.__serialize_items(board2)
-        random.shuffle(new_items)
-
-        for item in new_items[:max_new_items]:
-            board = board.add_item(item, 1)
-        return board
-
-    def __serialize_items(self, item_board: BugShotItemBoard) -> list[BugShotItem]:
-        return [
-            item
-            for item, num in item_board.remains.items()
-            for _ in range(num)
-        ]
+        return BugShotItemBoard(
+            remains={
+                item: num + added_board.remains[item]
+                for item, num in board.remains.items()
+            },
+        )
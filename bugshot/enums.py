@@ -1,6 +1,9 @@
-from random import randint
+import random
+
 from enum import Enum
 
+from .rng import DEFAULT_RNG
+
 class BugShotPlayer(Enum):
     PLAYER1 = 'PLAYER1'
     PLAYER2 = 'PLAYER2'
@@ -31,9 +34,11 @@ class BugShotItem(Enum):
     # EXPIRED_MEDICINE = 'EXPIRED_MEDICINE'
 
     @staticmethod
-    def random():
-        rv = randint(0, len(BugShotItem) - 1)
-        return list(BugShotItem)[rv]
+    def random(rng: random.Random = None):
+        rng = DEFAULT_RNG if rng is None else rng
+        return ITEMS[rng.randrange(len(ITEMS))]
+
+ITEMS = tuple(BugShotItem)
 
 class BugShotAction(Enum):
     USE_SHOTGUN_SELF = 'USE_SHOTGUN_SELF'
@@ -1,3 +1,8 @@
+import random
+
+from abc import ABCMeta, abstractmethod
+
+from .state import BugShotState
 from .initializer import (
     BugShotStateInitializer,
     DefaultBugShotStateInitializer,
@@ -7,6 +12,20 @@ from .initializer import (
 from .dispatcher import BugShotStateDispatcher, DefaultBugShotStateDispatcher
 from .selector import BugShotStateSelector, DefaultBugShotStateSelector
 from .enums import BugShotPlayer, BugShotAction
+from .rng import spawn_rngs
+
+class BugShotGameRecorder(metaclass=ABCMeta):
+    '''
+    Receives the states and actions of a game as they happen.
+    '''
+
+    @abstractmethod
+    def record_reset(self, state: BugShotState):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def record_action(self, state: BugShotState, action: BugShotAction, next_state: BugShotState):
+        raise NotImplementedError()
 
 class BugShotGame:
 
@@ -14,6 +33,7 @@ class BugShotGame:
     dispatcher: BugShotStateDispatcher
     selector_player1: BugShotStateSelector
     selector_player2: BugShotStateSelector
+    recorder: BugShotGameRecorder
 
     def __init__(
             self,
@@ -23,15 +43,37 @@ class BugShotGame:
             selector_player2: BugShotStateSelector,
         ):
 
+        self.state_initializer = state_initializer
         self.state = state_initializer.initialize()
         self.dispatcher = dispatcher
         self.selector_player1 = selector_player1
         self.selector_player2 = selector_player2
+        self.recorder = None
+
+    def set_recorder(self, recorder: BugShotGameRecorder):
+        '''
+        Sends the current state and every later change to recorder (None to stop recording).
+        '''
+
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.record_reset(self.state)
+
+    def reset(self):
+        '''
+        Starts a new game with the same components.
+        '''
+
+        self.state = self.state_initializer.initialize()
+        if self.recorder is not None:
+            self.recorder.record_reset(self.state)
 
     def do_action(self, action: BugShotAction) -> bool:
         next_state = self.dispatcher.dispatch(self.state, action)
         if next_state is self.state:
             return False
+        if self.recorder is not None:
+            self.recorder.record_action(self.state, action, next_state)
         self.state = next_state
         return True
 
@@ -78,7 +120,12 @@ class BugShotGameConfig:
 
 class BugShotGameBuilder:
 
-    def build(self, config: BugShotGameConfig) -> BugShotGame:
+    def build(self, config: BugShotGameConfig, seed: int = None) -> BugShotGame:
+        '''
+        Builds a game whose components draw from the random module, or from
+        their own generators derived from seed if it is given.
+        '''
+
         min_items_per_init = config.min_items_per_init
         max_items_per_init = config.max_items_per_init
         max_items_per_board = config.max_items_per_board
@@ -87,24 +134,33 @@ class BugShotGameBuilder:
         min_initial_life = config.min_initial_life
         max_initial_life = config.max_initial_life
 
+        if seed is None:
+            item_board_rng, chamber_rng, state_rng, dispatcher_rng = None, None, None, None
+        else:
+            item_board_rng, chamber_rng, state_rng, dispatcher_rng = spawn_rngs(random.Random(seed), 4)
+
         item_board_initializer = DefaultBugShotItemBoardInitializer(
             min_items=min_items_per_init,
             max_items=max_items_per_init,
+            rng=item_board_rng,
         )
         chamber_initializer = DefaultBugShotChamberInitializer(
             min_shell=min_shell,
             max_shell=max_shell,
+            rng=chamber_rng,
         )
         state_initializer = DefaultBugShotStateInitializer(
             min_initial_life=min_initial_life,
             max_initial_life=max_initial_life,
             item_board_initializer=item_board_initializer,
             chamber_initializer=chamber_initializer,
+            rng=state_rng,
         )
         dispatcher = DefaultBugShotStateDispatcher(
             chamber_initializer=chamber_initializer,
             item_board_initializer=item_board_initializer,
             max_num_items_per_board=max_items_per_board,
+            rng=dispatcher_rng,
         )
         selector_player1 = DefaultBugShotStateSelector(BugShotPlayer.PLAYER1)
         selector_player2 = DefaultBugShotStateSelector(BugShotPlayer.PLAYER2)
@@ -1,12 +1,16 @@
 import random
+import functools
 
 from abc import ABCMeta, abstractmethod
+from collections import deque
+from collections.abc import Iterable
 
 from .state import (
     BugShotState,
     BugShotItemBoard,
 )
-from .enums import BugShotPlayer, BugShotItem, BugShotShell
+from .enums import BugShotPlayer, BugShotItem, BugShotShell, ITEMS
+from .rng import DEFAULT_RNG
 
 class BugShotItemBoardInitializer(metaclass=ABCMeta):
     
@@ -14,6 +18,21 @@ class BugShotItemBoardInitializer(metaclass=ABCMeta):
     def initialize(self) -> dict[BugShotPlayer, BugShotItemBoard]:
         raise NotImplementedError()
 
+    def initialize_refill(self, max_new_items: dict[BugShotPlayer, int], rng: random.Random = None) -> dict[BugShotPlayer, BugShotItemBoard]:
+        '''
+        Items added to boards with room for max_new_items more: the boards
+        of initialize(), cut down to a uniformly random subset of
+        max_new_items items where they do not fit. The refill is drawn from
+        rng if it is given.
+        '''
+
+        rng = DEFAULT_RNG if rng is None else rng
+        boards = self.initialize()
+        return {
+            player: _sample_item_board(boards[player], max(0, max_new_items[player]), rng)
+            for player in BugShotPlayer
+        }
+
 class BugShotStateInitializer(metaclass=ABCMeta):
 
     @abstractmethod
@@ -30,30 +49,45 @@ class DefaultBugShotChamberInitializer(BugShotChamberInitializer):
 
     min_shell: int
     max_shell: int
+    rng: random.Random
 
-    def __init__(self, min_shell: int = 3, max_shell: int = 6):
+    def __init__(self, min_shell: int = 3, max_shell: int = 6, rng: random.Random = None):
         if min_shell < 2:
             raise ValueError('min_shell must be greater than or equal to 2')
         self.min_shell = min_shell
         self.max_shell = max_shell
+        self.rng = DEFAULT_RNG if rng is None else rng
+
+    def get_distribution(self) -> list[tuple[int, int, float]]:
+        '''
+        Every (num_live, num_blank) of a new chamber with its probability.
+        '''
+
+        return [
+            (num_live, num_shell - num_live, 1 / (self.max_shell - self.min_shell + 1) / (num_shell - 1))
+            for num_shell in range(self.min_shell, self.max_shell + 1)
+            for num_live in range(1, num_shell)
+        ]
 
     def initialize(self):
-        num_shell = random.randint(self.min_shell, self.max_shell)
-        num_live = random.randint(1, num_shell - 1)
+        num_shell = self.rng.randint(self.min_shell, self.max_shell)
+        num_live = self.rng.randint(1, num_shell - 1)
         lives = [BugShotShell.LIVE for _ in range(num_live)]
         blanks = [BugShotShell.BLANK for _ in range(num_shell - num_live)]
         shells = lives + blanks
-        random.shuffle(shells)
+        self.rng.shuffle(shells)
         return shells
 
 class FixedBugShotChamberInitializer(BugShotChamberInitializer):
 
     num_blanks: int
     num_lives: int
+    rng: random.Random
 
-    def __init__(self, num_blanks: int, num_lives: int):
+    def __init__(self, num_blanks: int, num_lives: int, rng: random.Random = None):
         self.num_blanks = num_blanks
         self.num_lives = num_lives
+        self.rng = DEFAULT_RNG if rng is None else rng
     
     def initialize(self):
         chamber = [
@@ -61,7 +95,7 @@ class FixedBugShotChamberInitializer(BugShotChamberInitializer):
         ] + [
             BugShotShell.LIVE for _ in range(self.num_lives)
         ]
-        random.shuffle(chamber)
+        self.rng.shuffle(chamber)
         return chamber
 
 class DefaultBugShotStateInitializer(BugShotStateInitializer):
@@ -70,6 +104,7 @@ class DefaultBugShotStateInitializer(BugShotStateInitializer):
     max_initial_life: int
     item_board_initializer: BugShotItemBoardInitializer
     chamber_initializer: BugShotChamberInitializer
+    rng: random.Random
 
     def __init__(
             self,
@@ -77,15 +112,17 @@ class DefaultBugShotStateInitializer(BugShotStateInitializer):
             max_initial_life: int,
             item_board_initializer: BugShotItemBoardInitializer,
             chamber_initializer: BugShotChamberInitializer,
+            rng: random.Random = None,
         ):
 
         self.min_initial_life = min_initial_life
         self.max_initial_life = max_initial_life
         self.item_board_initializer = item_board_initializer
         self.chamber_initializer = chamber_initializer
+        self.rng = DEFAULT_RNG if rng is None else rng
 
     def initialize(self):
-        init_life = random.randint(self.min_initial_life, self.max_initial_life)
+        init_life = self.rng.randint(self.min_initial_life, self.max_initial_life)
         return BugShotState(
             turn=BugShotPlayer.PLAYER1,
             chamber=self.chamber_initializer.initialize(),
@@ -98,28 +135,141 @@ class DefaultBugShotStateInitializer(BugShotStateInitializer):
         )
 
 class DefaultBugShotItemBoardInitializer(BugShotItemBoardInitializer):
+    '''
+    Hands both players the same number of items, drawn uniformly from
+    min_items to max_items, and every item independently and uniformly
+    from BugShotItem.
+
+    A uniformly random subset of independent uniform items is itself
+    independent and uniform, so a refill cut down to fit a board is just a
+    smaller draw: get_refill_distribution() gives its exact distribution
+    and initialize_refill() draws it without building the cut items.
+    '''
 
     min_items: int
     max_items: int
+    rng: random.Random
 
-    def __init__(self, min_items: int = 2, max_items: int = 4):
+    def __init__(self, min_items: int = 2, max_items: int = 4, rng: random.Random = None):
         self.min_items = min_items
         self.max_items = max_items
+        self.rng = DEFAULT_RNG if rng is None else rng
 
     def initialize(self) -> dict[BugShotPlayer, BugShotItemBoard]:
-        num_items = random.randint(self.min_items, self.max_items)
+        num_items = self.rng.randint(self.min_items, self.max_items)
         return {
-            player: BugShotItemBoard(remains=self.__build_remains(num_items=num_items))
+            player: BugShotItemBoard(remains=self.__build_remains(num_items, self.rng))
             for player in BugShotPlayer
         }
 
-    def __build_remains(self, num_items: int):
-        remains: dict[BugShotItem, int] = {
-            item: 0 for item in BugShotItem
+    def initialize_refill(self, max_new_items: dict[BugShotPlayer, int], rng: random.Random = None) -> dict[BugShotPlayer, BugShotItemBoard]:
+        rng = self.rng if rng is None else rng
+        num_items = rng.randint(self.min_items, self.max_items)
+        return {
+            player: BugShotItemBoard(remains=self.__build_remains(max(0, min(num_items, max_new_items[player])), rng))
+            for player in BugShotPlayer
         }
 
+    def get_num_items_distribution(self) -> list[tuple[int, float]]:
+        '''
+        Every number of items handed to each player with its probability.
+        '''
+
+        return [
+            (num_items, 1 / (self.max_items - self.min_items + 1))
+            for num_items in range(self.min_items, self.max_items + 1)
+        ]
+
+    def get_refill_distribution(self, num_items: int, max_new_items: int) -> list[tuple[tuple[int, ...], float]]:
+        '''
+        Every count of added items of a player, in BugShotItem order, with
+        its probability, given num_items from get_num_items_distribution()
+        and room for max_new_items more on the board.
+        '''
+
+        return get_item_count_distribution(max(0, min(num_items, max_new_items)))
+
+    def __build_remains(self, num_items: int, rng: random.Random):
+        counts = [0] * len(ITEMS)
         for _ in range(num_items):
-            item = BugShotItem.random()
-            remains[item] += 1
-        
-        return remains
+            counts[rng.randrange(len(ITEMS))] += 1
+        return dict(zip(ITEMS, counts))
+
+class ReplayBugShotChamberInitializer(BugShotChamberInitializer):
+    '''
+    Hands out recorded chambers in order, for replaying a game.
+    '''
+
+    def __init__(self, chambers: Iterable[list[BugShotShell]] = ()):
+        self.__chambers = deque(chambers)
+
+    def push(self, chamber: list[BugShotShell]):
+        self.__chambers.append(chamber)
+
+    def initialize(self):
+        if len(self.__chambers) == 0:
+            raise ValueError('No recorded chamber left to replay.')
+        return list(self.__chambers.popleft())
+
+class ReplayBugShotItemBoardInitializer(BugShotItemBoardInitializer):
+    '''
+    Hands out recorded item boards in order, for replaying a game.
+
+    To replay a refill, record the items that were actually added: they fit
+    on the boards, so DefaultBugShotStateDispatcher adds all of them
+    whatever its shuffle does.
+    '''
+
+    def __init__(self, remains: Iterable[dict[BugShotPlayer, dict[BugShotItem, int]]] = ()):
+        self.__remains = deque(remains)
+
+    def push(self, remains: dict[BugShotPlayer, dict[BugShotItem, int]]):
+        self.__remains.append(remains)
+
+    def initialize(self) -> dict[BugShotPlayer, BugShotItemBoard]:
+        if len(self.__remains) == 0:
+            raise ValueError('No recorded item boards left to replay.')
+        remains = self.__remains.popleft()
+        return {
+            player: BugShotItemBoard(remains={item: remains[player][item] for item in BugShotItem})
+            for player in BugShotPlayer
+        }
+
+@functools.lru_cache(maxsize=None)
+def get_item_count_distribution(num_items: int) -> tuple[tuple[tuple[int, ...], float], ...]:
+    '''
+    Multinomial distribution of num_items independent uniform items: every
+    count of items, in BugShotItem order, with its probability.
+    '''
+
+    probabilities: dict[tuple[int, ...], float] = {(0,) * len(ITEMS): 1.0}
+    for _ in range(num_items):
+        next_probabilities = dict()
+        for counts, probability in probabilities.items():
+            for i in range(len(ITEMS)):
+                next_counts = counts[:i] + (counts[i] + 1,) + counts[i+1:]
+                next_probabilities[next_counts] = next_probabilities.get(next_counts, 0.0) + probability / len(ITEMS)
+        probabilities = next_probabilities
+    return tuple(probabilities.items())
+
+def _sample_item_board(board: BugShotItemBoard, num_items: int, rng: random.Random) -> BugShotItemBoard:
+    '''
+    Uniformly random num_items of the items on board, or all of them if there are not that many.
+    '''
+
+    num_left = board.get_num_items()
+    if num_left <= num_items:
+        return board
+
+    left = dict(board.remains)
+    remains = {item: 0 for item in ITEMS}
+    for _ in range(num_items):
+        index = rng.randrange(num_left)
+        for item in ITEMS:
+            index -= left[item]
+            if index < 0:
+                break
+        left[item] -= 1
+        remains[item] += 1
+        num_left -= 1
+    return BugShotItemBoard(remains=remains)
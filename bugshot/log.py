@@ -0,0 +1,457 @@
+import struct
+import bisect
+
+from collections.abc import Iterator, Sequence
+from typing import BinaryIO
+
+from .state import BugShotState, BugShotItemBoard
+from .enums import BugShotAction, BugShotItem, BugShotPlayer, BugShotShell
+from .game import BugShotGameConfig, BugShotGameRecorder
+from .dispatcher import DefaultBugShotStateDispatcher
+from .initializer import ReplayBugShotChamberInitializer, ReplayBugShotItemBoardInitializer
+
+LOG_MAGIC = b'BSGL'
+# Version 2 added checkpoints, version 3 str and negative or wide int seeds.
+LOG_VERSION = 3
+LOG_VERSIONS = (1, 2, 3)
+# magic, version
+LOG_PREFIX = struct.Struct('<4sH')
+# the 7 config fields, seed kind, seed length, then the seed as UTF-8 text
+LOG_HEADER = struct.Struct('<7BBH')
+# the 7 config fields, has seed, seed, in versions 1 and 2
+LOG_LEGACY_HEADER = struct.Struct('<7BBQ')
+
+LOG_SEED_NONE = 0
+LOG_SEED_INT = 1
+LOG_SEED_STR = 2
+LOG_MAX_SEED_LENGTH = 0xFFFF
+
+# init life, number of shells, live shell bits (bit i is chamber[i])
+LOG_GAME = struct.Struct('<BBQ')
+LOG_CHAMBER = struct.Struct('<BQ')
+LOG_ITEMS = struct.Struct(f'<{2 * len(BugShotItem)}B')
+# turn, number of shells, live shell bits, init life, lives, flags
+LOG_CHECKPOINT = struct.Struct('<BBQBbbB')
+
+# A step is one byte: the action index, with LOG_RELOAD_FLAG set when a
+# chamber and the items added to both boards follow.
+LOG_GAME_TAG = 0xF0
+LOG_CHECKPOINT_TAG = 0xF1
+LOG_RELOAD_FLAG = 0x80
+
+LOG_HANDCUFFED_FLAG = 1
+LOG_MAGNIFIED_FLAG = 2
+LOG_SAWED_FLAG = 4
+
+LOG_ACTIONS = list(BugShotAction)
+LOG_ACTION_ITEMS = {
+    BugShotAction.USE_HANDCUFFS: BugShotItem.HANDCUFFS,
+    BugShotAction.USE_BEER: BugShotItem.BEER,
+    BugShotAction.USE_MAGNIYING_GLASS: BugShotItem.MAGNIFYING_GLASS,
+    BugShotAction.USE_CIGARATTES: BugShotItem.CIGARATTES,
+    BugShotAction.USE_HAND_SAW: BugShotItem.HAND_SAW,
+}
+
+class BugShotGameLogStep:
+
+    __slots__ = ['action', 'chamber', 'added_items']
+
+    action: BugShotAction
+    # The chamber loaded after the action and the items added to each
+    # board, or None if the action did not empty the chamber.
+    chamber: list[BugShotShell]
+    added_items: dict[BugShotPlayer, dict[BugShotItem, int]]
+
+    def __init__(
+            self,
+            action: BugShotAction,
+            chamber: list[BugShotShell] = None,
+            added_items: dict[BugShotPlayer, dict[BugShotItem, int]] = None,
+        ):
+
+        self.action = action
+        self.chamber = chamber
+        self.added_items = added_items
+
+class BugShotGameLog:
+
+    initial_state: BugShotState
+    steps: list[BugShotGameLogStep]
+    # State after the first n steps, for the n a checkpoint was written at.
+    checkpoints: dict[int, BugShotState]
+
+    def __init__(
+            self,
+            initial_state: BugShotState,
+            steps: list[BugShotGameLogStep] = None,
+            checkpoints: dict[int, BugShotState] = None,
+        ):
+
+        self.initial_state = initial_state
+        self.steps = list() if steps is None else steps
+        self.checkpoints = dict() if checkpoints is None else checkpoints
+
+class BugShotGameReplay(Sequence):
+    '''
+    States of a logged game, indexed by step: replay[n] is the state after
+    the first n steps.
+
+    A state is rebuilt from the nearest checkpoint at or before its step,
+    feeding the recorded chambers and refills from there on to
+    DefaultBugShotStateDispatcher through the replay initializers.
+    '''
+
+    config: BugShotGameConfig
+    log: BugShotGameLog
+
+    def __init__(self, config: BugShotGameConfig, log: BugShotGameLog):
+        self.config = config
+        self.log = log
+        self.__checkpoint_steps = sorted(log.checkpoints)
+
+    def __len__(self) -> int:
+        return len(self.log.steps) + 1
+
+    def __getitem__(self, step: int) -> BugShotState:
+        if step < 0 or step >= len(self):
+            raise IndexError('Step out of range')
+
+        start = bisect.bisect_right(self.__checkpoint_steps, step)
+        start = self.__checkpoint_steps[start - 1] if start > 0 else 0
+        for state in self.iter_states(start, step + 1):
+            pass
+        return state
+
+    def __iter__(self) -> Iterator[BugShotState]:
+        return self.iter_states()
+
+    def iter_states(self, start: int = 0, stop: int = None) -> Iterator[BugShotState]:
+        '''
+        Yields the states from step start (which must be 0 or a checkpoint) up to stop.
+        '''
+
+        stop = len(self) if stop is None else stop
+        state = self.log.initial_state if start == 0 else self.log.checkpoints[start]
+        steps = self.log.steps[start:stop-1]
+
+        reloads = [step for step in steps if step.chamber is not None]
+        dispatcher = DefaultBugShotStateDispatcher(
+            chamber_initializer=ReplayBugShotChamberInitializer(step.chamber for step in reloads),
+            item_board_initializer=ReplayBugShotItemBoardInitializer(step.added_items for step in reloads),
+            max_num_items_per_board=self.config.max_items_per_board,
+        )
+
+        yield state
+        for step in steps:
+            state = dispatcher.dispatch(state, step.action)
+            yield state
+
+class BugShotGameLogWriter(BugShotGameRecorder):
+    '''
+    Appends games to a binary log as a BugShotGameRecorder.
+
+    The file starts with a header holding the config and the seed, an int
+    or a str like the seeds of BugShotGameBuilder.build(). Every
+    game is a start record with the initial chamber and item boards, then
+    one byte per applied action. Actions that empty the chamber are
+    followed by the new chamber and the items added to both boards.
+    Attach it with BugShotGame.set_recorder(). A game recorded from a state
+    a start record cannot describe, as when the recorder is attached
+    mid-game, also gets a checkpoint at step 0, which the reader takes as
+    its initial state.
+
+    With checkpoint_interval, the full state is also written after every
+    checkpoint_interval steps of a game, so BugShotGameReplay can start
+    close to any step.
+    '''
+
+    file: BinaryIO
+    config: BugShotGameConfig
+    checkpoint_interval: int
+
+    def __init__(self, file: BinaryIO, config: BugShotGameConfig, seed: int = None, checkpoint_interval: int = None):
+        self.file = file
+        self.config = config
+        self.checkpoint_interval = checkpoint_interval
+        self.__num_steps = 0
+        if file.tell() == 0:
+            seed_kind, seed_text = _encode_seed(seed)
+            file.write(LOG_PREFIX.pack(LOG_MAGIC, LOG_VERSION))
+            file.write(LOG_HEADER.pack(
+                config.min_items_per_init,
+                config.max_items_per_init,
+                config.max_items_per_board,
+                config.min_shell,
+                config.max_shell,
+                config.min_initial_life,
+                config.max_initial_life,
+                seed_kind,
+                len(seed_text),
+            ))
+            file.write(seed_text)
+
+    @staticmethod
+    def open(path: str, config: BugShotGameConfig, seed: int = None, checkpoint_interval: int = None) -> 'BugShotGameLogWriter':
+        '''
+        Opens path for appending; the header is only written to a new file.
+        '''
+
+        return BugShotGameLogWriter(open(path, 'ab'), config, seed, checkpoint_interval)
+
+    def record_reset(self, state: BugShotState):
+        self.__num_steps = 0
+        self.file.write(bytes([LOG_GAME_TAG]))
+        self.file.write(LOG_GAME.pack(state.init_life, *_encode_chamber(state.chamber)))
+        self.file.write(LOG_ITEMS.pack(*_encode_items(state.item_boards)))
+        if not _is_fresh(state):
+            self.__write_checkpoint(state)
+
+    def record_action(self, state: BugShotState, action: BugShotAction, next_state: BugShotState):
+        self.__write_step(state, action, next_state)
+
+        self.__num_steps += 1
+        if self.checkpoint_interval is not None and self.__num_steps % self.checkpoint_interval == 0:
+            self.__write_checkpoint(next_state)
+
+    def __write_step(self, state: BugShotState, action: BugShotAction, next_state: BugShotState):
+        code = LOG_ACTIONS.index(action)
+
+        # Popping a shell leaves chamber[:-1], anything else is a reload.
+        is_reload = next_state.chamber is not state.chamber and len(next_state.chamber) != len(state.chamber) - 1
+        if not is_reload:
+            self.file.write(bytes([code]))
+            return
+
+        used_item = LOG_ACTION_ITEMS.get(action)
+        added_items = {
+            player: {
+                item: next_state.item_boards[player].remains[item] - state.item_boards[player].remains[item]
+                    + (player == state.turn and item == used_item)
+                for item in BugShotItem
+            }
+            for player in BugShotPlayer
+        }
+        self.file.write(bytes([code | LOG_RELOAD_FLAG]))
+        self.file.write(LOG_CHAMBER.pack(*_encode_chamber(next_state.chamber)))
+        self.file.write(LOG_ITEMS.pack(*(
+            added_items[player][item]
+            for player in BugShotPlayer
+            for item in BugShotItem
+        )))
+
+    def __write_checkpoint(self, state: BugShotState):
+        flags = (
+            LOG_HANDCUFFED_FLAG * state.is_opponent_handcuffed
+            | LOG_MAGNIFIED_FLAG * state.is_magnified_shell
+            | LOG_SAWED_FLAG * state.is_shotgun_sawed
+        )
+        self.file.write(bytes([LOG_CHECKPOINT_TAG]))
+        self.file.write(LOG_CHECKPOINT.pack(
+            state.turn is BugShotPlayer.PLAYER2,
+            *_encode_chamber(state.chamber),
+            state.init_life,
+            state.life_dict[BugShotPlayer.PLAYER1],
+            state.life_dict[BugShotPlayer.PLAYER2],
+            flags,
+        ))
+        self.file.write(LOG_ITEMS.pack(*_encode_items(state.item_boards)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> 'BugShotGameLogWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class BugShotGameLogReader:
+    '''
+    Reads the games of a log written by BugShotGameLogWriter and rebuilds
+    their states through DefaultBugShotStateDispatcher.
+    '''
+
+    file: BinaryIO
+    config: BugShotGameConfig
+    seed: int
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+
+        magic, version = LOG_PREFIX.unpack(self.__read_header(LOG_PREFIX.size))
+        if magic != LOG_MAGIC or version not in LOG_VERSIONS:
+            raise ValueError('Not a game log.')
+
+        if version < 3:
+            *config, has_seed, seed = LOG_LEGACY_HEADER.unpack(self.__read_header(LOG_LEGACY_HEADER.size))
+            seed = seed if has_seed else None
+        else:
+            *config, seed_kind, seed_length = LOG_HEADER.unpack(self.__read_header(LOG_HEADER.size))
+            seed = _decode_seed(seed_kind, self.__read_header(seed_length))
+
+        self.config = BugShotGameConfig(*config)
+        self.seed = seed
+
+    @staticmethod
+    def open(path: str) -> 'BugShotGameLogReader':
+        return BugShotGameLogReader(open(path, 'rb'))
+
+    def iter_games(self) -> Iterator[BugShotGameLog]:
+        log = None
+        while True:
+            code = self.file.read(1)
+            if len(code) == 0:
+                break
+            code = code[0]
+
+            if code == LOG_GAME_TAG:
+                if log is not None:
+                    yield log
+                init_life, num_shells, bits = LOG_GAME.unpack(self.__read(LOG_GAME.size))
+                item_boards = _decode_items(LOG_ITEMS.unpack(self.__read(LOG_ITEMS.size)))
+                log = BugShotGameLog(BugShotState(
+                    turn=BugShotPlayer.PLAYER1,
+                    chamber=_decode_chamber(num_shells, bits),
+                    init_life=init_life,
+                    life_dict={player: init_life for player in BugShotPlayer},
+                    item_boards={player: BugShotItemBoard(remains=remains) for player, remains in item_boards.items()},
+                ))
+                continue
+
+            if log is None:
+                raise ValueError('Game log has a step before its first game.')
+
+            if code == LOG_CHECKPOINT_TAG:
+                checkpoint = self.__read_checkpoint()
+                if len(log.steps) == 0:
+                    log.initial_state = checkpoint
+                else:
+                    log.checkpoints[len(log.steps)] = checkpoint
+                continue
+
+            step = BugShotGameLogStep(LOG_ACTIONS[code & ~LOG_RELOAD_FLAG])
+            if code & LOG_RELOAD_FLAG:
+                step.chamber = _decode_chamber(*LOG_CHAMBER.unpack(self.__read(LOG_CHAMBER.size)))
+                step.added_items = _decode_items(LOG_ITEMS.unpack(self.__read(LOG_ITEMS.size)))
+            log.steps.append(step)
+
+        if log is not None:
+            yield log
+
+    def replay(self, log: BugShotGameLog) -> BugShotGameReplay:
+        return BugShotGameReplay(self.config, log)
+
+    def get_state(self, log: BugShotGameLog, step: int) -> BugShotState:
+        '''
+        Returns the state after the first step steps of log.
+        '''
+
+        return self.replay(log)[step]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> 'BugShotGameLogReader':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __read_checkpoint(self) -> BugShotState:
+        turn, num_shells, bits, init_life, life1, life2, flags = LOG_CHECKPOINT.unpack(self.__read(LOG_CHECKPOINT.size))
+        item_boards = _decode_items(LOG_ITEMS.unpack(self.__read(LOG_ITEMS.size)))
+        return BugShotState(
+            turn=BugShotPlayer.PLAYER2 if turn else BugShotPlayer.PLAYER1,
+            chamber=_decode_chamber(num_shells, bits),
+            init_life=init_life,
+            life_dict={
+                BugShotPlayer.PLAYER1: life1,
+                BugShotPlayer.PLAYER2: life2,
+            },
+            item_boards={player: BugShotItemBoard(remains=remains) for player, remains in item_boards.items()},
+            is_opponent_handcuffed=bool(flags & LOG_HANDCUFFED_FLAG),
+            is_magnified_shell=bool(flags & LOG_MAGNIFIED_FLAG),
+            is_shotgun_sawed=bool(flags & LOG_SAWED_FLAG),
+        )
+
+    def __read(self, size: int) -> bytes:
+        data = self.file.read(size)
+        if len(data) < size:
+            raise ValueError('Game log is truncated.')
+        return data
+
+    def __read_header(self, size: int) -> bytes:
+        data = self.file.read(size)
+        if len(data) < size:
+            raise ValueError('Not a game log: the header is truncated.')
+        return data
+
+def _is_fresh(state: BugShotState) -> bool:
+    '''
+    Whether state is what a start record alone decodes to.
+    '''
+
+    return (
+        state.turn is BugShotPlayer.PLAYER1
+        and all(life == state.init_life for life in state.life_dict.values())
+        and not state.is_opponent_handcuffed
+        and not state.is_magnified_shell
+        and not state.is_shotgun_sawed
+    )
+
+def _encode_chamber(chamber: list[BugShotShell]) -> tuple[int, int]:
+    bits = 0
+    for i, shell in enumerate(chamber):
+        if shell is BugShotShell.LIVE:
+            bits |= 1 << i
+    return len(chamber), bits
+
+def _decode_chamber(num_shells: int, bits: int) -> list[BugShotShell]:
+    return [
+        BugShotShell.LIVE if bits >> i & 1 else BugShotShell.BLANK
+        for i in range(num_shells)
+    ]
+
+def _encode_items(item_boards: dict[BugShotPlayer, BugShotItemBoard]) -> list[int]:
+    return [
+        item_boards[player].remains[item]
+        for player in BugShotPlayer
+        for item in BugShotItem
+    ]
+
+def _decode_items(values: tuple[int, ...]) -> dict[BugShotPlayer, dict[BugShotItem, int]]:
+    values = iter(values)
+    return {
+        player: {item: next(values) for item in BugShotItem}
+        for player in BugShotPlayer
+    }
+
+def _encode_seed(seed: int) -> tuple[int, bytes]:
+    '''
+    Returns the kind and the text of a seed for the header.
+    '''
+
+    if seed is None:
+        return LOG_SEED_NONE, b''
+    if isinstance(seed, int):
+        kind, text = LOG_SEED_INT, str(int(seed)).encode()
+    elif isinstance(seed, str):
+        kind, text = LOG_SEED_STR, seed.encode()
+    else:
+        raise ValueError(f'Seed of a game log should be an int or a str, got {type(seed).__name__}.')
+
+    if len(text) > LOG_MAX_SEED_LENGTH:
+        raise ValueError(f'Seed of a game log can be at most {LOG_MAX_SEED_LENGTH} bytes long.')
+    return kind, text
+
+def _decode_seed(kind: int, text: bytes) -> int:
+    if kind == LOG_SEED_NONE:
+        return None
+    if kind == LOG_SEED_INT:
+        return int(text.decode())
+    if kind == LOG_SEED_STR:
+        return text.decode()
+    raise ValueError(f'Unknown seed kind in a game log: {kind}.')
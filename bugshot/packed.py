@@ -0,0 +1,345 @@
+import random
+
+from .state import BugShotState, BugShotItemBoard
+from .enums import BugShotAction, BugShotShell, BugShotItem, BugShotPlayer
+from .initializer import BugShotChamberInitializer, BugShotItemBoardInitializer
+from .rng import DEFAULT_RNG
+from .dispatcher import ACTION_BITS, AVAILABLE_ACTIONS_BY_MASK
+
+# Bit layout of a packed state, from the least significant bit.
+#
+# The chamber is stored behind a sentinel bit: an empty chamber is 0b1, and
+# every shell pushed onto it shifts the field left by one. The top shell
+# (state.chamber[-1]) is therefore always bit 0, and popping it is a shift.
+CHAMBER_BITS = 32
+CHAMBER_MASK = (1 << CHAMBER_BITS) - 1
+MAX_CHAMBER_SIZE = CHAMBER_BITS - 1
+
+TURN_BIT = 1 << 32
+HANDCUFFED_BIT = 1 << 33
+MAGNIFIED_BIT = 1 << 34
+SAWED_BIT = 1 << 35
+
+LIFE_BITS = 5
+LIFE_MASK = (1 << LIFE_BITS) - 1
+# Lives are stored with a bias so that the negative lives left behind by a
+# sawed shotgun survive a round trip through pack/unpack.
+LIFE_BIAS = 2
+INIT_LIFE_SHIFT = 36
+LIFE1_SHIFT = 41
+LIFE2_SHIFT = 46
+LIFE_SHIFTS = {
+    BugShotPlayer.PLAYER1: LIFE1_SHIFT,
+    BugShotPlayer.PLAYER2: LIFE2_SHIFT,
+}
+
+ITEM_BITS = 4
+ITEM_MASK = (1 << ITEM_BITS) - 1
+MAX_ITEM_REMAINS = ITEM_MASK
+ITEM_BOARD1_SHIFT = 51
+ITEM_BOARD2_SHIFT = ITEM_BOARD1_SHIFT + ITEM_BITS * len(BugShotItem)
+ITEM_BOARD_SHIFTS = {
+    BugShotPlayer.PLAYER1: ITEM_BOARD1_SHIFT,
+    BugShotPlayer.PLAYER2: ITEM_BOARD2_SHIFT,
+}
+ITEM_OFFSETS = {
+    item: ITEM_BITS * i
+    for i, item in enumerate(BugShotItem)
+}
+# Enum hashing is slow enough to show up in rollouts, so the dispatcher uses
+# plain int offsets on its hot path.
+HANDCUFFS_OFFSET = ITEM_OFFSETS[BugShotItem.HANDCUFFS]
+BEER_OFFSET = ITEM_OFFSETS[BugShotItem.BEER]
+MAGNIFYING_GLASS_OFFSET = ITEM_OFFSETS[BugShotItem.MAGNIFYING_GLASS]
+CIGARATTES_OFFSET = ITEM_OFFSETS[BugShotItem.CIGARATTES]
+HAND_SAW_OFFSET = ITEM_OFFSETS[BugShotItem.HAND_SAW]
+
+SHOTGUN_ACTION_BITS = ACTION_BITS[BugShotAction.USE_SHOTGUN_SELF] | ACTION_BITS[BugShotAction.USE_SHOTGUN_OPPONENT]
+HANDCUFFS_ACTION_BIT = ACTION_BITS[BugShotAction.USE_HANDCUFFS]
+BEER_ACTION_BIT = ACTION_BITS[BugShotAction.USE_BEER]
+MAGNIFYING_GLASS_ACTION_BIT = ACTION_BITS[BugShotAction.USE_MAGNIYING_GLASS]
+CIGARATTES_ACTION_BIT = ACTION_BITS[BugShotAction.USE_CIGARATTES]
+HAND_SAW_ACTION_BIT = ACTION_BITS[BugShotAction.USE_HAND_SAW]
+
+class PackedBugShotState:
+    '''
+    Helpers to convert a BugShotState from/to a single int.
+
+    A packed state holds the turn, chamber, lives, item boards and flags of a
+    BugShotState, so transitions are a handful of bit operations instead of
+    a new object with copied dicts and lists.
+    '''
+
+    @staticmethod
+    def pack(state: BugShotState) -> int:
+        if len(state.chamber) > MAX_CHAMBER_SIZE:
+            raise ValueError(f'Chamber of a packed state can hold at most {MAX_CHAMBER_SIZE} shells.')
+
+        chamber = 1
+        for shell in state.chamber:
+            chamber = (chamber << 1) | (shell == BugShotShell.LIVE)
+
+        packed = chamber
+        if state.turn == BugShotPlayer.PLAYER2:
+            packed |= TURN_BIT
+        if state.is_opponent_handcuffed:
+            packed |= HANDCUFFED_BIT
+        if state.is_magnified_shell:
+            packed |= MAGNIFIED_BIT
+        if state.is_shotgun_sawed:
+            packed |= SAWED_BIT
+
+        packed |= PackedBugShotState.__check_field(state.init_life, 0, LIFE_MASK - LIFE_BIAS, 'Initial life') << INIT_LIFE_SHIFT
+        for player in BugShotPlayer:
+            life = PackedBugShotState.__check_field(state.life_dict[player] + LIFE_BIAS, 0, LIFE_MASK, 'Life')
+            packed |= life << LIFE_SHIFTS[player]
+
+            board_shift = ITEM_BOARD_SHIFTS[player]
+            for item, num in state.item_boards[player].remains.items():
+                num = PackedBugShotState.__check_field(num, 0, ITEM_MASK, 'Remains of an item')
+                packed |= num << (board_shift + ITEM_OFFSETS[item])
+
+        return packed
+
+    @staticmethod
+    def unpack(packed: int) -> BugShotState:
+        return BugShotState(
+            turn=PackedBugShotState.get_turn(packed),
+            chamber=PackedBugShotState.get_chamber(packed),
+            init_life=(packed >> INIT_LIFE_SHIFT) & LIFE_MASK,
+            life_dict={
+                player: PackedBugShotState.get_life(packed, player)
+                for player in BugShotPlayer
+            },
+            item_boards={
+                player: BugShotItemBoard(remains={
+                    item: PackedBugShotState.get_item_remains(packed, player, item)
+                    for item in BugShotItem
+                })
+                for player in BugShotPlayer
+            },
+            is_opponent_handcuffed=bool(packed & HANDCUFFED_BIT),
+            is_magnified_shell=bool(packed & MAGNIFIED_BIT),
+            is_shotgun_sawed=bool(packed & SAWED_BIT),
+        )
+
+    @staticmethod
+    def get_turn(packed: int) -> BugShotPlayer:
+        return BugShotPlayer.PLAYER2 if packed & TURN_BIT else BugShotPlayer.PLAYER1
+
+    @staticmethod
+    def get_chamber(packed: int) -> list[BugShotShell]:
+        chamber = packed & CHAMBER_MASK
+        num_shells = chamber.bit_length() - 1
+        return [
+            BugShotShell.LIVE if (chamber >> i) & 1 else BugShotShell.BLANK
+            for i in range(num_shells - 1, -1, -1)
+        ]
+
+    @staticmethod
+    def get_life(packed: int, player: BugShotPlayer) -> int:
+        return ((packed >> LIFE_SHIFTS[player]) & LIFE_MASK) - LIFE_BIAS
+
+    @staticmethod
+    def get_item_remains(packed: int, player: BugShotPlayer, item: BugShotItem) -> int:
+        return (packed >> (ITEM_BOARD_SHIFTS[player] + ITEM_OFFSETS[item])) & ITEM_MASK
+
+    @staticmethod
+    def __check_field(value: int, min_value: int, max_value: int, name: str) -> int:
+        if value < min_value or value > max_value:
+            raise ValueError(f'{name} of a packed state should be in [{min_value}, {max_value}], got {value}.')
+        return value
+
+class PackedBugShotStateDispatcher:
+    '''
+    Same rules as DefaultBugShotStateDispatcher, applied to packed states.
+
+    Given the same initializers and the same random sequence, dispatching a
+    packed state and unpacking it gives the same state as dispatching the
+    original BugShotState.
+    '''
+
+    chamber_initializer: BugShotChamberInitializer
+    item_board_initializer: BugShotItemBoardInitializer
+    max_num_items_per_board: int
+    rng: random.Random
+
+    def __init__(
+            self,
+            chamber_initializer: BugShotChamberInitializer,
+            item_board_initializer: BugShotItemBoardInitializer,
+            max_num_items_per_board: int = 8,
+            rng: random.Random = None,
+        ):
+
+        if max_num_items_per_board > MAX_ITEM_REMAINS:
+            raise ValueError(f'max_num_items_per_board must be less than or equal to {MAX_ITEM_REMAINS}')
+
+        self.chamber_initializer = chamber_initializer
+        self.item_board_initializer = item_board_initializer
+        self.max_num_items_per_board = max_num_items_per_board
+        self.rng = DEFAULT_RNG if rng is None else rng
+
+        self.__action_handlers = {
+            BugShotAction.USE_SHOTGUN_SELF: self._use_shotgun_self,
+            BugShotAction.USE_SHOTGUN_OPPONENT: self._use_shotgun_opponent,
+            BugShotAction.USE_HANDCUFFS: self._use_handcuffs,
+            BugShotAction.USE_BEER: self._use_beer,
+            BugShotAction.USE_MAGNIYING_GLASS: self._use_magnifying_glass,
+            BugShotAction.USE_CIGARATTES: self._use_cigarattes,
+            BugShotAction.USE_HAND_SAW: self._use_hand_saw,
+        }
+
+    def dispatch(self, state: int, action: BugShotAction) -> int:
+        if self.is_terminal(state):
+            return state
+
+        handler = self.__action_handlers.get(action)
+        if handler is None:
+            raise ValueError(f'Unknown action: {action}')
+
+        return self.__dispatch_common(handler(state))
+
+    def get_available_actions(self, state: int) -> list[BugShotAction]:
+        return list(AVAILABLE_ACTIONS_BY_MASK[self.get_action_mask(state)])
+
+    def get_action_mask(self, state: int) -> int:
+        board_shift = ITEM_BOARD2_SHIFT if state & TURN_BIT else ITEM_BOARD1_SHIFT
+        board = state >> board_shift
+
+        mask = SHOTGUN_ACTION_BITS
+        if (board >> HANDCUFFS_OFFSET) & ITEM_MASK and not state & HANDCUFFED_BIT:
+            mask |= HANDCUFFS_ACTION_BIT
+        if (board >> BEER_OFFSET) & ITEM_MASK:
+            mask |= BEER_ACTION_BIT
+        if (board >> MAGNIFYING_GLASS_OFFSET) & ITEM_MASK and not state & MAGNIFIED_BIT:
+            mask |= MAGNIFYING_GLASS_ACTION_BIT
+        if (board >> CIGARATTES_OFFSET) & ITEM_MASK:
+            mask |= CIGARATTES_ACTION_BIT
+        if (board >> HAND_SAW_OFFSET) & ITEM_MASK and not state & SAWED_BIT:
+            mask |= HAND_SAW_ACTION_BIT
+        return mask
+
+    def get_winner(self, state: int) -> BugShotPlayer:
+        if (state >> LIFE1_SHIFT) & LIFE_MASK <= LIFE_BIAS:
+            return BugShotPlayer.PLAYER2
+        if (state >> LIFE2_SHIFT) & LIFE_MASK <= LIFE_BIAS:
+            return BugShotPlayer.PLAYER1
+        return None
+
+    def is_terminal(self, state: int) -> bool:
+        return (
+            (state >> LIFE1_SHIFT) & LIFE_MASK <= LIFE_BIAS or
+            (state >> LIFE2_SHIFT) & LIFE_MASK <= LIFE_BIAS
+        )
+
+    def __dispatch_common(self, state: int) -> int:
+        if self.is_terminal(state):
+            return state
+
+        if state & CHAMBER_MASK == 1:
+            state = self.__set_chamber(state, self.chamber_initializer.initialize())
+            state = self.__add_items(state)
+
+        return state
+
+    def _use_shotgun_self(self, state: int) -> int:
+        return self.__use_shotgun(state, state & TURN_BIT)
+
+    def _use_shotgun_opponent(self, state: int) -> int:
+        return self.__use_shotgun(state, (state & TURN_BIT) ^ TURN_BIT)
+
+    def __use_shotgun(self, state: int, to_turn_bit: int) -> int:
+        damage = self.get_damage(state)
+
+        chamber = state & CHAMBER_MASK
+        state = (state ^ chamber) | (chamber >> 1)
+        state &= ~(MAGNIFIED_BIT | SAWED_BIT)
+
+        if damage > 0:
+            life_shift = LIFE2_SHIFT if to_turn_bit else LIFE1_SHIFT
+            state -= damage << life_shift
+
+        if to_turn_bit != state & TURN_BIT or damage > 0:
+            if state & HANDCUFFED_BIT:
+                return state ^ HANDCUFFED_BIT
+            return state ^ TURN_BIT
+
+        return state
+
+    def _use_handcuffs(self, state: int) -> int:
+        item_shift = self.__get_item_shift(state, HANDCUFFS_OFFSET)
+        if not (state >> item_shift) & ITEM_MASK:
+            return state
+        return (state - (1 << item_shift)) | HANDCUFFED_BIT
+
+    def _use_beer(self, state: int) -> int:
+        item_shift = self.__get_item_shift(state, BEER_OFFSET)
+        if not (state >> item_shift) & ITEM_MASK:
+            return state
+        state -= 1 << item_shift
+        chamber = state & CHAMBER_MASK
+        return (state ^ chamber) | (chamber >> 1)
+
+    def _use_magnifying_glass(self, state: int) -> int:
+        item_shift = self.__get_item_shift(state, MAGNIFYING_GLASS_OFFSET)
+        if not (state >> item_shift) & ITEM_MASK:
+            return state
+        return (state - (1 << item_shift)) | MAGNIFIED_BIT
+
+    def _use_cigarattes(self, state: int) -> int:
+        item_shift = self.__get_item_shift(state, CIGARATTES_OFFSET)
+        if not (state >> item_shift) & ITEM_MASK:
+            return state
+        state -= 1 << item_shift
+
+        life_shift = LIFE2_SHIFT if state & TURN_BIT else LIFE1_SHIFT
+        life = ((state >> life_shift) & LIFE_MASK) - LIFE_BIAS
+        if life < (state >> INIT_LIFE_SHIFT) & LIFE_MASK:
+            state += 1 << life_shift
+        return state
+
+    def _use_hand_saw(self, state: int) -> int:
+        item_shift = self.__get_item_shift(state, HAND_SAW_OFFSET)
+        if not (state >> item_shift) & ITEM_MASK:
+            return state
+        return (state - (1 << item_shift)) | SAWED_BIT
+
+    @staticmethod
+    def get_damage(state: int) -> int:
+        damage = state & 1
+        return damage << 1 if state & SAWED_BIT else damage
+
+    def __get_item_shift(self, state: int, item_offset: int) -> int:
+        board_shift = ITEM_BOARD2_SHIFT if state & TURN_BIT else ITEM_BOARD1_SHIFT
+        return board_shift + item_offset
+
+    def __set_chamber(self, state: int, chamber: list[BugShotShell]) -> int:
+        if len(chamber) > MAX_CHAMBER_SIZE:
+            raise ValueError(f'Chamber of a packed state can hold at most {MAX_CHAMBER_SIZE} shells.')
+
+        packed_chamber = 1
+        for shell in chamber:
+            packed_chamber = (packed_chamber << 1) | (shell == BugShotShell.LIVE)
+        return (state & ~CHAMBER_MASK) | packed_chamber
+
+    def __add_items(self, state: int) -> int:
+        added_boards = self.item_board_initializer.initialize_refill(
+            max_new_items={
+                player: self.max_num_items_per_board - self.__get_num_items(state, player)
+                for player in BugShotPlayer
+            },
+            rng=self.rng,
+        )
+        for player in BugShotPlayer:
+            board_shift = ITEM_BOARD_SHIFTS[player]
+            for item, num in added_boards[player].remains.items():
+                state += num << (board_shift + ITEM_OFFSETS[item])
+        return state
+
+    def __get_num_items(self, state: int, player: BugShotPlayer) -> int:
+        board_shift = ITEM_BOARD_SHIFTS[player]
+        return sum(
+            (state >> (board_shift + offset)) & ITEM_MASK
+            for offset in ITEM_OFFSETS.values()
+        )
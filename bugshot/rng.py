@@ -0,0 +1,58 @@
+import types
+import random
+
+# The generator shared by components that are not given their own rng. It is
+# separate from the random module's, so seed it with DEFAULT_RNG.seed().
+DEFAULT_RNG: random.Random = random.Random()
+
+def spawn_rngs(rng: random.Random, num: int) -> list[random.Random]:
+    '''
+    Derives num independent generators from rng.
+    '''
+
+    return [random.Random(rng.getrandbits(128)) for _ in range(num)]
+
+def reseed_rngs(root: object, seed: str, reseed_default: bool = False):
+    '''
+    Reseeds every random.Random held by root or its attributes, recursively,
+    with a stream derived from seed and the attribute path. DEFAULT_RNG is
+    shared by the whole process and left alone, unless reseed_default is
+    True, in which case it is reseeded with seed itself; only callers that
+    own the process, like pool workers, should ask for that.
+
+    Copies of a component in worker processes start from the same generator
+    state, so this is how workers get independent yet reproducible streams.
+    '''
+
+    if reseed_default:
+        DEFAULT_RNG.seed(seed)
+
+    visited = set()
+    stack = [(root, 'root')]
+    while len(stack) > 0:
+        obj, path = stack.pop()
+        if id(obj) in visited:
+            continue
+        visited.add(id(obj))
+
+        if isinstance(obj, random.Random):
+            if obj is not DEFAULT_RNG:
+                obj.seed(f'{seed}:{path}')
+            continue
+
+        for name, value in _get_attributes(obj):
+            if isinstance(value, random.Random) or _is_component(value):
+                stack.append((value, f'{path}.{name}'))
+
+def _is_component(value: object) -> bool:
+    if isinstance(value, (type, types.ModuleType)) or callable(value):
+        return False
+    return hasattr(value, '__dict__') or hasattr(type(value), '__slots__')
+
+def _get_attributes(obj: object) -> list[tuple[str, object]]:
+    attributes = list(getattr(obj, '__dict__', {}).items())
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(obj, name):
+                attributes.append((name, getattr(obj, name)))
+    return attributes
@@ -1,7 +1,12 @@
+import numpy as np
+
 from abc import ABCMeta, abstractmethod
+from collections.abc import Iterable
 
 from .state import BugShotState, BugShotItemBoard
-from .enums import BugShotShell, BugShotPlayer, BugShotItem
+from .enums import BugShotShell, BugShotPlayer, ITEMS
+
+OBSERVATION_SIZE = 9 + 2 * len(ITEMS)
 
 class BugShotStateSelector(metaclass=ABCMeta):
     
@@ -17,8 +22,8 @@ class DefaultBugShotStateSelector(BugShotStateSelector):
         self.player = player
     
     def select(self, state: BugShotState) -> list[int]:
-        num_live_shells = len([shell for shell in state.chamber if shell == BugShotShell.LIVE])
-        num_blank_shells = len([shell for shell in state.chamber if shell == BugShotShell.BLANK])
+        num_live_shells = state.chamber.count(BugShotShell.LIVE)
+        num_blank_shells = len(state.chamber) - num_live_shells
         init_life = state.init_life
         life_player1 = state.life_dict[BugShotPlayer.PLAYER1]
         life_player2 = state.life_dict[BugShotPlayer.PLAYER2]
@@ -48,4 +53,147 @@ class DefaultBugShotStateSelector(BugShotStateSelector):
         ]
     
     def __serialize_items(self, item_board: BugShotItemBoard) -> list[int]:
-        return [item_board.remains[item] for item in BugShotItem]
+        remains = item_board.remains
+        # Boards built by the initializers keep BugShotItem order, which
+        # saves hashing every item.
+        if tuple(remains) == ITEMS:
+            return list(remains.values())
+        return [remains[item] for item in ITEMS]
+
+class ArrayBugShotStateSelector(DefaultBugShotStateSelector):
+    '''
+    Writes observations into NumPy buffers with a fixed dtype.
+
+    Layouts:
+    - 'raw': the entries of DefaultBugShotStateSelector.select.
+    - 'normalized': the same entries divided by max_shell, max_life or
+      max_items, as float32 by default.
+    - 'one_hot': every entry one-hot encoded, with shells in [0, max_shell],
+      lives in [0, max_life], items in [0, max_items] and flags in [0, 1].
+      Entries out of range are clipped.
+
+    select_into() fills a caller-supplied row and select_batch() a
+    preallocated (len(states), size) batch, so nothing is allocated per
+    observation.
+    '''
+
+    layout: str
+    dtype: np.dtype
+    size: int
+
+    def __init__(
+            self,
+            player: BugShotPlayer,
+            layout: str = 'raw',
+            dtype: np.dtype = None,
+            max_shell: int = 8,
+            max_life: int = 4,
+            max_items: int = 8,
+        ):
+
+        super().__init__(player)
+
+        bounds = get_observation_bounds(max_shell, max_life, max_items)
+
+        if layout == 'raw':
+            self.dtype = np.dtype(np.int32 if dtype is None else dtype)
+            self.size = OBSERVATION_SIZE
+        elif layout == 'normalized':
+            self.dtype = np.dtype(np.float32 if dtype is None else dtype)
+            self.size = OBSERVATION_SIZE
+            self.__scales = (1 / bounds).astype(self.dtype)
+        elif layout == 'one_hot':
+            self.dtype = np.dtype(np.float32 if dtype is None else dtype)
+            self.size = int((bounds + 1).sum())
+            self.__bounds = bounds
+            self.__offsets = np.concatenate([[0], np.cumsum(bounds + 1)[:-1]])
+            self.__values = np.empty(OBSERVATION_SIZE, dtype=np.int64)
+        else:
+            raise ValueError(f'Unknown layout: {layout}')
+
+        self.layout = layout
+
+    def select(self, state: BugShotState) -> np.ndarray:
+        return self.select_into(state, np.empty(self.size, dtype=self.dtype))
+
+    def select_into(self, state: BugShotState, out: np.ndarray) -> np.ndarray:
+        '''
+        Writes the observation of state into the 1-D buffer out and returns it.
+        '''
+
+        if self.layout == 'raw':
+            self.__write_values(state, out)
+        elif self.layout == 'normalized':
+            self.__write_values(state, out)
+            np.multiply(out, self.__scales, out=out)
+        else:
+            values = self.__values
+            self.__write_values(state, values)
+            np.clip(values, 0, self.__bounds, out=values)
+            values += self.__offsets
+            out.fill(0)
+            out[values] = 1
+        return out
+
+    def select_batch(self, states: Iterable[BugShotState], out: np.ndarray = None) -> np.ndarray:
+        '''
+        Writes one row per state into out, allocating it if it is not given.
+        out may have more rows than there are states; the filled ones are
+        returned.
+        '''
+
+        states = list(states)
+        if out is None:
+            out = np.empty((len(states), self.size), dtype=self.dtype)
+        elif out.ndim != 2 or out.shape[0] < len(states) or out.shape[1] != self.size:
+            raise ValueError(f'out should have at least {len(states)} rows of size {self.size}, got shape {out.shape}.')
+        for row, state in zip(out, states):
+            self.select_into(state, row)
+        return out[:len(states)]
+
+    def __write_values(self, state: BugShotState, out: np.ndarray):
+        '''
+        Writes the entries of DefaultBugShotStateSelector.select into out.
+        '''
+
+        chamber = state.chamber
+        num_live_shells = chamber.count(BugShotShell.LIVE)
+        me = self.player
+        opponent = me.opponent()
+        out[:5] = (
+            num_live_shells,
+            len(chamber) - num_live_shells,
+            state.init_life,
+            state.life_dict[me],
+            state.life_dict[opponent],
+        )
+
+        items = 5 + len(ITEMS)
+        flags = 5 + 2 * len(ITEMS)
+        out[5:items] = self.__get_items(state.item_boards[me])
+        out[items:flags] = self.__get_items(state.item_boards[opponent])
+
+        is_magnified_live = state.is_magnified_shell and chamber[-1] is BugShotShell.LIVE
+        out[flags:] = (
+            state.is_opponent_handcuffed,
+            is_magnified_live,
+            state.is_magnified_shell and not is_magnified_live,
+            state.is_shotgun_sawed,
+        )
+
+    def __get_items(self, item_board: BugShotItemBoard) -> tuple[int, ...]:
+        remains = item_board.remains
+        # Same shortcut as DefaultBugShotStateSelector for boards in BugShotItem order.
+        if tuple(remains) == ITEMS:
+            return tuple(remains.values())
+        return tuple(remains[item] for item in ITEMS)
+
+def get_observation_bounds(max_shell: int = 8, max_life: int = 4, max_items: int = 8) -> np.ndarray:
+    '''
+    Upper bound of every observation entry, in the order of DefaultBugShotStateSelector.select.
+    '''
+
+    return np.array(
+        [max_shell] * 2 + [max_life] * 3 + [max_items] * (2 * len(ITEMS)) + [1] * 4,
+        dtype=np.int64,
+    )
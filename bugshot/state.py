@@ -36,6 +36,8 @@ class BugShotState:
         'is_opponent_handcuffed',
         'is_magnified_shell',
         'is_shotgun_sawed',
+        'cached_winner',
+        'cached_action_mask',
     ]
 
     turn: BugShotPlayer
@@ -48,6 +50,11 @@ class BugShotState:
     is_magnified_shell: bool
     is_shotgun_sawed: bool
 
+    # Filled in by the dispatcher the first time it looks at the state.
+    # States never change after construction, so these stay valid.
+    cached_winner: BugShotPlayer
+    cached_action_mask: int
+
     def __init__(
             self, 
             turn: BugShotPlayer,
@@ -69,6 +76,9 @@ class BugShotState:
         self.is_opponent_handcuffed = is_opponent_handcuffed
         self.is_magnified_shell = is_magnified_shell
         self.is_shotgun_sawed = is_shotgun_sawed
+
+        self.cached_winner = None
+        self.cached_action_mask = None
     
     def print(self, indent: int = 0):
         indent_str = ' ' * indent
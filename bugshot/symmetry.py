@@ -0,0 +1,138 @@
+from collections.abc import Iterable
+
+from .state import BugShotState
+from .enums import BugShotShell, ITEMS
+
+# Bit layout of a canonical key, from the least significant bit. Fields are
+# relative to the player to move, and the chamber is reduced to what that
+# player knows: the shell counts and the magnified top shell, if any.
+CANONICAL_SHELL_BITS = 5
+CANONICAL_LIFE_BITS = 5
+CANONICAL_ITEM_BITS = 4
+# Lives are stored with a bias, like in a packed state, so that the
+# negative lives left behind by a sawed shotgun keep distinct keys.
+CANONICAL_LIFE_BIAS = 2
+
+CANONICAL_NUM_LIVE_SHIFT = 0
+CANONICAL_NUM_BLANK_SHIFT = CANONICAL_NUM_LIVE_SHIFT + CANONICAL_SHELL_BITS
+CANONICAL_TOP_SHIFT = CANONICAL_NUM_BLANK_SHIFT + CANONICAL_SHELL_BITS
+CANONICAL_INIT_LIFE_SHIFT = CANONICAL_TOP_SHIFT + 2
+CANONICAL_LIFE_ME_SHIFT = CANONICAL_INIT_LIFE_SHIFT + CANONICAL_LIFE_BITS
+CANONICAL_LIFE_OPPONENT_SHIFT = CANONICAL_LIFE_ME_SHIFT + CANONICAL_LIFE_BITS
+CANONICAL_ITEMS_ME_SHIFT = CANONICAL_LIFE_OPPONENT_SHIFT + CANONICAL_LIFE_BITS
+CANONICAL_ITEMS_OPPONENT_SHIFT = CANONICAL_ITEMS_ME_SHIFT + CANONICAL_ITEM_BITS * len(ITEMS)
+CANONICAL_HANDCUFFED_SHIFT = CANONICAL_ITEMS_OPPONENT_SHIFT + CANONICAL_ITEM_BITS * len(ITEMS)
+CANONICAL_SAWED_SHIFT = CANONICAL_HANDCUFFED_SHIFT + 1
+
+CANONICAL_TOP_UNKNOWN = 0
+CANONICAL_TOP_LIVE = 1
+CANONICAL_TOP_BLANK = 2
+
+def get_canonical_key(state: BugShotState) -> int:
+    '''
+    Key of state as seen by the player to move.
+
+    A state and its mirror image with the players swapped get the same key,
+    and so do states whose chambers differ only in the order of the shells
+    the player to move cannot see. Statistics kept under a key should
+    therefore be from the point of view of the player to move.
+    '''
+
+    me = state.turn
+    opponent = me.opponent()
+    chamber = state.chamber
+    num_live = chamber.count(BugShotShell.LIVE)
+
+    top = CANONICAL_TOP_UNKNOWN
+    if state.is_magnified_shell:
+        top = CANONICAL_TOP_LIVE if chamber[-1] == BugShotShell.LIVE else CANONICAL_TOP_BLANK
+
+    return _build_key(
+        num_live,
+        len(chamber) - num_live,
+        top,
+        state.init_life,
+        state.life_dict[me],
+        state.life_dict[opponent],
+        _pack_items(state.item_boards[me].remains[item] for item in ITEMS),
+        _pack_items(state.item_boards[opponent].remains[item] for item in ITEMS),
+        state.is_opponent_handcuffed,
+        state.is_shotgun_sawed,
+    )
+
+def get_canonical_observation_key(observation: list[int]) -> int:
+    '''
+    get_canonical_key() of the states behind an observation of the player
+    to move, in the layout of DefaultBugShotStateSelector.select.
+    '''
+
+    items_me = _pack_items(observation[5:5 + len(ITEMS)])
+    items_opponent = _pack_items(observation[5 + len(ITEMS):5 + 2 * len(ITEMS)])
+
+    flags = 5 + 2 * len(ITEMS)
+    top = CANONICAL_TOP_UNKNOWN
+    if observation[flags + 1]:
+        top = CANONICAL_TOP_LIVE
+    elif observation[flags + 2]:
+        top = CANONICAL_TOP_BLANK
+
+    return _build_key(
+        observation[0],
+        observation[1],
+        top,
+        observation[2],
+        observation[3],
+        observation[4],
+        items_me,
+        items_opponent,
+        observation[flags],
+        observation[flags + 3],
+    )
+
+def _pack_items(counts: Iterable[int]) -> int:
+    '''
+    Packs the remaining counts of every item, in the order of ITEMS.
+    '''
+
+    packed = 0
+    for i, count in enumerate(counts):
+        packed |= _check_field(count, CANONICAL_ITEM_BITS, 'Item count') << (CANONICAL_ITEM_BITS * i)
+    return packed
+
+def _check_field(value: int, num_bits: int, name: str, bias: int = 0) -> int:
+    '''
+    Returns value + bias, or raises ValueError if it does not fit in num_bits
+    bits, as it would otherwise spill into the neighbouring fields of a key.
+    '''
+
+    biased = value + bias
+    if biased < 0 or biased >= 1 << num_bits:
+        raise ValueError(
+            f'{name} of a canonical key should be in [{-bias}, {(1 << num_bits) - 1 - bias}], got {value}.'
+        )
+    return biased
+
+def _build_key(
+        num_live: int,
+        num_blank: int,
+        top: int,
+        init_life: int,
+        life_me: int,
+        life_opponent: int,
+        items_me: int,
+        items_opponent: int,
+        is_opponent_handcuffed: bool,
+        is_shotgun_sawed: bool,
+    ) -> int:
+    return (
+        (_check_field(num_live, CANONICAL_SHELL_BITS, 'Number of live shells') << CANONICAL_NUM_LIVE_SHIFT)
+        | (_check_field(num_blank, CANONICAL_SHELL_BITS, 'Number of blank shells') << CANONICAL_NUM_BLANK_SHIFT)
+        | (top << CANONICAL_TOP_SHIFT)
+        | (_check_field(init_life, CANONICAL_LIFE_BITS, 'Initial life') << CANONICAL_INIT_LIFE_SHIFT)
+        | (_check_field(life_me, CANONICAL_LIFE_BITS, 'Life', CANONICAL_LIFE_BIAS) << CANONICAL_LIFE_ME_SHIFT)
+        | (_check_field(life_opponent, CANONICAL_LIFE_BITS, 'Life', CANONICAL_LIFE_BIAS) << CANONICAL_LIFE_OPPONENT_SHIFT)
+        | (items_me << CANONICAL_ITEMS_ME_SHIFT)
+        | (items_opponent << CANONICAL_ITEMS_OPPONENT_SHIFT)
+        | (_check_field(int(is_opponent_handcuffed), 1, 'Handcuffed flag') << CANONICAL_HANDCUFFED_SHIFT)
+        | (_check_field(int(is_shotgun_sawed), 1, 'Sawed flag') << CANONICAL_SAWED_SHIFT)
+    )
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import glob
+import shutil
+import argparse
+
+from bugshot import COMPILED_MODULES
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BUILD_DIR = os.path.join(ROOT, 'build')
+
+# Plain Python semantics: annotations are not taken as C types, so the
+# compiled modules accept exactly what the sources accept.
+COMPILER_DIRECTIVES = {
+    'language_level': 3,
+    'annotation_typing': False,
+    'binding': True,
+}
+
+def build():
+    '''
+    Compiles COMPILED_MODULES with Cython, next to their sources.
+    '''
+
+    from Cython.Build import cythonize
+    from setuptools import Distribution, Extension
+
+    extensions = cythonize(
+        [
+            Extension(f'bugshot.{name}', [os.path.join('bugshot', f'{name}.py')])
+            for name in COMPILED_MODULES
+        ],
+        compiler_directives=COMPILER_DIRECTIVES,
+        build_dir=BUILD_DIR,
+        quiet=True,
+    )
+
+    distribution = Distribution({'ext_modules': extensions, 'script_name': 'build.py'})
+    command = distribution.get_command_obj('build_ext')
+    command.inplace = True
+    command.build_temp = os.path.join(BUILD_DIR, 'temp')
+    distribution.run_command('build_ext')
+
+def clean():
+    '''
+    Removes the compiled modules, so the sources are imported again.
+    '''
+
+    for name in COMPILED_MODULES:
+        for path in glob.glob(os.path.join(ROOT, 'bugshot', f'{name}.*.so')) + glob.glob(os.path.join(ROOT, 'bugshot', f'{name}.*.pyd')):
+            os.remove(path)
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Optional compiled build of the bugshot rules engine.')
+    parser.add_argument('--clean', action='store_true', help='remove the compiled build instead')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if args.clean:
+        clean()
+        return
+
+    try:
+        build()
+    except ImportError as e:
+        print(f'The compiled build needs Cython and setuptools: {e}')
+        sys.exit(1)
+    print(f'Compiled {", ".join(COMPILED_MODULES)}. Check them with parity.py.')
+
+if __name__ == '__main__':
+    main()
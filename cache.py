@@ -0,0 +1,245 @@
+import multiprocessing
+
+from collections import OrderedDict
+from collections.abc import Hashable
+from abc import ABCMeta, abstractmethod
+
+from bugshot import (
+    BugShotAction,
+    BugShotState,
+    get_canonical_key,
+    get_canonical_observation_key,
+)
+
+ACTIONS = list(BugShotAction)
+ACTION_INDICES = {action: i for i, action in enumerate(ACTIONS)}
+
+KEY_HASH_BITS = 64
+KEY_HASH_MASK = (1 << KEY_HASH_BITS) - 1
+# Odd 64-bit multipliers for mixing wide int keys: 2**64 / golden ratio for
+# the slot hash, and an unrelated one for the check hash.
+KEY_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+KEY_CHECK_MULTIPLIER = 0xC2B2AE3D27D4EB4F
+# Mixed into the check hash of keys that are not non-negative ints.
+KEY_CHECK_SALT = 0x5BD1E995
+
+class BugShotRolloutCache(metaclass=ABCMeta):
+    '''
+    Bounded map from a state key to per-action rollout statistics.
+
+    Statistics are two lists indexed like BugShotAction: the wins of the
+    player to move after taking the action, and the number of rollouts that
+    took it. update() adds to them, so several writers can share a cache.
+    Keys come from get_state_key() for states and get_observation_key() for
+    what the player to move sees. Both are canonical, so mirrored states and
+    states that differ only in hidden shell order share statistics, and an
+    agent and an explorer can share a cache; the agent then leaves recording
+    its rollouts to the explorer.
+
+    A cache is shared rather than copied, so an agent deep-copied for the
+    other seat keeps writing to the same statistics.
+    '''
+
+    num_hits: int
+    num_misses: int
+
+    def __init__(self):
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @abstractmethod
+    def get(self, key: Hashable) -> tuple[list[int], list[int]]:
+        '''
+        Returns (wins, visits) of key, or None if it is not cached.
+        '''
+
+        raise NotImplementedError()
+
+    @abstractmethod
+    def update(self, key: Hashable, wins: list[int], visits: list[int]):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError()
+
+    def record(self, key: Hashable, action: BugShotAction, is_win: bool):
+        wins = [0] * len(ACTIONS)
+        visits = [0] * len(ACTIONS)
+        index = ACTION_INDICES[action]
+        wins[index] = int(is_win)
+        visits[index] = 1
+        self.update(key, wins, visits)
+
+    def get_hit_rate(self) -> float:
+        num_lookups = self.num_hits + self.num_misses
+        return self.num_hits / num_lookups if num_lookups > 0 else 0.0
+
+    def __deepcopy__(self, memo: dict) -> 'BugShotRolloutCache':
+        return self
+
+class LRUBugShotRolloutCache(BugShotRolloutCache):
+    '''
+    In-process cache holding the max_entries most recently used keys.
+    '''
+
+    max_entries: int
+
+    def __init__(self, max_entries: int = 100000):
+        super().__init__()
+        self.max_entries = max_entries
+        self.__entries: OrderedDict[Hashable, tuple[list[int], list[int]]] = OrderedDict()
+
+    def get(self, key: Hashable) -> tuple[list[int], list[int]]:
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.num_misses += 1
+            return None
+        self.num_hits += 1
+        self.__entries.move_to_end(key)
+        return list(entry[0]), list(entry[1])
+
+    def update(self, key: Hashable, wins: list[int], visits: list[int]):
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.__entries[key] = (list(wins), list(visits))
+            if len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+            return
+
+        self.__entries.move_to_end(key)
+        entry_wins, entry_visits = entry
+        for i in range(len(ACTIONS)):
+            entry_wins[i] += wins[i]
+            entry_visits[i] += visits[i]
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+class SharedBugShotRolloutCache(BugShotRolloutCache):
+    '''
+    Fixed-size cache in shared memory, for agents in worker processes.
+
+    Slots are grouped into sets of ways slots, and a key can only live in
+    the set its hash picks; a new key takes the least recently used slot of
+    its set. A slot holds two independent 64-bit hashes of its key, the one
+    that picks the set and a check hash, so keys whose hashes collide keep
+    separate statistics in all but astronomically rare cases. Keys need a
+    hash that is the same in every process, like ints and tuples of ints.
+
+    The shared arrays are inherited, so the cache has to be handed to the
+    workers when they start, e.g. in the initializer arguments of a pool.
+    The hit and miss counts are kept per process.
+    '''
+
+    num_sets: int
+    ways: int
+
+    def __init__(self, num_entries: int = 65536, ways: int = 4):
+        super().__init__()
+        self.num_sets = max(1, num_entries // ways)
+        self.ways = ways
+
+        num_slots = self.num_sets * ways
+        self.__keys = multiprocessing.RawArray('q', num_slots)
+        self.__checks = multiprocessing.RawArray('q', num_slots)
+        self.__ticks = multiprocessing.RawArray('q', num_slots)
+        # wins of every action, then visits of every action
+        self.__stats = multiprocessing.RawArray('q', num_slots * 2 * len(ACTIONS))
+        self.__tick = multiprocessing.RawValue('q', 0)
+        self.__lock = multiprocessing.Lock()
+
+    def get(self, key: Hashable) -> tuple[list[int], list[int]]:
+        key_hash, check_hash = SharedBugShotRolloutCache.__hash_key(key)
+        with self.__lock:
+            slot = self.__find_slot(key_hash, check_hash)
+            if slot is None:
+                self.num_misses += 1
+                return None
+            self.num_hits += 1
+            self.__touch(slot)
+            offset = slot * 2 * len(ACTIONS)
+            return (
+                self.__stats[offset:offset+len(ACTIONS)],
+                self.__stats[offset+len(ACTIONS):offset+2*len(ACTIONS)],
+            )
+
+    def update(self, key: Hashable, wins: list[int], visits: list[int]):
+        key_hash, check_hash = SharedBugShotRolloutCache.__hash_key(key)
+        with self.__lock:
+            slot = self.__find_slot(key_hash, check_hash)
+            if slot is None:
+                slot = self.__evict_slot(key_hash, check_hash)
+            self.__touch(slot)
+            offset = slot * 2 * len(ACTIONS)
+            stats = self.__stats
+            for i in range(len(ACTIONS)):
+                stats[offset+i] += wins[i]
+                stats[offset+len(ACTIONS)+i] += visits[i]
+
+    def __len__(self) -> int:
+        return sum(1 for key_hash in self.__keys if key_hash != 0)
+
+    def __find_slot(self, key_hash: int, check_hash: int) -> int:
+        start = (key_hash % self.num_sets) * self.ways
+        for slot in range(start, start + self.ways):
+            if self.__keys[slot] == key_hash and self.__checks[slot] == check_hash:
+                return slot
+        return None
+
+    def __evict_slot(self, key_hash: int, check_hash: int) -> int:
+        start = (key_hash % self.num_sets) * self.ways
+        slot = min(range(start, start + self.ways), key=self.__ticks.__getitem__)
+        self.__keys[slot] = key_hash
+        self.__checks[slot] = check_hash
+        offset = slot * 2 * len(ACTIONS)
+        self.__stats[offset:offset+2*len(ACTIONS)] = [0] * (2 * len(ACTIONS))
+        return slot
+
+    def __touch(self, slot: int):
+        self.__tick.value += 1
+        self.__ticks[slot] = self.__tick.value
+
+    @staticmethod
+    def __hash_key(key: Hashable) -> tuple[int, int]:
+        '''
+        Returns the slot hash, never 0 as that marks an empty slot, and the
+        check hash of key, both as signed 64-bit ints.
+        '''
+
+        if isinstance(key, int) and key >= 0:
+            # hash() of an int is the int modulo 2**61 - 1, which would fold
+            # the fields of wide keys like canonical ones onto each other.
+            key_hash = _mix_int_key(key, KEY_HASH_MULTIPLIER)
+            check_hash = _mix_int_key(key, KEY_CHECK_MULTIPLIER)
+        else:
+            key_hash = hash(key)
+            check_hash = hash((KEY_CHECK_SALT, key))
+        return key_hash or 1, check_hash
+
+def get_state_key(state: BugShotState) -> int:
+    '''
+    Canonical key of a state, see get_canonical_key().
+    '''
+
+    return get_canonical_key(state)
+
+def get_observation_key(observation: list[int]) -> int:
+    '''
+    Canonical key of an observation of the player to move, the same as
+    get_state_key() of any state behind it.
+    '''
+
+    return get_canonical_observation_key(observation)
+
+def _mix_int_key(key: int, multiplier: int) -> int:
+    '''
+    64-bit hash of a non-negative int of any width, as a signed int.
+    '''
+
+    key_hash = 0
+    while key > 0:
+        key_hash = ((key_hash ^ (key & KEY_HASH_MASK)) * multiplier) & KEY_HASH_MASK
+        key_hash ^= key_hash >> 29
+        key >>= KEY_HASH_BITS
+    return key_hash - ((key_hash >> (KEY_HASH_BITS - 1)) << KEY_HASH_BITS)
@@ -1,6 +1,10 @@
+import math
 import random
+import functools
 import itertools
 
+from collections.abc import Sequence
+
 from abc import ABCMeta, abstractmethod
 
 from bugshot import (
@@ -9,8 +13,12 @@ from bugshot import (
     BugShotItem,
     BugShotPlayer,
     BugShotShell,
+    DEFAULT_RNG,
 )
 
+MAGNIFIED_LIVE_OFFSET = 5 + 2 * len(BugShotItem) + 1
+MAGNIFIED_BLANK_OFFSET = 5 + 2 * len(BugShotItem) + 2
+
 class BugShotStateDecoder(metaclass=ABCMeta):
     
     @abstractmethod
@@ -20,6 +28,16 @@ class BugShotStateDecoder(metaclass=ABCMeta):
 class AbstractBugShotStateDecoder(BugShotStateDecoder):
 
     def decode(self, observation: list[int]) -> list[BugShotState]:
+        base, num_live_shells, num_blank_shells, is_magnified_live, is_magnified_blank = self._decode_base(observation)
+        chambers = self._build_chambers(num_live_shells, num_blank_shells, is_magnified_live, is_magnified_blank)
+        return [base.set_chamber(chamber=chamber) for chamber in chambers]
+
+    def _decode_base(self, observation: list[int]) -> tuple[BugShotState, int, int, int, int]:
+        '''
+        Decodes everything but the chamber, which is left empty.
+        Returns the state and (num_live, num_blank, is_magnified_live, is_magnified_blank).
+        '''
+
         num_live_shells = observation[0]
         num_blank_shells = observation[1]
         init_life = observation[2]
@@ -32,8 +50,6 @@ class AbstractBugShotStateDecoder(BugShotStateDecoder):
         is_magnified_blank = observation[5+2*len(BugShotItem)+2]
         is_shotgun_sawed = observation[5+2*len(BugShotItem)+3]
 
-        chambers = self._build_chambers(num_live_shells, num_blank_shells, is_magnified_live, is_magnified_blank)
-
         base = BugShotState(
             turn=BugShotPlayer.PLAYER1,
             chamber=[],
@@ -51,7 +67,7 @@ class AbstractBugShotStateDecoder(BugShotStateDecoder):
             is_shotgun_sawed=is_shotgun_sawed,
         )
 
-        return [base.set_chamber(chamber=chamber) for chamber in chambers]
+        return base, num_live_shells, num_blank_shells, is_magnified_live, is_magnified_blank
     
     @abstractmethod
     def _build_chambers(self, num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int) -> list[list[BugShotShell]]:
@@ -66,16 +82,18 @@ class AbstractBugShotStateDecoder(BugShotStateDecoder):
 class RandomBugShotStateDecoder(AbstractBugShotStateDecoder):
     
     size: int
+    rng: random.Random
 
-    def __init__(self, size: int = 1):
+    def __init__(self, size: int = 1, rng: random.Random = None):
         self.size = size
+        self.rng = DEFAULT_RNG if rng is None else rng
     
     def _build_chambers(self, num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int) -> list[list[BugShotShell]]:
         return [self.__build_chamber(num_live, num_blank, is_magnified_live, is_magnified_blank) for _ in range(self.size)]
 
     def __build_chamber(self, num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int) -> list[BugShotShell]:
         chamber = [BugShotShell.LIVE] * (num_live - is_magnified_live) + [BugShotShell.BLANK] * (num_blank - is_magnified_blank)
-        random.shuffle(chamber)
+        self.rng.shuffle(chamber)
 
         if is_magnified_live:
             chamber.append(BugShotShell.LIVE)
@@ -84,21 +102,239 @@ class RandomBugShotStateDecoder(AbstractBugShotStateDecoder):
         
         return chamber
 
+class BugShotChamberDistribution(Sequence):
+    '''
+    Every distinct chamber with num_live live and num_blank blank hidden shells,
+    all equally likely, with the magnified shell (if any) on top.
+
+    Chambers are built on access, so holding the distribution costs nothing
+    no matter how many arrangements it covers. If there are at most
+    max_table_size of them, they are built once up front instead, and
+    indexing and sample() return the stored chambers, which are shared and
+    must not be modified.
+    '''
+
+    num_live: int
+    num_blank: int
+    top_shell: BugShotShell
+
+    def __init__(self, num_live: int, num_blank: int, top_shell: BugShotShell = None, max_table_size: int = 0):
+        if num_live < 0 or num_blank < 0:
+            raise ValueError('Number of shells should be non-negative.')
+
+        self.num_live = num_live
+        self.num_blank = num_blank
+        self.top_shell = top_shell
+        self.__size = math.comb(num_live + num_blank, num_live)
+        self.__table = list(self) if self.__size <= max_table_size else None
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __getitem__(self, index: int) -> list[BugShotShell]:
+        if index < 0:
+            index += self.__size
+        if index < 0 or index >= self.__size:
+            raise IndexError('Chamber index out of range')
+        if self.__table is not None:
+            return self.__table[index]
+
+        # Unrank in the order of itertools.combinations over live positions.
+        chamber = list()
+        num_shells = self.num_live + self.num_blank
+        lives_left = self.num_live
+        for position in range(num_shells):
+            if lives_left == 0:
+                chamber.append(BugShotShell.BLANK)
+                continue
+            num_live_first = math.comb(num_shells - position - 1, lives_left - 1)
+            if index < num_live_first:
+                chamber.append(BugShotShell.LIVE)
+                lives_left -= 1
+            else:
+                chamber.append(BugShotShell.BLANK)
+                index -= num_live_first
+
+        return self.__with_top_shell(chamber)
+
+    def __iter__(self):
+        num_shells = self.num_live + self.num_blank
+        for live_positions in itertools.combinations(range(num_shells), self.num_live):
+            chamber = [BugShotShell.BLANK] * num_shells
+            for position in live_positions:
+                chamber[position] = BugShotShell.LIVE
+            yield self.__with_top_shell(chamber)
+
+    def sample(self, rng: random.Random = None) -> list[BugShotShell]:
+        rng = DEFAULT_RNG if rng is None else rng
+        if self.__table is not None:
+            return self.__table[rng.randrange(self.__size)]
+
+        chamber = [BugShotShell.LIVE] * self.num_live + [BugShotShell.BLANK] * self.num_blank
+        rng.shuffle(chamber)
+        return self.__with_top_shell(chamber)
+
+    def __with_top_shell(self, chamber: list[BugShotShell]) -> list[BugShotShell]:
+        if self.top_shell is not None:
+            chamber.append(self.top_shell)
+        return chamber
+
+class BugShotChamberBelief:
+    '''
+    What the player to move knows about the chamber between moves: the
+    numbers of live and blank shells and the magnified top shell, if any.
+
+    update() reads them from each new observation and does nothing more
+    when they did not change. Otherwise it switches chambers to the
+    distribution of the new belief, which is built once per process for
+    every belief and then reused, so after the first few moves an update
+    costs a lookup and sampling a chamber costs a random index.
+    '''
+
+    num_live: int
+    num_blank: int
+    top_shell: BugShotShell
+    chambers: BugShotChamberDistribution
+    max_table_size: int
+
+    def __init__(self, max_table_size: int = 4096):
+        self.num_live = 0
+        self.num_blank = 0
+        self.top_shell = None
+        self.chambers = None
+        self.max_table_size = max_table_size
+        self.__key = None
+
+    def update(self, observation: list[int]) -> bool:
+        '''
+        Returns whether the belief changed.
+        '''
+
+        key = (
+            observation[0],
+            observation[1],
+            observation[MAGNIFIED_LIVE_OFFSET],
+            observation[MAGNIFIED_BLANK_OFFSET],
+        )
+        if key == self.__key:
+            return False
+
+        self.__key = key
+        self.chambers = _get_chamber_distribution(*key, self.max_table_size)
+        self.num_live = key[0]
+        self.num_blank = key[1]
+        self.top_shell = self.chambers.top_shell
+        return True
+
+    def sample(self, rng: random.Random = None) -> list[BugShotShell]:
+        return self.chambers.sample(rng)
+
+class BugShotStateSequence(Sequence):
+    '''
+    States sharing a base state, one per chamber of a BugShotChamberDistribution.
+
+    A state is built the first time its index is accessed and kept, since
+    Monte Carlo trials pick the same few chambers over and over.
+    '''
+
+    base: BugShotState
+    chambers: BugShotChamberDistribution
+
+    def __init__(self, base: BugShotState, chambers: BugShotChamberDistribution):
+        self.base = base
+        self.chambers = chambers
+        self.__states: dict[int, BugShotState] = dict()
+
+    def __len__(self) -> int:
+        return len(self.chambers)
+
+    def __getitem__(self, index: int) -> BugShotState:
+        state = self.__states.get(index)
+        if state is None:
+            state = self.__states[index] = self.base.set_chamber(chamber=self.chambers[index])
+        return state
+
+    def sample(self, rng: random.Random = None) -> BugShotState:
+        return self.base.set_chamber(chamber=self.chambers.sample(rng))
+
 class CombinationBugShotStateDecoder(AbstractBugShotStateDecoder):
 
     max_chambers: int
+    rng: random.Random
 
-    def __init__(self, max_chambers: int = 100):
+    def __init__(self, max_chambers: int = 100, rng: random.Random = None):
         self.max_chambers = max_chambers
+        self.rng = DEFAULT_RNG if rng is None else rng
 
     def _build_chambers(self, num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int) -> list[list[BugShotShell]]:
-        chamber = [BugShotShell.LIVE] * (num_live - is_magnified_live) + [BugShotShell.BLANK] * (num_blank - is_magnified_blank)
-        chambers = list(set(itertools.permutations(chamber)))
+        chambers = build_chamber_distribution(num_live, num_blank, is_magnified_live, is_magnified_blank)
+        if len(chambers) <= self.max_chambers:
+            return list(chambers)
+        return [chambers[index] for index in self.rng.sample(range(len(chambers)), self.max_chambers)]
 
-        if is_magnified_live:
-            chambers = [chamber + (BugShotShell.LIVE,) for chamber in chambers]
-        if is_magnified_blank:
-            chambers = [chamber + (BugShotShell.BLANK,) for chamber in chambers]
-        
-        return chambers[:self.max_chambers]
-    
\ No newline at end of file
+class BeliefBugShotStateDecoder(AbstractBugShotStateDecoder):
+    '''
+    Stateful ExactBugShotStateDecoder that keeps its chamber belief and
+    decoded base state from one move to the next.
+
+    Only the part of the observation that changed is decoded again, and the
+    returned BugShotStateSequence picks a chamber in constant time. One
+    decoder should follow one player, since every update replaces the
+    belief of the previous observation.
+    '''
+
+    belief: BugShotChamberBelief
+
+    def __init__(self, max_table_size: int = 4096):
+        self.belief = BugShotChamberBelief(max_table_size=max_table_size)
+        self.__observation = None
+        self.__base = None
+
+    def decode(self, observation: list[int]) -> BugShotStateSequence:
+        self.belief.update(observation)
+        if self.__observation is None or self.__observation[2:] != observation[2:]:
+            self.__base = self._decode_base(observation)[0]
+            self.__observation = list(observation)
+        return BugShotStateSequence(base=self.__base, chambers=self.belief.chambers)
+
+    def _build_chambers(self, num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int) -> BugShotChamberDistribution:
+        return _get_chamber_distribution(num_live, num_blank, is_magnified_live, is_magnified_blank, self.belief.max_table_size)
+
+class ExactBugShotStateDecoder(AbstractBugShotStateDecoder):
+    '''
+    Decodes an observation into every distinct chamber, lazily.
+
+    decode returns a BugShotStateSequence, so random.choice over it picks a
+    chamber from the exact posterior without building the others.
+    '''
+
+    def decode(self, observation: list[int]) -> BugShotStateSequence:
+        base, num_live_shells, num_blank_shells, is_magnified_live, is_magnified_blank = self._decode_base(observation)
+        chambers = build_chamber_distribution(num_live_shells, num_blank_shells, is_magnified_live, is_magnified_blank)
+        return BugShotStateSequence(base=base, chambers=chambers)
+
+    def _build_chambers(self, num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int) -> BugShotChamberDistribution:
+        return build_chamber_distribution(num_live, num_blank, is_magnified_live, is_magnified_blank)
+
+def build_chamber_distribution(num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int) -> BugShotChamberDistribution:
+    top_shell = None
+    if is_magnified_live:
+        top_shell = BugShotShell.LIVE
+    if is_magnified_blank:
+        top_shell = BugShotShell.BLANK
+
+    return BugShotChamberDistribution(
+        num_live=num_live - is_magnified_live,
+        num_blank=num_blank - is_magnified_blank,
+        top_shell=top_shell,
+    )
+
+@functools.lru_cache(maxsize=None)
+def _get_chamber_distribution(num_live: int, num_blank: int, is_magnified_live: int, is_magnified_blank: int, max_table_size: int) -> BugShotChamberDistribution:
+    chambers = build_chamber_distribution(num_live, num_blank, is_magnified_live, is_magnified_blank)
+    return BugShotChamberDistribution(
+        num_live=chambers.num_live,
+        num_blank=chambers.num_blank,
+        top_shell=chambers.top_shell,
+        max_table_size=max_table_size,
+    )
@@ -0,0 +1,518 @@
+import random
+import multiprocessing
+
+import numpy as np
+
+from multiprocessing.connection import Connection
+
+from bugshot import (
+    BugShotGameBuilder,
+    BugShotGameConfig,
+    BugShotGame,
+    BugShotAction,
+    BugShotItem,
+    BugShotPlayer,
+    ArrayBugShotStateSelector,
+    ACTION_BITS,
+    OBSERVATION_SIZE,
+    reseed_rngs,
+)
+
+ACTIONS = list(BugShotAction)
+ITEMS = list(BugShotItem)
+
+PLAYERS = list(BugShotPlayer)
+
+NO_WINNER = -1
+
+class BatchBugShotEnv:
+    '''
+    N games stepped together with NumPy.
+
+    Follows the rules of DefaultBugShotStateDispatcher. Players are indices
+    (0 for PLAYER1, 1 for PLAYER2), actions are indices into ACTIONS and
+    observations are rows in the layout of DefaultBugShotStateSelector.select,
+    seen from the player whose turn it is.
+
+    Chambers use the same sentinel encoding as PackedBugShotState: the top
+    shell is bit 0 and an empty chamber is 1.
+    '''
+
+    config: BugShotGameConfig
+    num_games: int
+    rng: np.random.Generator
+
+    turn: np.ndarray
+    chamber: np.ndarray
+    num_live: np.ndarray
+    num_blank: np.ndarray
+    init_life: np.ndarray
+    lives: np.ndarray
+    items: np.ndarray
+    is_opponent_handcuffed: np.ndarray
+    is_magnified_shell: np.ndarray
+    is_shotgun_sawed: np.ndarray
+
+    def __init__(self, config: BugShotGameConfig, num_games: int, seed: int = None):
+        if config.min_shell < 2:
+            raise ValueError('min_shell must be greater than or equal to 2')
+        if config.max_shell > 62:
+            raise ValueError('max_shell must be less than or equal to 62')
+
+        self.config = config
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+
+        self.turn = np.zeros(num_games, dtype=np.int8)
+        self.chamber = np.ones(num_games, dtype=np.int64)
+        self.num_live = np.zeros(num_games, dtype=np.int32)
+        self.num_blank = np.zeros(num_games, dtype=np.int32)
+        self.init_life = np.zeros(num_games, dtype=np.int32)
+        self.lives = np.zeros((num_games, 2), dtype=np.int32)
+        self.items = np.zeros((num_games, 2, len(ITEMS)), dtype=np.int32)
+        self.is_opponent_handcuffed = np.zeros(num_games, dtype=bool)
+        self.is_magnified_shell = np.zeros(num_games, dtype=bool)
+        self.is_shotgun_sawed = np.zeros(num_games, dtype=bool)
+
+        self.__rows = np.arange(num_games)
+
+        self.reset()
+
+    def reset(self, mask: np.ndarray = None) -> np.ndarray:
+        '''
+        Starts new games where mask is set (every game by default) and returns the observations.
+        '''
+
+        indices = self.__rows if mask is None else np.flatnonzero(mask)
+        num = len(indices)
+
+        init_life = self.rng.integers(self.config.min_initial_life, self.config.max_initial_life + 1, size=num)
+        self.turn[indices] = 0
+        self.init_life[indices] = init_life
+        self.lives[indices] = init_life[:, None]
+        self.is_opponent_handcuffed[indices] = False
+        self.is_magnified_shell[indices] = False
+        self.is_shotgun_sawed[indices] = False
+        self.__load_chambers(indices)
+
+        num_items = self.rng.integers(self.config.min_items_per_init, self.config.max_items_per_init + 1, size=num)
+        self.items[indices] = self.__draw_items(np.repeat(num_items, 2)).reshape(num, 2, len(ITEMS))
+
+        return self.observe()
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Applies one action per game and returns the observations and winners.
+        Finished games are left untouched.
+        '''
+
+        actions = np.asarray(actions)
+        rows = self.__rows
+        turn = self.turn.astype(np.intp)
+        active = self.get_winners() == NO_WINNER
+
+        # USE_SHOTGUN_SELF / USE_SHOTGUN_OPPONENT
+        shoot = active & (actions <= 1)
+        to_player = np.where(actions == 0, turn, 1 - turn)
+        top_live = (self.chamber & 1).astype(np.int32)
+        damage = np.where(shoot, top_live * (1 + self.is_shotgun_sawed), 0)
+        self.__pop_chambers(shoot, top_live)
+        self.lives[rows, to_player] -= damage
+        self.is_magnified_shell &= ~shoot
+        self.is_shotgun_sawed &= ~shoot
+
+        passes = shoot & ((to_player != turn) | (damage > 0))
+        self.turn ^= (passes & ~self.is_opponent_handcuffed).astype(np.int8)
+        self.is_opponent_handcuffed &= ~passes
+
+        # Items: USE_HANDCUFFS .. USE_HAND_SAW map to HANDCUFFS .. HAND_SAW.
+        item_index = np.clip(actions - 1, 0, len(ITEMS) - 1)
+        use = active & (actions >= 2) & (self.items[rows, turn, item_index] > 0)
+        self.items[rows, turn, item_index] -= use.astype(np.int32)
+
+        self.is_opponent_handcuffed |= use & (actions == 2)
+        self.__pop_chambers(use & (actions == 3), top_live)
+        self.is_magnified_shell |= use & (actions == 4)
+        smoke = use & (actions == 5)
+        self.lives[rows, turn] += (smoke & (self.lives[rows, turn] < self.init_life)).astype(np.int32)
+        self.is_shotgun_sawed |= use & (actions == 6)
+
+        winners = self.get_winners()
+        reload = active & (winners == NO_WINNER) & (self.chamber == 1)
+        if reload.any():
+            self.__reload(np.flatnonzero(reload))
+
+        return self.observe(), winners
+
+    def observe(self) -> np.ndarray:
+        rows = self.__rows
+        turn = self.turn.astype(np.intp)
+        top_live = (self.chamber & 1).astype(bool)
+
+        observations = np.empty((self.num_games, OBSERVATION_SIZE), dtype=np.int32)
+        observations[:, 0] = self.num_live
+        observations[:, 1] = self.num_blank
+        observations[:, 2] = self.init_life
+        observations[:, 3] = self.lives[rows, turn]
+        observations[:, 4] = self.lives[rows, 1 - turn]
+        observations[:, 5:5+len(ITEMS)] = self.items[rows, turn]
+        observations[:, 5+len(ITEMS):5+2*len(ITEMS)] = self.items[rows, 1 - turn]
+        observations[:, 5+2*len(ITEMS)] = self.is_opponent_handcuffed
+        observations[:, 5+2*len(ITEMS)+1] = self.is_magnified_shell & top_live
+        observations[:, 5+2*len(ITEMS)+2] = self.is_magnified_shell & ~top_live
+        observations[:, 5+2*len(ITEMS)+3] = self.is_shotgun_sawed
+        return observations
+
+    def get_winners(self) -> np.ndarray:
+        winners = np.full(self.num_games, NO_WINNER, dtype=np.int8)
+        winners[self.lives[:, 1] <= 0] = 0
+        winners[self.lives[:, 0] <= 0] = 1
+        return winners
+
+    def get_available_actions_mask(self) -> np.ndarray:
+        '''
+        Boolean (N, len(ACTIONS)) mask in the order of DefaultBugShotStateDispatcher.get_available_actions.
+        '''
+
+        board = self.items[self.__rows, self.turn.astype(np.intp)]
+        mask = np.empty((self.num_games, len(ACTIONS)), dtype=bool)
+        mask[:, 0] = True
+        mask[:, 1] = True
+        mask[:, 2] = (board[:, 1] > 0) & ~self.is_opponent_handcuffed
+        mask[:, 3] = board[:, 2] > 0
+        mask[:, 4] = (board[:, 3] > 0) & ~self.is_magnified_shell
+        mask[:, 5] = board[:, 4] > 0
+        mask[:, 6] = (board[:, 5] > 0) & ~self.is_shotgun_sawed
+        return mask
+
+    def __pop_chambers(self, mask: np.ndarray, top_live: np.ndarray):
+        self.num_live -= (mask & (top_live == 1)).astype(np.int32)
+        self.num_blank -= (mask & (top_live == 0)).astype(np.int32)
+        self.chamber[mask] >>= 1
+
+    def __reload(self, indices: np.ndarray):
+        self.__load_chambers(indices)
+
+        # Shuffling the i.i.d. refill and keeping the first max_new_items is
+        # the same as drawing min(num_items, max_new_items) items directly.
+        num_items = self.rng.integers(self.config.min_items_per_init, self.config.max_items_per_init + 1, size=len(indices))
+        max_new_items = self.config.max_items_per_board - self.items[indices].sum(axis=2)
+        num_new_items = np.clip(max_new_items, 0, num_items[:, None]).reshape(-1)
+        self.items[indices] += self.__draw_items(num_new_items).reshape(len(indices), 2, len(ITEMS))
+
+    def __load_chambers(self, indices: np.ndarray):
+        num = len(indices)
+        max_shell = self.config.max_shell
+
+        num_shell = self.rng.integers(self.config.min_shell, max_shell + 1, size=num)
+        num_live = self.rng.integers(1, num_shell)
+
+        # Rank random keys within the first num_shell slots; the lowest
+        # num_live ranks are live, which is a uniform shuffle.
+        slots = np.arange(max_shell)
+        keys = self.rng.random((num, max_shell))
+        keys[slots[None, :] >= num_shell[:, None]] = np.inf
+        ranks = np.argsort(np.argsort(keys, axis=1), axis=1)
+        is_live = ranks < num_live[:, None]
+
+        bits = (is_live.astype(np.int64) << slots).sum(axis=1)
+        self.chamber[indices] = (np.int64(1) << num_shell) | bits
+        self.num_live[indices] = num_live
+        self.num_blank[indices] = num_shell - num_live
+
+    def __draw_items(self, num_items: np.ndarray) -> np.ndarray:
+        pvals = np.full(len(ITEMS), 1 / len(ITEMS))
+        return self.rng.multinomial(num_items, pvals)
+
+class BugShotEnv:
+    '''
+    Single game with a reset/step API, in the turn-based multi-agent style.
+
+    The game is built once, with generators of its own, and reset() only
+    draws a new initial state.
+    Agents are player indices (0 for PLAYER1, 1 for PLAYER2) and actions are
+    indices into ACTIONS. Every observation is an int32 row in the layout of
+    DefaultBugShotStateSelector.select, seen from the player to move, and
+    info carries that player and its boolean action mask. step() returns
+    rewards for both players: +1 for the winner and -1 for the loser when the
+    game ends, 0 otherwise.
+    '''
+
+    config: BugShotGameConfig
+    game: BugShotGame
+    max_steps: int
+    num_steps: int
+
+    def __init__(self, config: BugShotGameConfig, max_steps: int = 1000, seed: int = None):
+        self.config = config
+        # Own generators even without a seed, so that reset(seed) can reseed
+        # them without touching the random module.
+        self.game = BugShotGameBuilder().build(config=config, seed=random.getrandbits(64) if seed is None else seed)
+        self.max_steps = max_steps
+        self.num_steps = 0
+
+        self.__selectors = {
+            player: ArrayBugShotStateSelector(player)
+            for player in PLAYERS
+        }
+
+    def reset(self, seed: int = None, out: np.ndarray = None) -> tuple[np.ndarray, dict]:
+        '''
+        Starts a new game and returns its first observation and info. With a
+        seed, the game's generators are reseeded first. The observation
+        is written into out if it is given.
+        '''
+
+        if seed is not None:
+            reseed_rngs(self.game, seed)
+        self.game.reset()
+        self.num_steps = 0
+        return self.observe(out), self.get_info()
+
+    def step(self, action: int, out: np.ndarray = None) -> tuple[np.ndarray, np.ndarray, bool, bool, dict]:
+        '''
+        Plays action for the player to move and returns (observation, rewards,
+        terminated, truncated, info), with the observation written into out
+        if it is given.
+        '''
+
+        if self.game.get_winner() is not None:
+            raise ValueError('The game is over; call reset() first.')
+
+        mask = self.game.dispatcher.get_action_mask(self.game.state)
+        action = ACTIONS[action]
+        if not mask & ACTION_BITS[action]:
+            raise ValueError(f'Unavailable action: {action}')
+
+        self.game.do_action(action)
+        self.num_steps += 1
+
+        rewards = np.zeros(len(PLAYERS), dtype=np.float32)
+        winner = self.game.get_winner()
+        if winner is not None:
+            rewards[PLAYERS.index(winner)] = 1.0
+            rewards[PLAYERS.index(winner.opponent())] = -1.0
+
+        terminated = winner is not None
+        truncated = not terminated and self.num_steps >= self.max_steps
+        return self.observe(out), rewards, terminated, truncated, self.get_info()
+
+    def observe(self, out: np.ndarray = None) -> np.ndarray:
+        '''
+        Observation of the player to move, written into out if it is given.
+        '''
+
+        selector = self.__selectors[self.game.get_turn()]
+        if out is None:
+            return selector.select(self.game.state)
+        return selector.select_into(self.game.state, out)
+
+    def get_action_mask(self) -> np.ndarray:
+        mask = self.game.dispatcher.get_action_mask(self.game.state)
+        return np.array([bool(mask & ACTION_BITS[action]) for action in ACTIONS])
+
+    def get_info(self) -> dict:
+        return {
+            'agent': PLAYERS.index(self.game.get_turn()),
+            'action_mask': self.get_action_mask(),
+        }
+
+class AsyncVectorBugShotEnv:
+    '''
+    num_envs BugShotEnv copies stepped in worker processes.
+
+    Actions go to the workers and results come back through shared memory,
+    so a step only sends a short command over each pipe. Results are (N, ...)
+    arrays: observations, action masks and agents to move, rewards (N, 2),
+    terminated and truncated. A finished game is reset within the same step,
+    so its row already holds the first observation of the next game while
+    rewards, terminated and truncated still describe the finished one.
+
+    Returned arrays are copies unless copy is False, in which case they are
+    views that the next step overwrites.
+    '''
+
+    config: BugShotGameConfig
+    num_envs: int
+    num_workers: int
+    copy: bool
+
+    observations: np.ndarray
+    action_masks: np.ndarray
+    agents: np.ndarray
+    rewards: np.ndarray
+    terminated: np.ndarray
+    truncated: np.ndarray
+
+    def __init__(
+            self,
+            config: BugShotGameConfig,
+            num_envs: int,
+            num_workers: int = None,
+            max_steps: int = 1000,
+            copy: bool = True,
+        ):
+
+        self.config = config
+        self.num_envs = num_envs
+        self.num_workers = min(num_envs, num_workers or multiprocessing.cpu_count())
+        self.copy = copy
+
+        buffers = {
+            'actions': (np.int8, ()),
+            'observations': (np.int32, (OBSERVATION_SIZE,)),
+            'action_masks': (np.bool_, (len(ACTIONS),)),
+            'agents': (np.int8, ()),
+            'rewards': (np.float32, (len(PLAYERS),)),
+            'terminated': (np.bool_, ()),
+            'truncated': (np.bool_, ()),
+        }
+        self.__buffers = {
+            name: (multiprocessing.RawArray('b', np.dtype(dtype).itemsize * num_envs * int(np.prod(shape))), dtype, shape)
+            for name, (dtype, shape) in buffers.items()
+        }
+        arrays = _get_vector_arrays(self.__buffers, num_envs)
+        self.__actions = arrays.pop('actions')
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+        self.__pipes: list[Connection] = list()
+        self.__processes: list[multiprocessing.Process] = list()
+        for indices in np.array_split(np.arange(num_envs), self.num_workers):
+            pipe, worker_pipe = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_vector_worker,
+                args=(worker_pipe, config, max_steps, indices, self.__buffers, num_envs),
+                daemon=True,
+            )
+            process.start()
+            worker_pipe.close()
+            self.__pipes.append(pipe)
+            self.__processes.append(process)
+
+        self.__is_waiting = False
+        self.__is_closed = False
+
+    def reset(self, seed: int = None) -> tuple[np.ndarray, dict]:
+        '''
+        Resets every game; with a seed, game i is seeded with f'{seed}:{i}'.
+        '''
+
+        self.__send('reset', seed)
+        self.__receive()
+        return self.__get(self.observations), self.__get_info()
+
+    def step_async(self, actions: np.ndarray):
+        if self.__is_waiting:
+            raise RuntimeError('step_wait() must be called before the next step_async().')
+        self.__actions[:] = actions
+        self.__send('step', None)
+        self.__is_waiting = True
+
+    def step_wait(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        if not self.__is_waiting:
+            raise RuntimeError('step_async() must be called before step_wait().')
+        self.__receive()
+        self.__is_waiting = False
+        return (
+            self.__get(self.observations),
+            self.__get(self.rewards),
+            self.__get(self.terminated),
+            self.__get(self.truncated),
+            self.__get_info(),
+        )
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.__is_closed:
+            return
+        if self.__is_waiting:
+            self.__receive()
+        self.__send('close', None)
+        for process in self.__processes:
+            process.join()
+        for pipe in self.__pipes:
+            pipe.close()
+        self.__is_closed = True
+
+    def __enter__(self) -> 'AsyncVectorBugShotEnv':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __send(self, command: str, data: object):
+        for pipe in self.__pipes:
+            pipe.send((command, data))
+
+    def __receive(self):
+        for pipe in self.__pipes:
+            error = pipe.recv()
+            if error is not None:
+                raise RuntimeError(f'Vector env worker failed: {error}')
+
+    def __get(self, array: np.ndarray) -> np.ndarray:
+        return array.copy() if self.copy else array
+
+    def __get_info(self) -> dict:
+        return {
+            'agent': self.__get(self.agents),
+            'action_mask': self.__get(self.action_masks),
+        }
+
+def _get_vector_arrays(buffers: dict[str, tuple], num_envs: int) -> dict[str, np.ndarray]:
+    return {
+        name: np.frombuffer(buffer, dtype=dtype).reshape(num_envs, *shape)
+        for name, (buffer, dtype, shape) in buffers.items()
+    }
+
+def _run_vector_worker(
+        pipe: Connection,
+        config: BugShotGameConfig,
+        max_steps: int,
+        indices: np.ndarray,
+        buffers: dict[str, tuple],
+        num_envs: int,
+    ):
+
+    arrays = _get_vector_arrays(buffers, num_envs)
+    # Forked workers share the state of the random module, so every game gets its own generators.
+    seeds = random.SystemRandom()
+    envs = [BugShotEnv(config=config, max_steps=max_steps, seed=seeds.getrandbits(64)) for _ in indices]
+
+    def write(i: int, info: dict):
+        arrays['action_masks'][i] = info['action_mask']
+        arrays['agents'][i] = info['agent']
+
+    while True:
+        command, data = pipe.recv()
+        if command == 'close':
+            break
+
+        try:
+            if command == 'reset':
+                for i, env in zip(indices, envs):
+                    _, info = env.reset(seed=None if data is None else f'{data}:{i}', out=arrays['observations'][i])
+                    write(i, info)
+                    arrays['rewards'][i] = 0.0
+                    arrays['terminated'][i] = False
+                    arrays['truncated'][i] = False
+            elif command == 'step':
+                for i, env in zip(indices, envs):
+                    _, rewards, terminated, truncated, info = env.step(int(arrays['actions'][i]), out=arrays['observations'][i])
+                    if terminated or truncated:
+                        _, info = env.reset(out=arrays['observations'][i])
+                    write(i, info)
+                    arrays['rewards'][i] = rewards
+                    arrays['terminated'][i] = terminated
+                    arrays['truncated'][i] = truncated
+            else:
+                raise ValueError(f'Unknown command: {command}')
+            pipe.send(None)
+        except Exception as e:
+            pipe.send(repr(e))
+
+    pipe.close()
@@ -1,3 +1,4 @@
+import math
 import random
 
 from abc import ABCMeta, abstractmethod
@@ -7,7 +8,12 @@ from bugshot import (
     BugShotStateDispatcher,
     BugShotAction,
     BugShotPlayer,
+    AVAILABLE_ACTIONS_BY_MASK,
+    DEFAULT_RNG,
+    PackedBugShotState,
+    PackedBugShotStateDispatcher,
 )
+from cache import BugShotRolloutCache, ACTION_INDICES, get_state_key
 
 class BugShotStateExplorer(metaclass=ABCMeta):
     
@@ -18,9 +24,11 @@ class BugShotStateExplorer(metaclass=ABCMeta):
 class RandomBugShotStateExplorer(BugShotStateExplorer):
     
     dispatcher: BugShotStateDispatcher
+    rng: random.Random
 
-    def __init__(self, dispatcher: BugShotStateDispatcher):
+    def __init__(self, dispatcher: BugShotStateDispatcher, rng: random.Random = None):
         self.dispatcher = dispatcher
+        self.rng = DEFAULT_RNG if rng is None else rng
 
     def explore(self, state: BugShotState) -> tuple[bool, list[BugShotAction]]:
         actions = list()
@@ -31,4 +39,86 @@ class RandomBugShotStateExplorer(BugShotStateExplorer):
         return self.dispatcher.get_winner(state) == BugShotPlayer.PLAYER1, actions
     
     def __get_random_action(self, state: BugShotState) -> BugShotAction:
-        return random.choice(self.dispatcher.get_available_actions(state))
+        return self.rng.choice(AVAILABLE_ACTIONS_BY_MASK[self.dispatcher.get_action_mask(state)])
+
+class PackedRandomBugShotStateExplorer(BugShotStateExplorer):
+    '''
+    RandomBugShotStateExplorer that rolls out on packed states.
+    '''
+
+    dispatcher: PackedBugShotStateDispatcher
+    rng: random.Random
+
+    def __init__(self, dispatcher: PackedBugShotStateDispatcher, rng: random.Random = None):
+        self.dispatcher = dispatcher
+        self.rng = DEFAULT_RNG if rng is None else rng
+
+    def explore(self, state: BugShotState) -> tuple[bool, list[BugShotAction]]:
+        dispatcher = self.dispatcher
+        rng = self.rng
+        packed = PackedBugShotState.pack(state)
+
+        actions = list()
+        while not dispatcher.is_terminal(packed):
+            action = rng.choice(AVAILABLE_ACTIONS_BY_MASK[dispatcher.get_action_mask(packed)])
+            actions.append(action)
+            packed = dispatcher.dispatch(packed, action)
+        return dispatcher.get_winner(packed) == BugShotPlayer.PLAYER1, actions
+
+class CachedBugShotStateExplorer(BugShotStateExplorer):
+    '''
+    Picks the first action of a rollout from cached statistics of the state
+    and leaves the rest of the rollout to explorer.
+
+    The first action is the untried one, or the one with the highest UCB1
+    score over the statistics of every earlier rollout from a state with the
+    same canonical key, so repeated rollouts from a state, its mirror image
+    or its reshuffled chambers spend more and more of their time on its
+    better actions. Every rollout is added to the cache.
+    '''
+
+    dispatcher: BugShotStateDispatcher
+    explorer: BugShotStateExplorer
+    cache: BugShotRolloutCache
+    exploration: float
+    rng: random.Random
+
+    def __init__(
+            self,
+            dispatcher: BugShotStateDispatcher,
+            explorer: BugShotStateExplorer,
+            cache: BugShotRolloutCache,
+            exploration: float = math.sqrt(2),
+            rng: random.Random = None,
+        ):
+        self.dispatcher = dispatcher
+        self.explorer = explorer
+        self.cache = cache
+        self.exploration = exploration
+        self.rng = DEFAULT_RNG if rng is None else rng
+
+    def explore(self, state: BugShotState) -> tuple[bool, list[BugShotAction]]:
+        if self.dispatcher.get_winner(state) is not None:
+            return self.dispatcher.get_winner(state) == BugShotPlayer.PLAYER1, []
+
+        key = get_state_key(state)
+        action = self.__select_action(state, self.cache.get(key))
+        is_win, actions = self.explorer.explore(self.dispatcher.dispatch(state, action))
+        self.cache.record(key, action, is_win == (state.turn == BugShotPlayer.PLAYER1))
+        return is_win, [action] + actions
+
+    def __select_action(self, state: BugShotState, stats: tuple[list[int], list[int]]) -> BugShotAction:
+        actions = AVAILABLE_ACTIONS_BY_MASK[self.dispatcher.get_action_mask(state)]
+        if stats is None:
+            return self.rng.choice(actions)
+
+        wins, visits = stats
+        untried = [action for action in actions if visits[ACTION_INDICES[action]] == 0]
+        if len(untried) > 0:
+            return self.rng.choice(untried)
+
+        log_visits = math.log(sum(visits))
+        return max(actions, key=lambda action: self.__get_ucb(wins[ACTION_INDICES[action]], visits[ACTION_INDICES[action]], log_visits))
+
+    def __get_ucb(self, wins: int, visits: int, log_visits: float) -> float:
+        return wins / visits + self.exploration * math.sqrt(log_visits / visits)
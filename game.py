@@ -1,65 +1,76 @@
 #!/usr/bin/env python
 
-from bugshot import (
-    BugShotGameBuilder,
-    BugShotGameConfig,
-    BugShotState,
-    BugShotPlayer,
-    BugShotAction,
-    BugShotShell,
-)
-from agent import MonteCarloBugShotGameAgent
-from decoder import CombinationBugShotStateDecoder
-from explorer import RandomBugShotStateExplorer
+import json
+import socket
+import asyncio
+import argparse
+import threading
+
+from bugshot import BugShotPlayer, BugShotAction
+from server import BugShotMatchServer, CONFIG, HUMAN, build_agent
 
 def main():
-    config = BugShotGameConfig(
-        min_items_per_init=2,
-        max_items_per_init=4,
-        max_items_per_board=8,
-        min_shell=3,
-        max_shell=8,
-        min_initial_life=2,
-        max_initial_life=3,
-    )
-    game_builder = BugShotGameBuilder()
-    game = game_builder.build(config=config)
+    parser = argparse.ArgumentParser(description='Plays against the AI of a match server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='port of a running server.py (default: start one in this process)')
+    parser.add_argument('--seed', help='seed of the game')
+    args = parser.parse_args()
 
-    monte_agent = MonteCarloBugShotGameAgent(
-        num_trials=10000,
-        dispatcher=game.dispatcher,
-        decoder=CombinationBugShotStateDecoder(max_chambers=10000),
-        explorer=RandomBugShotStateExplorer(dispatcher=game.dispatcher),
-    )
+    address = (args.host, args.port)
+    if args.port is None:
+        address = start_local_server()
 
-    while game.get_winner() is None:
-        print_state(game.state)
-        if game.get_turn() == BugShotPlayer.PLAYER1:
-            action = input_action(game.dispatcher.get_available_actions(game.state))
-            print(f'Player action: {action.value}')
-        else:
-            action = monte_agent.act(observation=game.observe())
-            print(f'Opponent action: {action.value}')
-        game.do_action(action)
-    
-    print(f'{game.get_winner().value} wins!')
+    with socket.create_connection(address) as connection:
+        stream = connection.makefile('rw', encoding='utf-8', newline='\n')
+        send(stream, {'type': 'start', 'seed': args.seed})
+        for line in stream:
+            message = json.loads(line)
+            if message['type'] == 'state':
+                print_state(message['state'])
+                if len(message['actions']) > 0:
+                    action = input_action([BugShotAction(action) for action in message['actions']])
+                    send(stream, {'type': 'action', 'action': action.value})
+            elif message['type'] == 'action':
+                player = 'Player' if message['player'] == HUMAN.value else 'Opponent'
+                print(f'{player} action: {message["action"]}')
+            elif message['type'] == 'end':
+                print(f'{message["winner"]} wins!')
+                break
+            elif message['type'] == 'error':
+                print(f'Server error: {message["message"]}')
+
+def start_local_server() -> tuple[str, int]:
+    '''
+    Starts a single-worker BugShotMatchServer on a background thread and returns its address.
+    '''
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server = BugShotMatchServer(config=CONFIG, agent=build_agent(CONFIG), max_workers=1)
+    return asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+
+def send(stream, message: dict):
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+def print_state(state: dict):
+    '''
+    Prints a state in the form of server.get_view().
+    '''
 
-def print_state(state: BugShotState):
     indent = 2
 
-    num_live_shells = state.chamber.count(BugShotShell.LIVE)
-    num_blank_shells = state.chamber.count(BugShotShell.BLANK)
-    life_player1 = state.life_dict[BugShotPlayer.PLAYER1]
-    life_player2 = state.life_dict[BugShotPlayer.PLAYER2]
-    items_player1 = state.item_boards[BugShotPlayer.PLAYER1].describe()
-    items_player2 = state.item_boards[BugShotPlayer.PLAYER2].describe()
-    is_opponent_handcuffed = state.is_opponent_handcuffed
-    is_magnified_live = state.is_magnified_shell and state.chamber[-1] == BugShotShell.LIVE
-    is_magnified_blank = state.is_magnified_shell and state.chamber[-1] == BugShotShell.BLANK
-    magnifier_result = 'live' if is_magnified_live else 'blank' if is_magnified_blank else 'none'
-    is_shotgun_sawed = state.is_shotgun_sawed
+    num_live_shells = state['num_live_shells']
+    num_blank_shells = state['num_blank_shells']
+    life_player1 = state['lives'][BugShotPlayer.PLAYER1.value]
+    life_player2 = state['lives'][BugShotPlayer.PLAYER2.value]
+    items_player1 = describe_items(state['items'][BugShotPlayer.PLAYER1.value])
+    items_player2 = describe_items(state['items'][BugShotPlayer.PLAYER2.value])
+    is_opponent_handcuffed = state['is_opponent_handcuffed']
+    magnifier_result = 'none' if state['magnified'] is None else state['magnified'].lower()
+    is_shotgun_sawed = state['is_shotgun_sawed']
     
-    turn = 'My' if state.turn == BugShotPlayer.PLAYER1 else 'Opponent'
+    turn = 'My' if state['turn'] == BugShotPlayer.PLAYER1.value else 'Opponent'
     print(f'--------------- {turn} Turn ---------------')
     print(f'{"Live shells":<{indent}}: {num_live_shells}')
     print(f'{"Blank shells":<{indent}}: {num_blank_shells}')
@@ -73,6 +84,9 @@ def print_state(state: BugShotState):
     if is_shotgun_sawed:
         print(f'{"Shotgun sawed":<{indent}}: True')
 
+def describe_items(items: dict[str, int]) -> str:
+    return '[' + ', '.join([f'{k}: {v}' for k, v in items.items()]) + ']'
+
 def input_action(valid_actions: list[BugShotAction]):
     print(f'Available actions:')
     for i, action in enumerate(valid_actions):
@@ -0,0 +1,236 @@
+import json
+import time
+import bisect
+import functools
+
+from bugshot import DefaultBugShotStateDispatcher
+from decoder import BugShotStateDecoder
+from explorer import BugShotStateExplorer
+from agent import MonteCarloBugShotGameAgent
+
+# Upper bounds of the histogram buckets; the last bucket is unbounded.
+SECONDS_BUCKETS = [1e-6 * 10 ** (i / 2) for i in range(15)]
+LENGTH_BUCKETS = [2 ** i for i in range(11)]
+
+class MetricCounter:
+
+    name: str
+    help: str
+    values: dict[tuple[tuple[str, str], ...], float]
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = dict()
+
+    def inc(self, labels: tuple[tuple[str, str], ...] = (), value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+class MetricHistogram:
+
+    name: str
+    help: str
+    buckets: list[float]
+    # labels -> (count per bucket, sum, count)
+    values: dict[tuple[tuple[str, str], ...], list]
+
+    def __init__(self, name: str, help: str, buckets: list[float]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = dict()
+
+    def observe(self, value: float, labels: tuple[tuple[str, str], ...] = ()):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+class BugShotInstrumentation:
+    '''
+    Opt-in counters and timing histograms around the hot paths:
+    DefaultBugShotStateDispatcher.dispatch per action, decode of every
+    BugShotStateDecoder, explore of every BugShotStateExplorer (time and
+    rollout length) and act of MonteCarloBugShotGameAgent and its subclasses.
+
+    enable() wraps those methods on their classes and disable() puts the
+    originals back, so nothing is measured, and nothing costs, while it is
+    off. Only the outermost of nested calls of the same method is measured,
+    e.g. a rollout of CachedBugShotStateExplorer and not again the rollout
+    of the explorer it delegates to. Only one instrumentation can be enabled
+    at a time. Worker processes keep their own copies of the metrics, so
+    only calls made in this process are counted.
+    '''
+
+    counters: dict[str, MetricCounter]
+    histograms: dict[str, MetricHistogram]
+
+    __enabled: 'BugShotInstrumentation' = None
+
+    def __init__(self):
+        self.__patches: list[tuple[type, str, object]] = list()
+        # Wrapped calls in progress per method name, so that a call made by
+        # another wrapped call of the same name, like the rollout a caching
+        # explorer delegates to its inner explorer, is not counted again.
+        self.__depths: dict[str, int] = dict()
+        self.counters = {
+            'bugshot_dispatch_total': MetricCounter('bugshot_dispatch_total', 'Dispatched actions.'),
+        }
+        self.histograms = {
+            'bugshot_dispatch_seconds': MetricHistogram('bugshot_dispatch_seconds', 'Time per dispatch.', SECONDS_BUCKETS),
+            'bugshot_decode_seconds': MetricHistogram('bugshot_decode_seconds', 'Time per decode.', SECONDS_BUCKETS),
+            'bugshot_explore_seconds': MetricHistogram('bugshot_explore_seconds', 'Time per rollout.', SECONDS_BUCKETS),
+            'bugshot_explore_length': MetricHistogram('bugshot_explore_length', 'Actions per rollout.', LENGTH_BUCKETS),
+            'bugshot_act_seconds': MetricHistogram('bugshot_act_seconds', 'Time per act.', SECONDS_BUCKETS),
+        }
+
+    def reset(self):
+        for metric in [*self.counters.values(), *self.histograms.values()]:
+            metric.values.clear()
+
+    def enable(self):
+        if BugShotInstrumentation.__enabled is self:
+            return
+        if BugShotInstrumentation.__enabled is not None:
+            raise RuntimeError('Another instrumentation is already enabled.')
+        BugShotInstrumentation.__enabled = self
+
+        dispatch_total = self.counters['bugshot_dispatch_total']
+        dispatch_seconds = self.histograms['bugshot_dispatch_seconds']
+        decode_seconds = self.histograms['bugshot_decode_seconds']
+        explore_seconds = self.histograms['bugshot_explore_seconds']
+        explore_length = self.histograms['bugshot_explore_length']
+        act_seconds = self.histograms['bugshot_act_seconds']
+
+        def record_dispatch(cls, args, kwargs, result, elapsed):
+            action = args[2] if len(args) > 2 else kwargs['action']
+            labels = (('action', action.value),)
+            dispatch_total.inc(labels)
+            dispatch_seconds.observe(elapsed, labels)
+
+        def record_decode(cls, args, kwargs, result, elapsed):
+            decode_seconds.observe(elapsed, (('decoder', cls.__name__),))
+
+        def record_explore(cls, args, kwargs, result, elapsed):
+            labels = (('explorer', cls.__name__),)
+            explore_seconds.observe(elapsed, labels)
+            explore_length.observe(len(result[1]), labels)
+
+        def record_act(cls, args, kwargs, result, elapsed):
+            act_seconds.observe(elapsed, (('agent', cls.__name__),))
+
+        self.__patch(DefaultBugShotStateDispatcher, 'dispatch', record_dispatch)
+        for cls in _get_classes_defining(BugShotStateDecoder, 'decode'):
+            self.__patch(cls, 'decode', record_decode)
+        for cls in _get_classes_defining(BugShotStateExplorer, 'explore'):
+            self.__patch(cls, 'explore', record_explore)
+        for cls in _get_classes_defining(MonteCarloBugShotGameAgent, 'act'):
+            self.__patch(cls, 'act', record_act)
+
+    def disable(self):
+        if BugShotInstrumentation.__enabled is not self:
+            return
+        for cls, name, original in reversed(self.__patches):
+            setattr(cls, name, original)
+        self.__patches = list()
+        BugShotInstrumentation.__enabled = None
+
+    def __enter__(self) -> 'BugShotInstrumentation':
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def to_dict(self) -> dict:
+        return {
+            'counters': {
+                name: [{'labels': dict(labels), 'value': value} for labels, value in counter.values.items()]
+                for name, counter in self.counters.items()
+            },
+            'histograms': {
+                name: [
+                    {
+                        'labels': dict(labels),
+                        'buckets': histogram.buckets + ['+Inf'],
+                        'counts': counts,
+                        'sum': total,
+                        'count': count,
+                    }
+                    for labels, (counts, total, count) in histogram.values.items()
+                ]
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def to_prometheus(self) -> str:
+        '''
+        Metrics in the Prometheus text exposition format.
+        '''
+
+        lines = list()
+        for counter in self.counters.values():
+            lines.append(f'# HELP {counter.name} {counter.help}')
+            lines.append(f'# TYPE {counter.name} counter')
+            for labels, value in counter.values.items():
+                lines.append(f'{counter.name}{_format_labels(labels)} {value}')
+
+        for histogram in self.histograms.values():
+            lines.append(f'# HELP {histogram.name} {histogram.help}')
+            lines.append(f'# TYPE {histogram.name} histogram')
+            for labels, (counts, total, count) in histogram.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip([f'{bound:g}' for bound in histogram.buckets] + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f'{histogram.name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{histogram.name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{histogram.name}_count{_format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def __patch(self, cls: type, name: str, record):
+        original = cls.__dict__[name]
+        depths = self.__depths
+        depths[name] = 0
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            if depths[name] > 0:
+                return original(*args, **kwargs)
+
+            depths[name] += 1
+            try:
+                started = time.perf_counter()
+                result = original(*args, **kwargs)
+                elapsed = time.perf_counter() - started
+            finally:
+                depths[name] -= 1
+            record(cls, args, kwargs, result, elapsed)
+            return result
+
+        setattr(cls, name, wrapper)
+        self.__patches.append((cls, name, original))
+
+def _get_classes_defining(base: type, name: str) -> list[type]:
+    '''
+    base and its subclasses, recursively, that define name themselves.
+    '''
+
+    classes = list()
+    stack = [base]
+    while len(stack) > 0:
+        cls = stack.pop()
+        if name in cls.__dict__ and not getattr(cls.__dict__[name], '__isabstractmethod__', False):
+            classes.append(cls)
+        stack.extend(cls.__subclasses__())
+    return classes
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
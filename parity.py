@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import random
+import hashlib
+import argparse
+import subprocess
+
+from bugshot import (
+    BugShotGameBuilder,
+    BugShotGameConfig,
+    DefaultBugShotChamberInitializer,
+    DefaultBugShotItemBoardInitializer,
+    DefaultBugShotStateDispatcher,
+    PackedBugShotState,
+    PackedBugShotStateDispatcher,
+    PURE_PYTHON_ENV,
+    get_compiled_modules,
+)
+
+CONFIG = BugShotGameConfig(
+    min_items_per_init=2,
+    max_items_per_init=4,
+    max_items_per_board=8,
+    min_shell=3,
+    max_shell=8,
+    min_initial_life=2,
+    max_initial_life=3,
+)
+
+def trace_game(seed: str, max_steps: int) -> str:
+    '''
+    Digest of every transition of a game with random actions, played once
+    with DefaultBugShotStateDispatcher and once with PackedBugShotStateDispatcher.
+    '''
+
+    digest = hashlib.sha256()
+    game = BugShotGameBuilder().build(config=CONFIG, seed=seed)
+    initial = PackedBugShotState.pack(game.state)
+
+    rng = random.Random(f'{seed}:actions')
+    for _ in range(max_steps):
+        state = game.state
+        digest.update(repr((
+            PackedBugShotState.pack(state),
+            game.dispatcher.get_action_mask(state),
+            game.observe(),
+        )).encode())
+        if game.get_winner() is not None:
+            break
+        game.do_action(rng.choice(game.dispatcher.get_available_actions(state)))
+    digest.update(repr(game.get_winner()).encode())
+
+    dispatcher = build_dispatcher(PackedBugShotStateDispatcher, seed)
+    packed = initial
+    for _ in range(max_steps):
+        digest.update(repr((packed, dispatcher.get_action_mask(packed))).encode())
+        if dispatcher.is_terminal(packed):
+            break
+        packed = dispatcher.dispatch(packed, rng.choice(dispatcher.get_available_actions(packed)))
+    digest.update(repr(dispatcher.get_winner(packed)).encode())
+
+    return digest.hexdigest()
+
+def compare_dispatchers(seed: str, max_steps: int) -> tuple[int, int]:
+    '''
+    Plays a game with random actions through DefaultBugShotStateDispatcher
+    and PackedBugShotStateDispatcher in lockstep, from generators seeded
+    alike, and returns (number of transitions, first step where they
+    disagree or None).
+    '''
+
+    game = BugShotGameBuilder().build(config=CONFIG, seed=seed)
+    default = build_dispatcher(DefaultBugShotStateDispatcher, seed)
+    packed_dispatcher = build_dispatcher(PackedBugShotStateDispatcher, seed)
+
+    rng = random.Random(f'{seed}:actions')
+    state = game.state
+    packed = PackedBugShotState.pack(state)
+    for step in range(max_steps):
+        if (
+            PackedBugShotState.pack(state) != packed
+            or default.get_action_mask(state) != packed_dispatcher.get_action_mask(packed)
+            or default.get_winner(state) != packed_dispatcher.get_winner(packed)
+        ):
+            return step, step
+        if default.get_winner(state) is not None:
+            return step, None
+
+        action = rng.choice(default.get_available_actions(state))
+        state = default.dispatch(state, action)
+        packed = packed_dispatcher.dispatch(packed, action)
+    return max_steps, None
+
+def build_dispatcher(cls: type, seed: str) -> object:
+    return cls(
+        chamber_initializer=DefaultBugShotChamberInitializer(CONFIG.min_shell, CONFIG.max_shell, rng=random.Random(f'{seed}:chamber')),
+        item_board_initializer=DefaultBugShotItemBoardInitializer(CONFIG.min_items_per_init, CONFIG.max_items_per_init, rng=random.Random(f'{seed}:items')),
+        max_num_items_per_board=CONFIG.max_items_per_board,
+        rng=random.Random(f'{seed}:dispatcher'),
+    )
+
+def check_packed(num_games: int, seed: int, max_steps: int):
+    num_transitions = 0
+    mismatches = list()
+    for i in range(num_games):
+        num_steps, mismatch = compare_dispatchers(f'{seed}:{i}', max_steps)
+        num_transitions += num_steps
+        if mismatch is not None:
+            mismatches.append(f'{seed}:{i} at step {mismatch}')
+
+    if len(mismatches) > 0:
+        print(f'{len(mismatches)} of {num_games} games differ between the default and packed dispatchers, first: {", ".join(mismatches[:10])}')
+        sys.exit(1)
+    print(f'{num_games} games ({num_transitions} transitions) identical with the default and packed dispatchers.')
+
+def run_trace(num_games: int, seed: int, max_steps: int, pure_python: bool) -> dict:
+    env = dict(os.environ)
+    env.pop(PURE_PYTHON_ENV, None)
+    if pure_python:
+        env[PURE_PYTHON_ENV] = '1'
+
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--trace', '--games', str(num_games), '--seed', str(seed), '--max-steps', str(max_steps)],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks that the compiled build plays exactly like the sources.')
+    parser.add_argument('--packed', action='store_true', help='check the packed dispatcher against the default one instead; needs no compiled build')
+    parser.add_argument('--games', type=int, default=1000, help='number of randomized games (default 1000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--trace', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trace:
+        digests = [trace_game(f'{args.seed}:{i}', args.max_steps) for i in range(args.games)]
+        print(json.dumps({'compiled': get_compiled_modules(), 'digests': digests}))
+        return
+    if args.packed:
+        check_packed(args.games, args.seed, args.max_steps)
+        return
+
+    pure = run_trace(args.games, args.seed, args.max_steps, pure_python=True)
+    compiled = run_trace(args.games, args.seed, args.max_steps, pure_python=False)
+    if len(pure['compiled']) > 0:
+        print(f'{PURE_PYTHON_ENV} did not take effect for {", ".join(pure["compiled"])}.')
+        sys.exit(1)
+    if len(compiled['compiled']) == 0:
+        print('No compiled build found; run build.py first, or check the packed dispatcher with --packed.')
+        sys.exit(1)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(pure['digests'], compiled['digests'])) if a != b]
+    if len(mismatches) > 0:
+        print(f'{len(mismatches)} of {args.games} games differ, first seeds: {", ".join(f"{args.seed}:{i}" for i in mismatches[:10])}')
+        sys.exit(1)
+    print(f'{args.games} games identical with compiled {", ".join(compiled["compiled"])}.')
+
+if __name__ == '__main__':
+    main()
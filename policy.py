@@ -0,0 +1,251 @@
+import time
+import queue
+import random
+import threading
+
+import numpy as np
+
+from concurrent.futures import Future
+
+from bugshot import (
+    BugShotAction,
+    BugShotItem,
+    DEFAULT_RNG,
+    get_observation_bounds,
+)
+
+ACTIONS = list(BugShotAction)
+ITEMS = list(BugShotItem)
+
+# Offsets of the observation entries used by get_action_masks.
+ITEMS_ME_OFFSET = 5
+HANDCUFFED_OFFSET = 5 + 2 * len(ITEMS)
+MAGNIFIED_LIVE_OFFSET = HANDCUFFED_OFFSET + 1
+MAGNIFIED_BLANK_OFFSET = HANDCUFFED_OFFSET + 2
+SAWED_OFFSET = HANDCUFFED_OFFSET + 3
+
+class MLPBugShotPolicy:
+    '''
+    Multi-layer perceptron over observations in the layout of
+    DefaultBugShotStateSelector.select.
+
+    Observations are scaled by get_observation_bounds(max_shell, max_life,
+    max_items) and go through ReLU hidden layers into a policy head with one
+    logit per action and a tanh value head, the expected outcome for the
+    player to move. Only inference is implemented; parameters are plain
+    arrays, so a trainer can update them in place.
+    '''
+
+    hidden_sizes: list[int]
+    max_shell: int
+    max_life: int
+    max_items: int
+
+    weights: list[np.ndarray]
+    biases: list[np.ndarray]
+
+    def __init__(
+            self,
+            hidden_sizes: list[int] = (64, 64),
+            max_shell: int = 8,
+            max_life: int = 4,
+            max_items: int = 8,
+            seed: int = None,
+        ):
+
+        self.hidden_sizes = list(hidden_sizes)
+        self.max_shell = max_shell
+        self.max_life = max_life
+        self.max_items = max_items
+
+        bounds = get_observation_bounds(max_shell, max_life, max_items)
+        self.__scales = (1 / bounds).astype(np.float32)
+
+        # Hidden layers, then the policy head and the value head.
+        rng = np.random.default_rng(seed)
+        sizes = [len(bounds)] + self.hidden_sizes
+        shapes = list(zip(sizes[:-1], sizes[1:])) + [(sizes[-1], len(ACTIONS)), (sizes[-1], 1)]
+        self.weights = [
+            (rng.standard_normal(shape) * np.sqrt(2 / shape[0])).astype(np.float32)
+            for shape in shapes
+        ]
+        self.biases = [np.zeros(shape[1], dtype=np.float32) for shape in shapes]
+
+    def forward(self, observations: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the (B, len(ACTIONS)) logits and (B,) values of a (B, observation size) batch.
+        '''
+
+        x = np.asarray(observations, dtype=np.float32) * self.__scales
+        for weight, bias in zip(self.weights[:-2], self.biases[:-2]):
+            x = np.maximum(x @ weight + bias, 0)
+        logits = x @ self.weights[-2] + self.biases[-2]
+        values = np.tanh(x @ self.weights[-1] + self.biases[-1])[:, 0]
+        return logits, values
+
+    def select_actions(self, observations: np.ndarray, temperature: float = 0.0, rng: random.Random = None) -> list[BugShotAction]:
+        '''
+        Picks one available action per observation: the most likely one if
+        temperature is 0, otherwise a sample from the softmax of logits / temperature.
+        '''
+
+        observations = np.asarray(observations)
+        logits, _ = self.forward(observations)
+        logits = np.where(get_action_masks(observations), logits, -np.inf)
+
+        if temperature == 0:
+            return [ACTIONS[i] for i in np.argmax(logits, axis=1)]
+
+        rng = DEFAULT_RNG if rng is None else rng
+        logits = logits / temperature
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        cumulative = np.cumsum(probs, axis=1)
+        thresholds = np.array([rng.random() for _ in range(len(probs))]) * cumulative[:, -1]
+        indices = (cumulative <= thresholds[:, None]).sum(axis=1)
+        return [ACTIONS[i] for i in np.minimum(indices, len(ACTIONS) - 1)]
+
+    def save(self, path: str):
+        # Through a file object, as np.savez() would append .npz to a bare
+        # path and load(path) would then not find it.
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                config=np.array([self.max_shell, self.max_life, self.max_items]),
+                hidden_sizes=np.array(self.hidden_sizes, dtype=np.int64),
+                **{f'weight{i}': weight for i, weight in enumerate(self.weights)},
+                **{f'bias{i}': bias for i, bias in enumerate(self.biases)},
+            )
+
+    @staticmethod
+    def load(path: str) -> 'MLPBugShotPolicy':
+        with np.load(path) as data:
+            max_shell, max_life, max_items = data['config'].tolist()
+            policy = MLPBugShotPolicy(
+                hidden_sizes=data['hidden_sizes'].tolist(),
+                max_shell=max_shell,
+                max_life=max_life,
+                max_items=max_items,
+            )
+            policy.weights = [data[f'weight{i}'] for i in range(len(policy.weights))]
+            policy.biases = [data[f'bias{i}'] for i in range(len(policy.biases))]
+        return policy
+
+class BatchingBugShotPolicyServer:
+    '''
+    Serves actions of a policy to many concurrent games, one forward pass per batch.
+
+    submit() queues an observation and returns a Future of its action, so a
+    single thread can drive many games, and act() blocks on it for callers
+    with a thread per game. A serving thread takes the first queued request,
+    waits up to max_wait_time seconds for more until max_batch_size, and
+    answers the whole batch at once. NumPy releases the GIL in the forward
+    pass, so games keep running while a batch is evaluated.
+    '''
+
+    policy: MLPBugShotPolicy
+    max_batch_size: int
+    max_wait_time: float
+    temperature: float
+    rng: random.Random
+
+    num_requests: int
+    num_batches: int
+
+    def __init__(
+            self,
+            policy: MLPBugShotPolicy,
+            max_batch_size: int = 256,
+            max_wait_time: float = 0.002,
+            temperature: float = 0.0,
+            rng: random.Random = None,
+        ):
+
+        self.policy = policy
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.temperature = temperature
+        self.rng = DEFAULT_RNG if rng is None else rng
+
+        self.num_requests = 0
+        self.num_batches = 0
+
+        self.__requests = queue.SimpleQueue()
+        self.__thread = threading.Thread(target=self.__serve, daemon=True)
+        self.__thread.start()
+
+    def submit(self, observation: list[int]) -> Future:
+        future = Future()
+        self.__requests.put((observation, future))
+        return future
+
+    def act(self, observation: list[int]) -> BugShotAction:
+        return self.submit(observation).result()
+
+    def get_mean_batch_size(self) -> float:
+        return self.num_requests / self.num_batches if self.num_batches > 0 else 0.0
+
+    def close(self):
+        if self.__thread.is_alive():
+            self.__requests.put(None)
+            self.__thread.join()
+
+    def __enter__(self) -> 'BatchingBugShotPolicyServer':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __serve(self):
+        is_closing = False
+        while not is_closing:
+            request = self.__requests.get()
+            if request is None:
+                break
+
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait_time
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self.__requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    is_closing = True
+                    break
+                batch.append(request)
+
+            self.__answer(batch)
+
+    def __answer(self, batch: list[tuple[list[int], Future]]):
+        try:
+            observations = np.array([observation for observation, _ in batch])
+            actions = self.policy.select_actions(observations, self.temperature, self.rng)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.num_requests += len(batch)
+        self.num_batches += 1
+        for (_, future), action in zip(batch, actions):
+            future.set_result(action)
+
+def get_action_masks(observations: np.ndarray) -> np.ndarray:
+    '''
+    Boolean (B, len(ACTIONS)) masks of the available actions, read from the
+    observations alone by the rules of DefaultBugShotStateDispatcher.
+    '''
+
+    observations = np.asarray(observations)
+    items = observations[:, ITEMS_ME_OFFSET:ITEMS_ME_OFFSET+len(ITEMS)] > 0
+    is_magnified = (observations[:, MAGNIFIED_LIVE_OFFSET] > 0) | (observations[:, MAGNIFIED_BLANK_OFFSET] > 0)
+
+    masks = np.empty((len(observations), len(ACTIONS)), dtype=bool)
+    masks[:, 0] = True
+    masks[:, 1] = True
+    masks[:, 2] = items[:, ITEMS.index(BugShotItem.HANDCUFFS)] & (observations[:, HANDCUFFED_OFFSET] == 0)
+    masks[:, 3] = items[:, ITEMS.index(BugShotItem.BEER)]
+    masks[:, 4] = items[:, ITEMS.index(BugShotItem.MAGNIFYING_GLASS)] & ~is_magnified
+    masks[:, 5] = items[:, ITEMS.index(BugShotItem.CIGARATTES)]
+    masks[:, 6] = items[:, ITEMS.index(BugShotItem.HAND_SAW)] & (observations[:, SAWED_OFFSET] == 0)
+    return masks
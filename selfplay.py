@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import copy
+import glob
+import time
+import threading
+import multiprocessing
+
+import numpy as np
+
+from collections.abc import Iterator
+
+from bugshot import (
+    BugShotGameBuilder,
+    BugShotGameConfig,
+    BugShotAction,
+    BugShotPlayer,
+    ACTION_BITS,
+    reseed_rngs,
+)
+from agent import BugShotGameAgent
+
+ACTIONS = list(BugShotAction)
+
+SHARD_PATTERN = 'shard-*.npz'
+# Written by SelfPlayPipeline once every worker has flushed its last shard.
+DONE_MARKER = 'DONE'
+
+class ReplayShardWriter:
+    '''
+    Buffers self-play positions and writes them as compressed .npz shards.
+
+    A shard holds shard_size positions as arrays: observations (int16,
+    (N, OBSERVATION_SIZE)), masks (bool, (N, len(ACTIONS))), policies
+    (float32, (N, len(ACTIONS)), normalized visit counts) and outcomes (int8,
+    +1 if the player to move won, -1 if it lost, 0 for unfinished games).
+    Shards are written to a temporary name and renamed, so readers never
+    see a partial shard.
+    '''
+
+    directory: str
+    prefix: str
+    shard_size: int
+    num_shards: int
+
+    def __init__(self, directory: str, prefix: str, shard_size: int = 4096):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.num_shards = 0
+        self.__rows: list[tuple[list[int], list[bool], list[float], int]] = list()
+
+    def add(self, observation: list[int], mask: list[bool], policy: list[float], outcome: int):
+        self.__rows.append((observation, mask, policy, outcome))
+        if len(self.__rows) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.__rows) == 0:
+            return
+
+        observations, masks, policies, outcomes = zip(*self.__rows)
+        name = f'shard-{self.prefix}-{self.num_shards:06d}.npz'
+        temp_path = os.path.join(self.directory, f'.{name}.tmp')
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                observations=np.array(observations, dtype=np.int16),
+                masks=np.array(masks, dtype=bool),
+                policies=np.array(policies, dtype=np.float32),
+                outcomes=np.array(outcomes, dtype=np.int8),
+            )
+        os.replace(temp_path, os.path.join(self.directory, name))
+
+        self.num_shards += 1
+        self.__rows = list()
+
+class ReplayStoreReader:
+    '''
+    Streams the shards of a replay directory to a learner.
+
+    iter_shards() yields every shard once, in the order they appear. With
+    follow, it waits for new shards until the DONE marker is written and
+    every shard has been read; otherwise it stops at the shards already
+    there. iter_batches() regroups the stream into batches of batch_size
+    positions.
+    '''
+
+    directory: str
+    follow: bool
+    poll_interval: float
+
+    num_samples: int
+
+    def __init__(self, directory: str, follow: bool = True, poll_interval: float = 0.5):
+        self.directory = directory
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.num_samples = 0
+        self.__seen: set[str] = set()
+        self.__started = None
+
+    def iter_shards(self) -> Iterator[dict[str, np.ndarray]]:
+        self.__started = time.monotonic()
+        while True:
+            # Check the marker first, so shards written before it are not missed.
+            is_done = os.path.exists(os.path.join(self.directory, DONE_MARKER))
+
+            paths = sorted(
+                set(glob.glob(os.path.join(self.directory, SHARD_PATTERN))) - self.__seen,
+                key=os.path.getmtime,
+            )
+            for path in paths:
+                self.__seen.add(path)
+                with np.load(path) as data:
+                    shard = {name: data[name] for name in data.files}
+                self.num_samples += len(shard['outcomes'])
+                yield shard
+
+            if len(paths) == 0:
+                if is_done or not self.follow:
+                    return
+                time.sleep(self.poll_interval)
+
+    def iter_batches(self, batch_size: int) -> Iterator[dict[str, np.ndarray]]:
+        pending: list[dict[str, np.ndarray]] = list()
+        num_pending = 0
+        for shard in self.iter_shards():
+            pending.append(shard)
+            num_pending += len(shard['outcomes'])
+            if num_pending < batch_size:
+                continue
+
+            merged = {name: np.concatenate([shard[name] for shard in pending]) for name in pending[0]}
+            num_batches = num_pending // batch_size
+            for i in range(num_batches):
+                yield {name: array[i*batch_size:(i+1)*batch_size] for name, array in merged.items()}
+
+            rest = {name: array[num_batches*batch_size:] for name, array in merged.items()}
+            pending = [rest]
+            num_pending = len(rest['outcomes'])
+
+        if num_pending > 0:
+            yield {name: np.concatenate([shard[name] for shard in pending]) for name in pending[0]}
+
+    def get_samples_per_second(self) -> float:
+        if self.__started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.__started
+        return self.num_samples / elapsed if elapsed > 0 else 0.0
+
+class SelfPlayPipeline:
+    '''
+    Worker processes playing agent against a copy of itself and writing
+    every position to a replay directory.
+
+    agent has to expose get_visit_counts() for its last act(), like the
+    Monte Carlo and tree search agents; the counts become the policy
+    target. Worker i plays games i, i + num_workers, ... up to total_games.
+    Before every game both agents are reset and reseeded from (seed, game,
+    seat), so the data does not depend on num_workers.
+    num_games and num_positions are shared counters for sizing the worker
+    pool against the learner.
+    '''
+
+    config: BugShotGameConfig
+    agent: BugShotGameAgent
+    directory: str
+    num_workers: int
+    total_games: int
+    shard_size: int
+    seed: int
+    max_steps: int
+
+    def __init__(
+            self,
+            config: BugShotGameConfig,
+            agent: BugShotGameAgent,
+            directory: str,
+            num_workers: int = None,
+            total_games: int = 1000,
+            shard_size: int = 4096,
+            seed: int = 0,
+            max_steps: int = 1000,
+        ):
+
+        self.config = config
+        self.agent = agent
+        self.directory = directory
+        self.num_workers = num_workers or os.cpu_count()
+        self.total_games = total_games
+        self.shard_size = shard_size
+        self.seed = seed
+        self.max_steps = max_steps
+
+        self.__num_games = multiprocessing.Value('q', 0)
+        self.__num_positions = multiprocessing.Value('q', 0)
+        self.__processes: list[multiprocessing.Process] = list()
+        self.__started = None
+
+    @property
+    def num_games(self) -> int:
+        return self.__num_games.value
+
+    @property
+    def num_positions(self) -> int:
+        return self.__num_positions.value
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        marker = os.path.join(self.directory, DONE_MARKER)
+        if os.path.exists(marker):
+            os.remove(marker)
+
+        self.__started = time.monotonic()
+        for worker_index in range(self.num_workers):
+            process = multiprocessing.Process(
+                target=_run_self_play_worker,
+                args=(self, worker_index),
+                daemon=True,
+            )
+            process.start()
+            self.__processes.append(process)
+
+    def join(self):
+        for process in self.__processes:
+            process.join()
+        self.__processes = list()
+        with open(os.path.join(self.directory, DONE_MARKER), 'w'):
+            pass
+
+    def get_throughput(self) -> dict[str, float]:
+        elapsed = time.monotonic() - self.__started if self.__started is not None else 0.0
+        return {
+            'games_per_second': self.num_games / elapsed if elapsed > 0 else 0.0,
+            'positions_per_second': self.num_positions / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_SelfPlayPipeline__processes'] = list()
+        return state
+
+    def _play_game(self, game_index: int, writer: ReplayShardWriter, agents: dict[BugShotPlayer, BugShotGameAgent]) -> int:
+        seed = f'{self.seed}:{game_index}'
+        for player, agent in agents.items():
+            agent.reset()
+            reseed_rngs(agent, f'{seed}:{player.value}', reseed_default=True)
+        game = BugShotGameBuilder().build(config=self.config, seed=seed)
+
+        positions: list[tuple[list[int], list[bool], list[float], BugShotPlayer]] = list()
+        for _ in range(self.max_steps):
+            if game.get_winner() is not None:
+                break
+
+            turn = game.get_turn()
+            agent = agents[turn]
+            observation = game.observe()
+            action = agent.act(observation)
+
+            action_mask = game.dispatcher.get_action_mask(game.state)
+            mask = [bool(action_mask & ACTION_BITS[available]) for available in ACTIONS]
+            visit_counts = agent.get_visit_counts()
+            num_visits = sum(visit_counts.values())
+            if num_visits > 0:
+                policy = [visit_counts.get(visited, 0) / num_visits for visited in ACTIONS]
+            else:
+                policy = [float(visited == action) for visited in ACTIONS]
+            positions.append((observation, mask, policy, turn))
+
+            game.do_action(action)
+
+        winner = game.get_winner()
+        for observation, mask, policy, turn in positions:
+            outcome = 0 if winner is None else 1 if winner == turn else -1
+            writer.add(observation, mask, policy, outcome)
+
+        with self.__num_games.get_lock():
+            self.__num_games.value += 1
+        with self.__num_positions.get_lock():
+            self.__num_positions.value += len(positions)
+        return len(positions)
+
+def _run_self_play_worker(pipeline: SelfPlayPipeline, worker_index: int):
+    writer = ReplayShardWriter(pipeline.directory, prefix=f'{pipeline.seed}-{worker_index}', shard_size=pipeline.shard_size)
+    agents = {
+        BugShotPlayer.PLAYER1: pipeline.agent,
+        BugShotPlayer.PLAYER2: copy.deepcopy(pipeline.agent),
+    }
+    for game_index in range(worker_index, pipeline.total_games, pipeline.num_workers):
+        pipeline._play_game(game_index, writer, agents)
+    writer.flush()
+
+def main():
+    from agent import MonteCarloTreeSearchBugShotGameAgent
+    from decoder import CombinationBugShotStateDecoder
+    from explorer import RandomBugShotStateExplorer
+
+    if len(sys.argv) < 2:
+        print(f'Usage: {sys.argv[0]} <replay directory> [num games]')
+        sys.exit(1)
+
+    config = BugShotGameConfig(
+        min_items_per_init=2,
+        max_items_per_init=4,
+        max_items_per_board=8,
+        min_shell=3,
+        max_shell=8,
+        min_initial_life=2,
+        max_initial_life=3,
+    )
+    dispatcher = BugShotGameBuilder().build(config=config).dispatcher
+    agent = MonteCarloTreeSearchBugShotGameAgent(
+        dispatcher=dispatcher,
+        decoder=CombinationBugShotStateDecoder(max_chambers=100),
+        explorer=RandomBugShotStateExplorer(dispatcher=dispatcher),
+        time_limit=float('inf'),
+        max_iterations=200,
+    )
+
+    pipeline = SelfPlayPipeline(
+        config=config,
+        agent=agent,
+        directory=sys.argv[1],
+        total_games=100 if len(sys.argv) < 3 else int(sys.argv[2]),
+        shard_size=1024,
+    )
+    pipeline.start()
+    threading.Thread(target=pipeline.join, daemon=True).start()
+
+    reader = ReplayStoreReader(sys.argv[1])
+    for batch in reader.iter_batches(batch_size=256):
+        throughput = pipeline.get_throughput()
+        print(
+            f'{len(batch["outcomes"])} positions, '
+            f'self-play {throughput["positions_per_second"]:.1f} positions/s, '
+            f'learner {reader.get_samples_per_second():.1f} positions/s'
+        )
+    print(f'{pipeline.num_games} games, {pipeline.num_positions} positions, {reader.num_samples} read')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+
+import os
+import json
+import random
+import logging
+import asyncio
+import argparse
+import concurrent.futures
+
+from bugshot import (
+    BugShotGame,
+    BugShotGameBuilder,
+    BugShotGameConfig,
+    BugShotAction,
+    BugShotPlayer,
+    BugShotShell,
+    BugShotState,
+    reseed_rngs,
+)
+from agent import BugShotGameAgent, BanditMonteCarloBugShotGameAgent, RandomBugShotGameAgent
+from decoder import ExactBugShotStateDecoder
+from explorer import RandomBugShotStateExplorer
+
+CONFIG = BugShotGameConfig(
+    min_items_per_init=2,
+    max_items_per_init=4,
+    max_items_per_board=8,
+    min_shell=3,
+    max_shell=8,
+    min_initial_life=2,
+    max_initial_life=3,
+)
+
+logger = logging.getLogger(__name__)
+
+HUMAN = BugShotPlayer.PLAYER1
+AI = BugShotPlayer.PLAYER2
+
+# Longest line a client may send, in bytes.
+MAX_LINE_LENGTH = 4096
+
+class BugShotMatchSession:
+    '''
+    Game of one connection, with the human as HUMAN and the AI as AI.
+    '''
+
+    seed: str
+    game: BugShotGame
+    fallback_agent: BugShotGameAgent
+    num_moves: int
+
+    def __init__(self, config: BugShotGameConfig, seed: str):
+        self.seed = seed
+        self.game = BugShotGameBuilder().build(config=config, seed=seed)
+        self.fallback_agent = RandomBugShotGameAgent(
+            dispatcher=self.game.dispatcher,
+            rng=random.Random(f'{seed}:fallback'),
+        )
+        self.num_moves = 0
+
+class BugShotMatchServer:
+    '''
+    Hosts human-vs-AI games over a JSON line protocol on a local socket.
+
+    Every connection is a session that plays one game at a time. Each line
+    holds one JSON object. A client sends {"type": "start", "seed": ...} to
+    start a new game. The seed is optional. It sends
+    {"type": "action", "action": ...} with a BugShotAction value to move.
+    The server replies with these messages:
+    - {"type": "start", "seed": ...} when a game starts.
+    - {"type": "state", "state": ..., "actions": ...} before every move.
+      The actions list is empty unless the human is to move.
+    - {"type": "action", "player": ..., "action": ..., "is_fallback": ...}
+      for every move of either player.
+    - {"type": "end", "winner": ...} when the game is over.
+    - {"type": "error", "message": ...} for a bad request. The session is
+      closed only if it is full, idle or sends an overlong line.
+
+    AI moves run on a process pool shared by every session. Each worker
+    holds a copy of agent, so agent must not keep state between act()
+    calls. At most max_pending_moves AI moves are queued or running at
+    once, and a slot is only freed when its worker is done. If a session's
+    move is not back within move_deadline seconds of its turn, the session
+    plays a random move. Agents with a time_limit get at most the time
+    left, less deadline_margin. Dispatching and I/O stay on the event loop.
+    One slow AI move or slow reader therefore holds up only its session.
+    '''
+
+    config: BugShotGameConfig
+    agent: BugShotGameAgent
+    host: str
+    port: int
+    max_workers: int
+    max_pending_moves: int
+    max_sessions: int
+    move_deadline: float
+    deadline_margin: float
+    idle_timeout: float
+
+    num_sessions: int
+    num_ai_moves: int
+    num_fallback_moves: int
+
+    def __init__(
+            self,
+            config: BugShotGameConfig,
+            agent: BugShotGameAgent,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            max_workers: int = None,
+            max_pending_moves: int = None,
+            max_sessions: int = 4096,
+            move_deadline: float = 5.0,
+            deadline_margin: float = 0.5,
+            idle_timeout: float = 600.0,
+        ):
+
+        self.config = config
+        self.agent = agent
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers or os.cpu_count()
+        self.max_pending_moves = max_pending_moves or self.max_workers
+        self.max_sessions = max_sessions
+        self.move_deadline = move_deadline
+        self.deadline_margin = deadline_margin
+        self.idle_timeout = idle_timeout
+
+        self.num_sessions = 0
+        self.num_ai_moves = 0
+        self.num_fallback_moves = 0
+
+        self.__server = None
+        self.__pool = None
+        self.__slots = None
+        self.__tasks: set[asyncio.Task] = set()
+        self.__writers: set[asyncio.StreamWriter] = set()
+        self.__is_closing = False
+
+    async def start(self) -> tuple[str, int]:
+        '''
+        Starts the process pool and listens. Returns the bound address.
+        '''
+
+        self.__pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(self.agent,),
+        )
+        self.__slots = asyncio.Semaphore(self.max_pending_moves)
+        self.__is_closing = False
+        self.__server = await asyncio.start_server(
+            self.__accept,
+            host=self.host,
+            port=self.port,
+            limit=MAX_LINE_LENGTH,
+        )
+        return self.__server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        await self.__server.serve_forever()
+
+    async def close(self):
+        self.__is_closing = True
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+        # Closing the transports ends sessions waiting on their client, and
+        # cancelling ends the ones waiting on an AI move.
+        for writer in list(self.__writers):
+            writer.transport.close()
+        while len(self.__tasks) > 0:
+            # asyncio.wait_for() of Python 3.11 drops a cancellation that
+            # lands as its future completes, so cancel until sessions end.
+            for task in list(self.__tasks):
+                task.cancel()
+            await asyncio.wait(list(self.__tasks), timeout=0.1)
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=False, cancel_futures=True)
+            self.__pool = None
+
+    def __accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Sessions are tasks of their own rather than coroutines of the
+        # server, so close() can cancel them without it counting as an error.
+        task = asyncio.get_running_loop().create_task(self.__handle(reader, writer))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.__is_closing or self.num_sessions >= self.max_sessions:
+            try:
+                await self.__send(writer, {'type': 'error', 'message': 'Server is closing' if self.__is_closing else 'Server is full'})
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+            await self.__close_writer(writer)
+            return
+
+        self.num_sessions += 1
+        self.__writers.add(writer)
+        try:
+            session = None
+            while not self.__is_closing:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self.__send(writer, {'type': 'error', 'message': 'Session idle for too long'})
+                    break
+                except ValueError:
+                    await self.__send(writer, {'type': 'error', 'message': f'Line longer than {MAX_LINE_LENGTH} bytes'})
+                    break
+                if len(line) == 0 or self.__is_closing:
+                    break
+
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError('Expected a JSON object')
+                    session = await self.__receive(writer, session, message)
+                except ValueError as e:
+                    await self.__send(writer, {'type': 'error', 'message': str(e)})
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.num_sessions -= 1
+            self.__writers.discard(writer)
+            await self.__close_writer(writer)
+
+    async def __receive(self, writer: asyncio.StreamWriter, session: BugShotMatchSession, message: dict) -> BugShotMatchSession:
+        if message.get('type') == 'start':
+            seed = message.get('seed')
+            seed = f'{random.getrandbits(64):016x}' if seed is None else str(seed)
+            session = BugShotMatchSession(self.config, seed)
+            await self.__send(writer, {'type': 'start', 'seed': seed})
+        elif message.get('type') == 'action':
+            if session is None or session.game.get_winner() is not None:
+                raise ValueError('No game in progress')
+            try:
+                action = BugShotAction(message.get('action'))
+            except ValueError:
+                raise ValueError(f'Unknown action: {message.get("action")}')
+            if action not in session.game.dispatcher.get_available_actions(session.game.state):
+                raise ValueError(f'Unavailable action: {action.value}')
+            await self.__move(writer, session, HUMAN, action, False)
+        else:
+            raise ValueError(f'Unknown message type: {message.get("type")}')
+
+        await self.__advance(writer, session)
+        return session
+
+    async def __advance(self, writer: asyncio.StreamWriter, session: BugShotMatchSession):
+        '''
+        Plays AI moves until the human is to move or the game is over.
+        '''
+
+        game = session.game
+        while game.get_winner() is None and game.get_turn() == AI and not self.__is_closing:
+            await self.__send(writer, {'type': 'state', 'state': get_view(game.state), 'actions': []})
+            action, is_fallback = await self.__think(session)
+            await self.__move(writer, session, AI, action, is_fallback)
+
+        if self.__is_closing:
+            return
+        if game.get_winner() is not None:
+            await self.__send(writer, {'type': 'end', 'winner': game.get_winner().value})
+        else:
+            actions = game.dispatcher.get_available_actions(game.state)
+            await self.__send(writer, {'type': 'state', 'state': get_view(game.state), 'actions': [action.value for action in actions]})
+
+    async def __move(self, writer: asyncio.StreamWriter, session: BugShotMatchSession, player: BugShotPlayer, action: BugShotAction, is_fallback: bool):
+        session.game.do_action(action)
+        session.num_moves += 1
+        await self.__send(writer, {'type': 'action', 'player': player.value, 'action': action.value, 'is_fallback': is_fallback})
+
+    async def __think(self, session: BugShotMatchSession) -> tuple[BugShotAction, bool]:
+        '''
+        Returns the AI's move and whether it is a fallback move.
+        '''
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.move_deadline
+        observation = session.game.observe()
+        self.num_ai_moves += 1
+
+        try:
+            await asyncio.wait_for(self.__slots.acquire(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            return self.__fall_back(session, observation), True
+
+        time_limit = deadline - loop.time() - self.deadline_margin
+        if time_limit <= 0:
+            self.__slots.release()
+            return self.__fall_back(session, observation), True
+
+        try:
+            future = self.__pool.submit(
+                _act_worker,
+                observation,
+                f'{session.seed}:{session.num_moves}',
+                time_limit,
+            )
+        except BaseException:
+            self.__slots.release()
+            raise
+        # The slot is held until the worker is done, even after a timeout.
+        future.add_done_callback(lambda _: self.__release_slot(loop))
+
+        try:
+            action = await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0.0))
+        except asyncio.TimeoutError:
+            return self.__fall_back(session, observation), True
+        except Exception as e:
+            logger.warning('AI move of session %s failed: %r', session.seed, e)
+            return self.__fall_back(session, observation), True
+        return action, False
+
+    def __fall_back(self, session: BugShotMatchSession, observation: list[int]) -> BugShotAction:
+        self.num_fallback_moves += 1
+        return session.fallback_agent.act(observation)
+
+    def __release_slot(self, loop: asyncio.AbstractEventLoop):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self.__slots.release)
+
+    async def __send(self, writer: asyncio.StreamWriter, message: dict):
+        writer.write(json.dumps(message).encode() + b'\n')
+        # A client that stops reading blocks only its own session.
+        await asyncio.wait_for(writer.drain(), self.idle_timeout)
+
+    async def __close_writer(self, writer: asyncio.StreamWriter):
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+def get_view(state: BugShotState) -> dict:
+    '''
+    What the human sees of state, as JSON-compatible values.
+    '''
+
+    return {
+        'turn': state.turn.value,
+        'num_live_shells': state.chamber.count(BugShotShell.LIVE),
+        'num_blank_shells': state.chamber.count(BugShotShell.BLANK),
+        'lives': {player.value: state.life_dict[player] for player in BugShotPlayer},
+        'items': {
+            player.value: {item.value: num for item, num in state.item_boards[player].remains.items()}
+            for player in BugShotPlayer
+        },
+        'is_opponent_handcuffed': state.is_opponent_handcuffed,
+        'magnified': state.chamber[-1].value if state.is_magnified_shell else None,
+        'is_shotgun_sawed': state.is_shotgun_sawed,
+    }
+
+def build_agent(config: BugShotGameConfig) -> BugShotGameAgent:
+    dispatcher = BugShotGameBuilder().build(config=config).dispatcher
+    return BanditMonteCarloBugShotGameAgent(
+        num_trials=10000,
+        dispatcher=dispatcher,
+        decoder=ExactBugShotStateDecoder(),
+        explorer=RandomBugShotStateExplorer(dispatcher=dispatcher),
+        time_limit=2.0,
+    )
+
+_worker_agent: BugShotGameAgent = None
+_worker_time_limit: float = None
+
+def _init_worker(agent: BugShotGameAgent):
+    global _worker_agent, _worker_time_limit
+    _worker_agent = agent
+    _worker_time_limit = getattr(agent, 'time_limit', None)
+
+def _act_worker(observation: list[int], seed: str, time_limit: float) -> BugShotAction:
+    reseed_rngs(_worker_agent, seed, reseed_default=True)
+    if hasattr(_worker_agent, 'time_limit'):
+        _worker_agent.time_limit = time_limit if _worker_time_limit is None else min(time_limit, _worker_time_limit)
+    return _worker_agent.act(observation)
+
+async def serve(server: BugShotMatchServer):
+    host, port = await server.start()
+    logger.info('Serving on %s:%d with %d AI workers', host, port, server.max_workers)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Hosts human-vs-AI games for game.py clients.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, help='AI worker processes (default: one per CPU)')
+    parser.add_argument('--max-pending-moves', type=int, help='AI moves queued or running at once (default: --workers)')
+    parser.add_argument('--max-sessions', type=int, default=4096)
+    parser.add_argument('--move-deadline', type=float, default=5.0, help='seconds before an AI move falls back to a random one (default 5)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    server = BugShotMatchServer(
+        config=CONFIG,
+        agent=build_agent(CONFIG),
+        host=args.host,
+        port=args.port,
+        max_workers=args.workers,
+        max_pending_moves=args.max_pending_moves,
+        max_sessions=args.max_sessions,
+        move_deadline=args.move_deadline,
+    )
+    try:
+        asyncio.run(serve(server))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
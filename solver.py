@@ -0,0 +1,379 @@
+from bugshot import (
+    BugShotAction,
+    BugShotGameConfig,
+    BugShotItem,
+    DefaultBugShotChamberInitializer,
+    DefaultBugShotItemBoardInitializer,
+    get_item_count_distribution,
+)
+
+ITEMS = list(BugShotItem)
+HANDCUFFS = ITEMS.index(BugShotItem.HANDCUFFS)
+BEER = ITEMS.index(BugShotItem.BEER)
+MAGNIFYING_GLASS = ITEMS.index(BugShotItem.MAGNIFYING_GLASS)
+CIGARATTES = ITEMS.index(BugShotItem.CIGARATTES)
+HAND_SAW = ITEMS.index(BugShotItem.HAND_SAW)
+
+TOP_UNKNOWN = 0
+TOP_LIVE = 1
+TOP_BLANK = 2
+
+# A solver state is seen from the player to move:
+# (num_live, num_blank, top, init_life, life_me, life_opponent,
+#  items_me, items_opponent, is_opponent_handcuffed, is_shotgun_sawed)
+# top is TOP_LIVE/TOP_BLANK when the magnifying glass showed the top shell.
+SolverState = tuple[int, int, int, int, int, int, tuple[int, ...], tuple[int, ...], bool, bool]
+
+class BugShotGameSolver:
+    '''
+    Exact expectiminimax over the rules of DefaultBugShotStateDispatcher
+    with DefaultBugShotChamberInitializer and DefaultBugShotItemBoardInitializer.
+
+    Both players see the same observation, so a state is the observation
+    itself: shell order only enters as chance nodes on the top shell, and
+    reloads/refills as chance nodes over the initializers' outcomes.
+
+    Item refills let a game return to a state it has already been in, so
+    values of states right after a reload are found by value iteration until
+    they move less than tolerance. Within a chamber every action uses up a
+    shell or an item, so the rest is plain memoized recursion. Values are
+    win probabilities of the player to move.
+
+    If max_iterations sweeps are not enough, solving raises RuntimeError;
+    is_converged then stays False and residual holds the largest change of
+    the last sweep, until a later solve converges again.
+    '''
+
+    config: BugShotGameConfig
+    tolerance: float
+    max_iterations: int
+    is_converged: bool
+    residual: float
+
+    def __init__(self, config: BugShotGameConfig, tolerance: float = 1e-9, max_iterations: int = 1000):
+        if config.min_shell < 2:
+            raise ValueError('min_shell must be greater than or equal to 2')
+
+        self.config = config
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.is_converged = True
+        self.residual = 0.0
+
+        self.__values: dict[SolverState, float] = dict()
+        self.__reload_values: dict[tuple[SolverState, bool], float] = dict()
+        self.__round_values: dict[SolverState, float] = dict()
+        self.__round_queue: list[SolverState] = list()
+        self.__item_board_initializer = DefaultBugShotItemBoardInitializer(
+            min_items=config.min_items_per_init,
+            max_items=config.max_items_per_init,
+        )
+        self.__chambers = DefaultBugShotChamberInitializer(
+            min_shell=config.min_shell,
+            max_shell=config.max_shell,
+        ).get_distribution()
+        self.__refills = self.__item_board_initializer.get_num_items_distribution()
+
+    def solve(self, observation: list[int]) -> dict[BugShotAction, float]:
+        '''
+        Returns the win probability of every available action for the player
+        who sees observation (in the layout of DefaultBugShotStateSelector).
+        '''
+
+        state = self.observation_to_state(observation)
+        if state not in self.__values:
+            self.__converge([state])
+        return self.__get_action_values(state)
+
+    def solve_game(self):
+        '''
+        Solves every state reachable from the initial observations of config.
+        '''
+
+        roots = [
+            self.observation_to_state(observation)
+            for observation in self.get_initial_observations()
+        ]
+        self.__converge([root for root in roots if root not in self.__values])
+
+    def get_value(self, observation: list[int]) -> float:
+        return max(self.solve(observation).values())
+
+    def get_num_states(self) -> int:
+        return len(self.__values)
+
+    def get_observations(self) -> list[list[int]]:
+        '''
+        Returns the observations of every solved state.
+        '''
+
+        return [self.state_to_observation(state) for state in self.__values]
+
+    def get_initial_observations(self) -> list[list[int]]:
+        observations = list()
+        for init_life in range(self.config.min_initial_life, self.config.max_initial_life + 1):
+            for num_live, num_blank, _ in self.__chambers:
+                for num_items, _ in self.__refills:
+                    for items_player1, _ in get_item_count_distribution(num_items):
+                        for items_player2, _ in get_item_count_distribution(num_items):
+                            state = (num_live, num_blank, TOP_UNKNOWN, init_life, init_life, init_life, items_player1, items_player2, False, False)
+                            observations.append(self.state_to_observation(state))
+        return observations
+
+    @staticmethod
+    def observation_to_state(observation: list[int]) -> SolverState:
+        num_items = len(ITEMS)
+        is_magnified_live = observation[5+2*num_items+1]
+        is_magnified_blank = observation[5+2*num_items+2]
+        top = TOP_LIVE if is_magnified_live else TOP_BLANK if is_magnified_blank else TOP_UNKNOWN
+
+        return (
+            int(observation[0]),
+            int(observation[1]),
+            top,
+            int(observation[2]),
+            int(observation[3]),
+            int(observation[4]),
+            tuple(int(x) for x in observation[5:5+num_items]),
+            tuple(int(x) for x in observation[5+num_items:5+2*num_items]),
+            bool(observation[5+2*num_items]),
+            bool(observation[5+2*num_items+3]),
+        )
+
+    @staticmethod
+    def state_to_observation(state: SolverState) -> list[int]:
+        num_live, num_blank, top, init_life, life_me, life_opponent, items_me, items_opponent, is_opponent_handcuffed, is_shotgun_sawed = state
+        return [
+            num_live,
+            num_blank,
+            init_life,
+            life_me,
+            life_opponent,
+            *items_me,
+            *items_opponent,
+            int(is_opponent_handcuffed),
+            int(top == TOP_LIVE),
+            int(top == TOP_BLANK),
+            int(is_shotgun_sawed),
+        ]
+
+    def __converge(self, roots: list[SolverState]):
+        for root in roots:
+            if root not in self.__round_values:
+                self.__round_values[root] = 0.5
+                self.__round_queue.append(root)
+
+        delta = float('inf')
+        for _ in range(self.max_iterations):
+            self.__values = dict()
+            self.__reload_values = dict()
+            delta = 0.0
+
+            # __get_round_value appends newly reached states while we iterate.
+            i = 0
+            while i < len(self.__round_queue):
+                state = self.__round_queue[i]
+                value = self.__get_value(state)
+                delta = max(delta, abs(value - self.__round_values[state]))
+                self.__round_values[state] = value
+                i += 1
+
+            if delta < self.tolerance:
+                break
+
+        self.residual = delta
+        self.is_converged = delta < self.tolerance
+        if not self.is_converged:
+            raise RuntimeError(
+                f'Value iteration did not converge in {self.max_iterations} iterations: '
+                f'residual {delta:.3g}, tolerance {self.tolerance:.3g}.'
+            )
+
+    def __get_value(self, state: SolverState) -> float:
+        value = self.__values.get(state)
+        if value is None:
+            value = max(self.__get_action_values(state).values())
+            self.__values[state] = value
+        return value
+
+    def __get_round_value(self, state: SolverState) -> float:
+        value = self.__round_values.get(state)
+        if value is None:
+            value = self.__round_values[state] = 0.5
+            self.__round_queue.append(state)
+        return value
+
+    def __get_action_values(self, state: SolverState) -> dict[BugShotAction, float]:
+        _, _, top, _, _, _, items_me, _, is_opponent_handcuffed, is_shotgun_sawed = state
+
+        values = {
+            BugShotAction.USE_SHOTGUN_SELF: self.__use_shotgun(state, to_self=True),
+            BugShotAction.USE_SHOTGUN_OPPONENT: self.__use_shotgun(state, to_self=False),
+        }
+        if items_me[HANDCUFFS] > 0 and not is_opponent_handcuffed:
+            values[BugShotAction.USE_HANDCUFFS] = self.__use_handcuffs(state)
+        if items_me[BEER] > 0:
+            values[BugShotAction.USE_BEER] = self.__use_beer(state)
+        if items_me[MAGNIFYING_GLASS] > 0 and top == TOP_UNKNOWN:
+            values[BugShotAction.USE_MAGNIYING_GLASS] = self.__use_magnifying_glass(state)
+        if items_me[CIGARATTES] > 0:
+            values[BugShotAction.USE_CIGARATTES] = self.__use_cigarattes(state)
+        if items_me[HAND_SAW] > 0 and not is_shotgun_sawed:
+            values[BugShotAction.USE_HAND_SAW] = self.__use_hand_saw(state)
+        return values
+
+    def __use_shotgun(self, state: SolverState, to_self: bool) -> float:
+        num_live, num_blank, top, init_life, life_me, life_opponent, items_me, items_opponent, is_opponent_handcuffed, is_shotgun_sawed = state
+
+        value = 0.0
+        for is_live, probability in self.__get_top_outcomes(num_live, num_blank, top):
+            damage = (2 if is_shotgun_sawed else 1) if is_live else 0
+            next_life_me = life_me - damage if to_self else life_me
+            next_life_opponent = life_opponent if to_self else life_opponent - damage
+
+            if next_life_me <= 0:
+                value += probability * 0.0
+                continue
+            if next_life_opponent <= 0:
+                value += probability * 1.0
+                continue
+
+            next_state = (
+                num_live - is_live,
+                num_blank - (not is_live),
+                TOP_UNKNOWN,
+                init_life,
+                next_life_me,
+                next_life_opponent,
+                items_me,
+                items_opponent,
+                is_opponent_handcuffed,
+                False,
+            )
+
+            if not to_self or damage > 0:
+                if is_opponent_handcuffed:
+                    next_state = next_state[:8] + (False, False)
+                    value += probability * self.__dispatch_common(next_state, False)
+                else:
+                    value += probability * (1.0 - self.__dispatch_common(self.__swap(next_state), False))
+            else:
+                value += probability * self.__dispatch_common(next_state, False)
+
+        return value
+
+    def __use_handcuffs(self, state: SolverState) -> float:
+        next_state = self.__use_item(state, HANDCUFFS)
+        return self.__get_value(next_state[:8] + (True, next_state[9]))
+
+    def __use_beer(self, state: SolverState) -> float:
+        num_live, num_blank, top, init_life, life_me, life_opponent, _, items_opponent, is_opponent_handcuffed, is_shotgun_sawed = state
+        items_me = self.__use_item(state, BEER)[6]
+
+        # The magnified flag outlives the beer and shows the next shell.
+        is_magnified = top != TOP_UNKNOWN
+        value = 0.0
+        for is_live, probability in self.__get_top_outcomes(num_live, num_blank, top):
+            next_state = (
+                num_live - is_live,
+                num_blank - (not is_live),
+                TOP_UNKNOWN,
+                init_life,
+                life_me,
+                life_opponent,
+                items_me,
+                items_opponent,
+                is_opponent_handcuffed,
+                is_shotgun_sawed,
+            )
+            value += probability * self.__dispatch_common(next_state, is_magnified)
+        return value
+
+    def __use_magnifying_glass(self, state: SolverState) -> float:
+        return self.__reveal(self.__use_item(state, MAGNIFYING_GLASS), self.__get_value)
+
+    def __use_cigarattes(self, state: SolverState) -> float:
+        next_state = self.__use_item(state, CIGARATTES)
+        init_life = next_state[3]
+        life_me = next_state[4]
+        if life_me < init_life:
+            next_state = next_state[:4] + (life_me + 1,) + next_state[5:]
+        return self.__get_value(next_state)
+
+    def __use_hand_saw(self, state: SolverState) -> float:
+        next_state = self.__use_item(state, HAND_SAW)
+        return self.__get_value(next_state[:9] + (True,))
+
+    def __use_item(self, state: SolverState, item_index: int) -> SolverState:
+        items_me = state[6]
+        items_me = items_me[:item_index] + (items_me[item_index] - 1,) + items_me[item_index+1:]
+        return state[:6] + (items_me,) + state[7:]
+
+    def __dispatch_common(self, state: SolverState, is_magnified: bool) -> float:
+        if state[0] + state[1] > 0:
+            if is_magnified:
+                return self.__reveal(state, self.__get_value)
+            return self.__get_value(state)
+
+        value = self.__reload_values.get((state, is_magnified))
+        if value is not None:
+            return value
+
+        _, _, _, init_life, life_me, life_opponent, items_me, items_opponent, is_opponent_handcuffed, is_shotgun_sawed = state
+        get_value = self.__get_round_value
+
+        value = 0.0
+        for num_live, num_blank, chamber_probability in self.__chambers:
+            for num_items, refill_probability in self.__refills:
+                for new_items_me, probability_me in self.__get_refill_distribution(items_me, num_items):
+                    for new_items_opponent, probability_opponent in self.__get_refill_distribution(items_opponent, num_items):
+                        next_state = (
+                            num_live,
+                            num_blank,
+                            TOP_UNKNOWN,
+                            init_life,
+                            life_me,
+                            life_opponent,
+                            tuple(x + y for x, y in zip(items_me, new_items_me)),
+                            tuple(x + y for x, y in zip(items_opponent, new_items_opponent)),
+                            is_opponent_handcuffed,
+                            is_shotgun_sawed,
+                        )
+                        probability = chamber_probability * refill_probability * probability_me * probability_opponent
+                        if is_magnified:
+                            value += probability * self.__reveal(next_state, get_value)
+                        else:
+                            value += probability * get_value(next_state)
+
+        self.__reload_values[(state, is_magnified)] = value
+        return value
+
+    def __reveal(self, state: SolverState, get_value) -> float:
+        num_live, num_blank = state[0], state[1]
+        value = 0.0
+        for is_live, probability in self.__get_top_outcomes(num_live, num_blank, TOP_UNKNOWN):
+            top = TOP_LIVE if is_live else TOP_BLANK
+            value += probability * get_value(state[:2] + (top,) + state[3:])
+        return value
+
+    def __get_top_outcomes(self, num_live: int, num_blank: int, top: int) -> list[tuple[bool, float]]:
+        if top == TOP_LIVE:
+            return [(True, 1.0)]
+        if top == TOP_BLANK:
+            return [(False, 1.0)]
+
+        num_shells = num_live + num_blank
+        outcomes = list()
+        if num_live > 0:
+            outcomes.append((True, num_live / num_shells))
+        if num_blank > 0:
+            outcomes.append((False, num_blank / num_shells))
+        return outcomes
+
+    def __swap(self, state: SolverState) -> SolverState:
+        num_live, num_blank, top, init_life, life_me, life_opponent, items_me, items_opponent, is_opponent_handcuffed, is_shotgun_sawed = state
+        return (num_live, num_blank, top, init_life, life_opponent, life_me, items_opponent, items_me, is_opponent_handcuffed, is_shotgun_sawed)
+
+    def __get_refill_distribution(self, items: tuple[int, ...], num_items: int) -> tuple[tuple[tuple[int, ...], float], ...]:
+        max_new_items = self.config.max_items_per_board - sum(items)
+        return self.__item_board_initializer.get_refill_distribution(num_items, max_new_items)
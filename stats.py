@@ -0,0 +1,17 @@
+import math
+import statistics
+
+def get_wilson_interval(successes: float, trials: int, confidence: float = 0.95) -> tuple[float, float]:
+    '''
+    Wilson score interval of a success rate; (0, 1) without trials.
+    '''
+
+    if trials == 0:
+        return 0.0, 1.0
+
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    center = (rate + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials)) / denominator
+    return center - margin, center + margin
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import sys
+import mmap
+import struct
+import bisect
+
+from collections.abc import Iterable, Sequence
+
+from bugshot import (
+    BugShotAction,
+    BugShotGameConfig,
+)
+
+ACTIONS = list(BugShotAction)
+
+MAGIC = b'BSPT'
+VERSION = 1
+# magic, version, observation size, number of records
+HEADER = struct.Struct('<4sHHQ')
+
+class BugShotPolicyTable(Sequence):
+    '''
+    Read-only observation -> action table in a memory-mapped file.
+
+    The file is a header followed by fixed-size records sorted by key. A key
+    is the observation with one byte per entry, and each record ends with the
+    index of its action in BugShotAction. lookup() is a binary search over
+    the mapped records, so nothing but the header is read up front.
+    '''
+
+    path: str
+    observation_size: int
+    record_size: int
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.__mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, observation_size, num_records = HEADER.unpack_from(self.__mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a policy table.')
+
+        self.observation_size = observation_size
+        self.record_size = observation_size + 1
+        self.__num_records = num_records
+
+    def __len__(self) -> int:
+        return self.__num_records
+
+    def __getitem__(self, index: int) -> bytes:
+        '''
+        Returns the key of the index-th record.
+        '''
+
+        if index < 0 or index >= self.__num_records:
+            raise IndexError('Record index out of range')
+        offset = HEADER.size + index * self.record_size
+        return self.__mm[offset:offset+self.observation_size]
+
+    def lookup(self, observation: list[int]) -> BugShotAction:
+        '''
+        Returns the action of observation, or None if it is not in the table.
+        '''
+
+        key = BugShotPolicyTable.encode_observation(observation)
+        index = bisect.bisect_left(self, key)
+        if index == self.__num_records or self[index] != key:
+            return None
+        return ACTIONS[self.__mm[HEADER.size + index * self.record_size + self.observation_size]]
+
+    def close(self):
+        self.__mm.close()
+
+    def __enter__(self) -> 'BugShotPolicyTable':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def encode_observation(observation: list[int]) -> bytes:
+        return bytes(observation)
+
+    @staticmethod
+    def write(path: str, policy: dict[bytes, BugShotAction]):
+        observation_sizes = {len(key) for key in policy}
+        if len(observation_sizes) > 1:
+            raise ValueError('Observations of a policy table should have the same size.')
+        observation_size = observation_sizes.pop() if observation_sizes else 0
+
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, observation_size, len(policy)))
+            for key in sorted(policy):
+                f.write(key)
+                f.write(bytes([ACTIONS.index(policy[key])]))
+
+    @staticmethod
+    def build(path: str, agent, observations: Iterable[list[int]]):
+        '''
+        Asks agent (a BugShotGameAgent) for the action of every observation and writes the table.
+        '''
+
+        policy = dict()
+        for observation in observations:
+            key = BugShotPolicyTable.encode_observation(observation)
+            if key not in policy:
+                policy[key] = agent.act(observation)
+        BugShotPolicyTable.write(path, policy)
+
+def main():
+    from solver import BugShotGameSolver
+    from agent import SolverBugShotGameAgent
+
+    if len(sys.argv) < 2:
+        print(f'Usage: {sys.argv[0]} <output path>')
+        sys.exit(1)
+
+    config = BugShotGameConfig(
+        min_items_per_init=1,
+        max_items_per_init=1,
+        max_items_per_board=2,
+        min_shell=2,
+        max_shell=4,
+        min_initial_life=1,
+        max_initial_life=2,
+    )
+
+    solver = BugShotGameSolver(config)
+    solver.solve_game()
+    observations = solver.get_observations()
+
+    BugShotPolicyTable.build(sys.argv[1], SolverBugShotGameAgent(solver), observations)
+    print(f'Wrote {len(observations)} observations to {sys.argv[1]}')
+
+if __name__ == '__main__':
+    main()
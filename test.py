@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-from tqdm import tqdm
 import sys
 
 from bugshot import (
@@ -11,6 +10,7 @@ from bugshot import (
 from agent import BugShotGameAgent, RandomBugShotGameAgent, MonteCarloBugShotGameAgent
 from decoder import CombinationBugShotStateDecoder
 from explorer import RandomBugShotStateExplorer
+from tournament import BugShotTournament
 
 class BugShotGameTester:
 
@@ -58,14 +58,21 @@ class BugShotGameTester:
 
         return None
 
-def evaluate_agent(tester: BugShotGameTester, num_trials: int = 1000) -> float:
-    num_wins = 0
-    for _ in tqdm(range(num_trials)):
-        winner = tester.test(verbose=False)
-        if winner == BugShotPlayer.PLAYER1:
-            num_wins += 1
-    
-    return num_wins / num_trials
+def evaluate_agent(tester: BugShotGameTester, num_trials: int = 1000, early_stopping: bool = False) -> float:
+    '''
+    Plays agent1 against agent2 over both seats on a process pool and returns the win rate of agent1.
+    '''
+
+    tournament = BugShotTournament(
+        config=tester.config,
+        agents={'agent1': tester.agent1, 'agent2': tester.agent2},
+        num_games=num_trials,
+        max_steps=tester.max_steps,
+        early_stopping=early_stopping,
+    )
+    result = tournament.run()
+    print(result.describe())
+    return result.matches[0].get_score()
 
 def main():
     config = BugShotGameConfig(
@@ -102,7 +109,7 @@ def main():
         winner = tester.test(verbose=True)
         print(f'Winner: {winner}')
     else:
-        win_rate = evaluate_agent(tester, num_trials=1000)
+        win_rate = evaluate_agent(tester, num_trials=num_trials)
         print(f'Win rate: {win_rate}')
 
 if __name__ == '__main__':
@@ -0,0 +1,286 @@
+import os
+import math
+import time
+import random
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+
+from bugshot import (
+    BugShotGameBuilder,
+    BugShotGameConfig,
+    BugShotPlayer,
+    reseed_rngs,
+)
+from agent import BugShotGameAgent
+from stats import get_wilson_interval
+
+class BugShotMatchResult:
+    '''
+    Games between two agents, counted from agent1's side over both seats.
+    '''
+
+    agent1: str
+    agent2: str
+    wins: int
+    losses: int
+    draws: int
+
+    def __init__(self, agent1: str, agent2: str):
+        self.agent1 = agent1
+        self.agent2 = agent2
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+
+    def get_num_games(self) -> int:
+        return self.wins + self.losses + self.draws
+
+    def get_score(self) -> float:
+        '''
+        Win rate of agent1, counting draws as half a win.
+        '''
+
+        num_games = self.get_num_games()
+        if num_games == 0:
+            return 0.5
+        return (self.wins + 0.5 * self.draws) / num_games
+
+    def get_confidence_interval(self, confidence: float = 0.95) -> tuple[float, float]:
+        '''
+        Wilson score interval of get_score().
+        '''
+
+        return get_wilson_interval(self.wins + 0.5 * self.draws, self.get_num_games(), confidence)
+
+    def is_decided(self, confidence: float = 0.95) -> bool:
+        low, high = self.get_confidence_interval(confidence)
+        return low > 0.5 or high < 0.5
+
+class BugShotTournamentResult:
+
+    matches: list[BugShotMatchResult]
+    elo: dict[str, float]
+    num_games: int
+    elapsed: float
+    confidence: float
+
+    def __init__(self, matches: list[BugShotMatchResult], elo: dict[str, float], elapsed: float, confidence: float):
+        self.matches = matches
+        self.elo = elo
+        self.num_games = sum(match.get_num_games() for match in matches)
+        self.elapsed = elapsed
+        self.confidence = confidence
+
+    def get_games_per_second(self) -> float:
+        return self.num_games / self.elapsed if self.elapsed > 0 else 0.0
+
+    def describe(self) -> str:
+        lines = list()
+        for match in self.matches:
+            low, high = match.get_confidence_interval(self.confidence)
+            lines.append(
+                f'{match.agent1} vs {match.agent2}: {match.get_score():.3f} '
+                f'[{low:.3f}, {high:.3f}] '
+                f'({match.wins}W {match.losses}L {match.draws}D)'
+            )
+        lines.append('Elo:')
+        for name, rating in sorted(self.elo.items(), key=lambda item: -item[1]):
+            lines.append(f'  {name}: {rating:.0f}')
+        lines.append(f'{self.num_games} games in {self.elapsed:.1f}s ({self.get_games_per_second():.1f} games/s)')
+        return '\n'.join(lines)
+
+class BugShotTournament:
+    '''
+    Round-robin matches between agents, played in batches on a process pool.
+
+    Every batch alternates seats from game to game and starts from the
+    other seat than the batch before, so both agents play each seat equally
+    often, give or take one game. With early_stopping, a match stops getting
+    new batches once it has min_games games and the confidence interval of
+    its score excludes 0.5. Every batch reseeds each agent and builds its
+    games from a seed derived from (seed, match, batch), so a tournament is
+    reproducible. Agents are reset before every game.
+    '''
+
+    config: BugShotGameConfig
+    agents: dict[str, BugShotGameAgent]
+    num_games: int
+    batch_size: int
+    num_workers: int
+    seed: int
+    max_steps: int
+    confidence: float
+    early_stopping: bool
+    min_games: int
+
+    def __init__(
+            self,
+            config: BugShotGameConfig,
+            agents: dict[str, BugShotGameAgent],
+            num_games: int = 1000,
+            batch_size: int = 50,
+            num_workers: int = None,
+            seed: int = 0,
+            max_steps: int = 1000,
+            confidence: float = 0.95,
+            early_stopping: bool = False,
+            min_games: int = 100,
+        ):
+
+        if len(agents) < 2:
+            raise ValueError('A tournament needs at least two agents.')
+
+        self.config = config
+        self.agents = agents
+        self.num_games = num_games
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.seed = seed
+        self.max_steps = max_steps
+        self.confidence = confidence
+        self.early_stopping = early_stopping
+        self.min_games = min_games
+
+    def run(self) -> BugShotTournamentResult:
+        matches = [
+            BugShotMatchResult(agent1, agent2)
+            for agent1, agent2 in itertools.combinations(self.agents, 2)
+        ]
+        num_scheduled = [0] * len(matches)
+        num_batches = [0] * len(matches)
+        is_stopped = [False] * len(matches)
+        pending: dict[Future, int] = dict()
+
+        num_workers = self.num_workers or os.cpu_count() or 1
+        max_pending = 2 * num_workers
+
+        started = time.monotonic()
+        with ProcessPoolExecutor(
+                max_workers=num_workers,
+                initializer=_init_worker,
+                initargs=(self.config, self.agents, self.max_steps),
+            ) as executor:
+
+            while True:
+                for i in itertools.cycle(range(len(matches))):
+                    if len(pending) >= max_pending:
+                        break
+                    if not any(not is_stopped[j] and num_scheduled[j] < self.num_games for j in range(len(matches))):
+                        break
+                    if is_stopped[i] or num_scheduled[i] >= self.num_games:
+                        continue
+
+                    num_games = min(self.batch_size, self.num_games - num_scheduled[i])
+                    batch_seed = f'{self.seed}:{i}:{num_batches[i]}'
+                    is_swapped = num_batches[i] % 2 == 1
+                    future = executor.submit(_play_batch, matches[i].agent1, matches[i].agent2, is_swapped, num_games, batch_seed)
+                    pending[future] = i
+                    num_scheduled[i] += num_games
+                    num_batches[i] += 1
+
+                if len(pending) == 0:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    wins, losses, draws = future.result()
+                    matches[i].wins += wins
+                    matches[i].losses += losses
+                    matches[i].draws += draws
+
+                    if self.early_stopping and matches[i].get_num_games() >= self.min_games and matches[i].is_decided(self.confidence):
+                        is_stopped[i] = True
+
+        elapsed = time.monotonic() - started
+        return BugShotTournamentResult(
+            matches=matches,
+            elo=get_elo_ratings(list(self.agents), matches),
+            elapsed=elapsed,
+            confidence=self.confidence,
+        )
+
+def get_elo_ratings(agents: list[str], matches: list[BugShotMatchResult], num_iterations: int = 1000) -> dict[str, float]:
+    '''
+    Bradley-Terry ratings fitted by minorization-maximization, on the Elo
+    scale with a mean of 1500. Every match gets half a win for each side so
+    that unbeaten agents keep a finite rating.
+    '''
+
+    wins = {agent: 0.0 for agent in agents}
+    num_games: dict[tuple[str, str], float] = dict()
+    for match in matches:
+        if match.get_num_games() == 0:
+            continue
+        wins[match.agent1] += match.wins + 0.5 * match.draws + 0.5
+        wins[match.agent2] += match.losses + 0.5 * match.draws + 0.5
+        num_games[(match.agent1, match.agent2)] = match.get_num_games() + 1
+        num_games[(match.agent2, match.agent1)] = match.get_num_games() + 1
+
+    strengths = {agent: 1.0 for agent in agents}
+    for _ in range(num_iterations):
+        next_strengths = dict()
+        for agent in agents:
+            denominator = sum(
+                n / (strengths[agent] + strengths[opponent])
+                for (player, opponent), n in num_games.items()
+                if player == agent
+            )
+            next_strengths[agent] = wins[agent] / denominator if denominator > 0 else strengths[agent]
+
+        mean_log = sum(math.log(strength) for strength in next_strengths.values()) / len(agents)
+        strengths = {agent: strength / math.exp(mean_log) for agent, strength in next_strengths.items()}
+
+    return {
+        agent: 1500 + 400 * math.log10(strength)
+        for agent, strength in strengths.items()
+    }
+
+_worker_config: BugShotGameConfig = None
+_worker_agents: dict[str, BugShotGameAgent] = None
+_worker_max_steps: int = None
+
+def _init_worker(config: BugShotGameConfig, agents: dict[str, BugShotGameAgent], max_steps: int):
+    global _worker_config, _worker_agents, _worker_max_steps
+    _worker_config = config
+    _worker_agents = agents
+    _worker_max_steps = max_steps
+
+def _play_batch(agent1: str, agent2: str, is_swapped: bool, num_games: int, seed: str) -> tuple[int, int, int]:
+    '''
+    Plays num_games games with alternating seats, agent1 as PLAYER2 in the
+    first one if is_swapped, and counts them from agent1's side.
+    '''
+
+    for name, agent in _worker_agents.items():
+        reseed_rngs(agent, f'{seed}:{name}', reseed_default=True)
+    game_seeds = random.Random(seed)
+    game_builder = BugShotGameBuilder()
+
+    wins, losses, draws = 0, 0, 0
+    for i in range(num_games):
+        is_game_swapped = is_swapped != (i % 2 == 1)
+        players = {
+            BugShotPlayer.PLAYER1: _worker_agents[agent2 if is_game_swapped else agent1],
+            BugShotPlayer.PLAYER2: _worker_agents[agent1 if is_game_swapped else agent2],
+        }
+        agent1_player = BugShotPlayer.PLAYER2 if is_game_swapped else BugShotPlayer.PLAYER1
+        for agent in players.values():
+            agent.reset()
+
+        game = game_builder.build(config=_worker_config, seed=game_seeds.getrandbits(64))
+        for _ in range(_worker_max_steps):
+            if game.get_winner() is not None:
+                break
+            game.do_action(players[game.get_turn()].act(game.observe()))
+
+        winner = game.get_winner()
+        if winner is None:
+            draws += 1
+        elif winner == agent1_player:
+            wins += 1
+        else:
+            losses += 1
+
+    return wins, losses, draws